@@ -18,9 +18,19 @@ setup(name="zyrup",
           'requests ==1.2.3',
           'gevent ==1.0.1',
       ],
+      extras_require={
+          'columnar': ['pyarrow'],
+      },
       data_files=[('config/zyrup', glob.glob('conf/zyrup/*'))],
       packages=find_packages('src'),
       package_dir={'': 'src'},
+      package_data={'zuora_python_toolkit': ['wsdl/*.wsdl']},
+      entry_points={
+          'console_scripts': [
+              'zuora-compile-wsdl = zuora_python_toolkit.schema:main',
+              'zuora-benchmark = zuora_python_toolkit.benchmark:main',
+          ],
+      },
       tests_require=['nose', 'mock'],
       classifiers=[
           'Programming Language :: Python',
@@ -1,4 +1,3 @@
 # zuora/__init__.py
-from pkg_resources import get_distribution
 
 #__version__ = get_distribution('zuora_python_toolkit').version
\ No newline at end of file
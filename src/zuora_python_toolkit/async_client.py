@@ -0,0 +1,100 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import logging
+
+import gevent
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.transport import DEFAULT_POOL_SIZE, CooperativeTransport
+from zuora_python_toolkit.util import query_records
+
+logger = logging.getLogger(__package__)
+
+
+class AsyncZuora(object):
+    """
+    A non-blocking Zuora client.
+
+    Every call returns at once with a gevent Greenlet, which works as a future: use get() to
+    wait for the result, link() to be called back, or gevent.joinall() to wait for several.
+    Calls go through a CooperativeTransport on gevent sockets, so they run concurrently
+    without monkey patching the socket module.
+
+    The wrapped (blocking) client is available as `zuora`.
+    """
+
+    def __init__(self, zuora=None, **kwargs):
+        """
+        :param zuora: Zuora client to wrap, otherwise one is created from kwargs (see Zuora)
+        """
+        if zuora is None:
+            kwargs.setdefault('transport', CooperativeTransport(pool_size=kwargs.get('pool_size', DEFAULT_POOL_SIZE)))
+            zuora = Zuora(**kwargs)
+        self.zuora = zuora
+
+    def spawn(self, f, *args, **kwargs):
+        return gevent.spawn(f, *args, **kwargs)
+
+    def login(self):
+        return self.spawn(self.zuora.login)
+
+    def query(self, query_string=None):
+        return self.spawn(self.zuora.query, query_string)
+
+    def query_more(self, query_locator):
+        return self.spawn(self.zuora.query_more, query_locator)
+
+    def retrieve(self, z_object_type=None, field_list=[], id_list=[]):
+        return self.spawn(self.zuora.retrieve, z_object_type, field_list, id_list)
+
+    def subscribe(self, z_objects):
+        return self.spawn(self.zuora.subscribe, z_objects)
+
+    def create(self, z_objects):
+        return self.spawn(self.zuora.create, z_objects)
+
+    def update(self, z_objects):
+        return self.spawn(self.zuora.update, z_objects)
+
+    def delete(self, z_object_type, id_list=[]):
+        return self.spawn(self.zuora.delete, z_object_type, id_list)
+
+    def amend(self, amend_request):
+        return self.spawn(self.zuora.amend, amend_request)
+
+    def generate_object(self, object_type):
+        return self.zuora.generate_object(object_type)
+
+    def iter_pages(self, query_string=None):
+        """
+        Yields a future for each page of a query, following queryMore.  The next page is
+        requested as soon as the previous one arrives, so it downloads while the caller
+        works on the current page.  A page requested but not yet yielded is killed if the
+        caller stops early.
+
+        :param query_string: ZOQL query
+        :return: generator of Greenlets whose value is a QueryResult
+        """
+        page = self.query(query_string)
+        following = None
+        try:
+            while True:
+                result = page.get()
+                following = None
+                if not result.done:
+                    following = self.query_more(result.queryLocator)
+                yield page
+                if following is None:
+                    break
+                page = following
+        finally:
+            if following is not None:
+                following.kill(block=False)
+
+    def iter_records(self, query_string=None):
+        """
+        Yields the records of a query one at a time, see iter_pages.
+        """
+        for page in self.iter_pages(query_string):
+            for record in query_records(page.get()):
+                yield record
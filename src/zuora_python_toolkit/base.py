@@ -1,15 +1,31 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
 from os import path
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
+import re
 import gevent
-
-from suds.client import Client
-from suds.cache import FileCache
-from suds.xsd.doctor import Import, ImportDoctor
-
-from zuora_python_toolkit.util import ZuoraError, generate_select_list, generate_search_conditions
+from gevent.lock import Semaphore
+from gevent.pool import Pool
+from gevent.queue import Queue
+
+from zuora_python_toolkit.batch import AdaptiveBatchSize, BatchExecutor, BatchResults
+from zuora_python_toolkit.cache import SUBSCRIPTION_OBJECTS, RecordCache, query_object
+from zuora_python_toolkit.fastsoap import FAST_OPERATIONS, FastService, Record, SoapCodec, record_type
+from zuora_python_toolkit.governor import Governor
+from zuora_python_toolkit.lazy import lazy_import
+from zuora_python_toolkit.metrics import NULL
+from zuora_python_toolkit.records import RowFactory, select_fields
+from zuora_python_toolkit.retry import IDEMPOTENT_OPERATIONS, RetryPolicy
+from zuora_python_toolkit.session import SessionManager
+from zuora_python_toolkit.util import ZuoraError, fault_code, generate_select_list, generate_search_conditions, \
+    query_records, shard_values, split_window, time_windows, unique, window_query, wsdl_url
+
+# Imported when the first client is built
+suds = lazy_import('suds')
+suds_client = lazy_import('suds.client')
+schema = lazy_import('zuora_python_toolkit.schema')
+transports = lazy_import('zuora_python_toolkit.transport')
 
 logger = logging.getLogger(__package__)
 
@@ -18,6 +34,9 @@ def session_required(fn):
     """
     Decorator for functions that require a valid Zuora Session
 
+    If Zuora rejects the session with an INVALID_SESSION fault the session is renewed
+    and the function retried once (see Zuora.renew_session).
+
     :param function:
     :return:
     """
@@ -31,20 +50,53 @@ def session_required(fn):
             except Exception as e:
                 logger.error(e)
                 return False
-        return fn(arg, *args, **kwargs)
+        session_id = arg.get_session_id()
+        try:
+            return fn(arg, *args, **kwargs)
+        except suds.WebFault as e:
+            if fault_code(e) != 'INVALID_SESSION':
+                raise
+            arg.renew_session(session_id)
+            return fn(arg, *args, **kwargs)
     return check_session
 
 
+def call_object(operation, args):
+    """
+    The object type a SOAP call is for, where it can be told from the arguments (for metrics labels)
+    """
+    if not args:
+        return None
+    if operation == 'query':
+        return query_object(args[0])
+    if operation == 'delete':
+        return args[0]
+    if operation in ('create', 'update'):
+        records = args[0]
+        if isinstance(records, (list, tuple)):
+            records = records[0] if records else None
+        return record_type(records) if records is not None else None
+    return None
+
+
 class Zuora(object):
 
-    # The SOAP Client
-    client = None
+    # The SOAP Client, built on first use (see client)
+    __client = None
+    __client_lock = None
+    __transport = None
+    __http_session = None
+    __fast_service = None
 
     # Settings
     __default_batch_min = __batch_min = 8
     __default_batch_max = __batch_max = 50
     __default_query_batch_size_max = __query_batch_size_max = 2000  # Batch size for query or queryMore.
-    __batch_objects = ['create', 'update', 'delete', 'amend']  # Todo: Test amend
+    __default_batch_concurrency = __batch_concurrency = 5  # Batches sent to Zuora at the same time
+    __adaptive_batch_size = True  # Adjust batch sizes between __batch_min and __batch_max
+    __retrieve_shard_size = 200  # Ids per retrieve query
+    __max_search_conditions_length = 10000  # Characters in a retrieve WHERE clause
+    __batch_objects = ['create', 'update', 'delete', 'amend', 'subscribe']  # Todo: Test amend
 
     # Session ID and Endpoint info
     __session_id = None
@@ -52,55 +104,68 @@ class Zuora(object):
     __session_length_millis = 600000
     __endpoint = None
     __session_header = None
+    __session_manager = None
+
+    # Request limits
+    __governor = None
+    __governor_options = {}
     
     def __init__(self, **kwargs):
         """
         Connect to Zuora
 
         'wsdl' : Location of WSDL
-        'cacheDuration' : Duration of HTTP GET cache in seconds, or 0 for no cache
+        'schema_cache' : Directory for compiled WSDL schemas, True for the default directory or False for none
+        'cache_duration' : Seconds before a compiled schema is rebuilt, or 0 to keep it until the WSDL changes
         'username' : Username for HTTP auth when using a proxy ONLY
         'password' : Password for HTTP auth when using a proxy ONLY
+        'transport' : suds Transport for SOAP calls, defaults to a PooledTransport (gevent-cooperative)
+        'pool_size' : Keep-alive connections kept per host by the default PooledTransport
+        'max_concurrency' : Most SOAP calls in flight at once, shared by clients with the same credentials
+        'rate_limit' : Most SOAP calls started per second, shared by clients with the same credentials
+        'batch_size' : Records per create/update/delete/amend call, or a (min, max) tuple
+        'adaptive_batch_size' : Adjust the batch size between min and max from call latency and faults
+        'fast_soap' : Send query, queryMore, create, update and delete through the fast SoapCodec
+        'cache' : RecordCache for retrieve and query results, or True for a default RecordCache
+        'instrumentation' : metrics.Instrumentation for timings and counts, e.g. a MetricsRegistry
+        'retry' : retry.RetryPolicy for create/update/delete/amend calls that fail for transient reasons,
+                  or None to send them once (defaults to a RetryPolicy)
+        'suds_client' : Parsed suds Client to clone instead of parsing the WSDL again (see pool.ClientPool)
+
+        The WSDL is only parsed when the SOAP client is first needed, see warm_up().
         """
-        # Suds can only accept WSDL locations with a protocol prepended
         wsdl = kwargs['wsdl']
         base_dir = path.dirname(__file__)
-        wsdl = 'file:///%s' % path.abspath(base_dir + "/" + wsdl)
-
-        cache_duration = 0
-        if 'cache_duration' in kwargs:
-            cache_duration = kwargs['cache_duration']
-        if cache_duration > 0:
-            cache = FileCache()
-            cache.setduration(seconds=cache_duration)
-        else:
-            cache = None
+        self.wsdl = wsdl_url(path.join(base_dir, wsdl))
+        self.__schema_cache = kwargs.get('schema_cache', True)
+        self.__cache_duration = kwargs.get('cache_duration', 0)
+        self.__prototype = kwargs.get('suds_client')
+        self.__client_lock = Semaphore()
 
-        # Fix missing types with ImportDoctor
-        schema_url = 'http://object.api.zuora_python_toolkit.com/'
-        schema_import = Import(schema_url)
-        schema_doctor = ImportDoctor(schema_import)
+        # Session state belongs to each client
+        self.__session_id = None
+        self.__session_header = None
+        self.__endpoint = None
+        self.__next_login_time = datetime.now()
 
-        self.client = Client(url=wsdl, cache=cache, doctor=schema_doctor)
+        self.instrumentation = kwargs.get('instrumentation') or NULL
 
-        # Set HTTP headers for logging each request
-        headers = {
-            'User-Agent': Zuora.__name__ + '/' + '.'.join(str(x) for x in "1.0.0"),
-            'Content-Type': 'text/xml; charset=utf-8' #Can we do json?
-        }
+        self.__transport_options = {}
+        if 'pool_size' in kwargs:
+            self.__transport_options['pool_size'] = kwargs['pool_size']
+        if kwargs.get('transport') is not None:
+            self.use_transport(kwargs['transport'])
+
+        self.fast_soap = bool(kwargs.get('fast_soap'))
 
-        # This HTTP header will not work until Suds gunzips/inflates the content
-        # 'Accept-Encoding': 'gzip, deflate'
-        self.client.set_options(headers=headers)
-        if cache is None:
-            self.client.set_options(cache=None)
+        self.cache = kwargs.get('cache')
+        if self.cache is True:
+            self.cache = RecordCache()
 
         if 'username' in kwargs:
-            self.client.set_options(username=kwargs['username'])
             self.username = kwargs['username']
 
         if 'password' in kwargs:
-            self.client.set_options(password=kwargs['password'])
             self.password = kwargs['password']
 
         if 'session_length_millis' in kwargs:
@@ -112,110 +177,509 @@ class Zuora(object):
         if 'batch_size' in kwargs:
             self.set_batch_size(kwargs['batch_size'])
 
-    def query(self, query_string=None):
+        if 'batch_concurrency' in kwargs:
+            self.set_batch_concurrency(kwargs['batch_concurrency'])
+
+        self.retry = kwargs.get('retry', RetryPolicy())
+
+        self.__batch_sizers = {}
+        if 'adaptive_batch_size' in kwargs:
+            self.__adaptive_batch_size = kwargs['adaptive_batch_size']
+
+        # The first client for a set of credentials decides the limits
+        self.__governor_options = {}
+        if 'max_concurrency' in kwargs:
+            self.__governor_options['max_concurrency'] = kwargs['max_concurrency']
+        if 'rate_limit' in kwargs:
+            self.__governor_options['rate'] = kwargs['rate_limit']
+
+        if 'retrieve_shard_size' in kwargs:
+            self.set_retrieve_shard_size(kwargs['retrieve_shard_size'])
+
+    def query(self, query_string=None, use_cache=True):
         """
         Executes the query specified and returns data that matches the criteria.
 
         Use query_batch_size to change the batch size.  Defaulted to 2000.
 
+        With a cache, results that fit in one page are cached by query until they expire or the
+        object is changed through this client.
+
         :param query_string:
+        :param use_cache: False to always ask Zuora
         :return:
         """
-        return self.call(self.client.service.query, query_string)
+        if self.cache is None or not use_cache:
+            return self.call(self.operation('query'), query_string)
+        z_object = query_object(query_string)
+        result = self.cache.get_query(z_object, query_string)
+        if result is None:
+            result = self.call(self.operation('query'), query_string)
+            if getattr(result, 'done', False):
+                self.cache.put_query(z_object, query_string, result)
+        return result
 
     def query_more(self, query_locator):
         """
         Retrieves the next batch of objects from a query.
         """
-        return self.call(self.client.service.queryMore, query_locator)
+        return self.call(self.operation('queryMore'), query_locator)
 
-    def retrieve(self, z_object_type=None, field_list=[], id_list=[]):
+    def iter_pages(self, query_string=None, prefetch=True, compact=False, journal=None):
         """
-        Retrieves one or more objects based on the specified object ID(s).
+        Executes the query specified and yields its pages, following the queryLocator with
+        queryMore until Zuora reports the query is done.
+
+        With a journal (see journal.JournalSection) the queryLocator of the next page is recorded
+        once a page has been consumed, and the same query made again continues from there (or
+        yields nothing once it is done).  Zuora only keeps a queryLocator for a while, so a query
+        whose locator has expired is started over.
+
+        :param query_string: ZOQL query
+        :param prefetch: Request the next page in the background while the current page is consumed
+        :param compact: Yield Pages of Rows (tuples sharing the query's field names, see records)
+                        instead of QueryResults
+        :param journal: JournalSection recording the progress of the query
+        :return: generator of QueryResults or Pages
+        """
+        factory = RowFactory(select_fields(query_string)) if compact else None
+        result = self.resume_query(query_string, journal) if journal is not None else self.query(query_string)
+        if result is None:
+            return
+        pending = None
+        try:
+            while True:
+                if not result.done:
+                    if prefetch:
+                        pending = gevent.spawn(self.query_more, result.queryLocator)
+                    else:
+                        pending = None
+                yield factory.page(query_records(result)) if compact else result
+                if journal is not None:
+                    journal.put('locator', (query_string, None if result.done else result.queryLocator))
+                if result.done:
+                    break
+                if pending is not None:
+                    result = pending.get()
+                    pending = None
+                else:
+                    result = self.query_more(result.queryLocator)
+        finally:
+            if pending is not None:
+                pending.kill(block=False)
+
+    def resume_query(self, query_string, journal):
+        """
+        The first page of a journaled query (see iter_pages): the page at the recorded
+        queryLocator, or None if the query is done
+
+        :param journal: JournalSection recording the progress of the query
+        """
+        recorded = journal.get('locator')
+        if recorded is not None:
+            recorded_query, locator = recorded
+            if recorded_query != query_string:
+                logger.warning("Journal %s holds the progress of another query, starting over" % journal.name)
+            elif locator is None:
+                logger.info("Query already done according to journal %s" % journal.name)
+                return None
+            else:
+                logger.info("Resuming query from queryLocator %s" % locator)
+                try:
+                    return self.query_more(locator)
+                except suds.WebFault as e:
+                    logger.warning("queryLocator %s could not be resumed (%s), starting over" %
+                                   (locator, fault_code(e)))
+        return self.query(query_string, use_cache=False)
+
+    def iter_query(self, query_string=None, prefetch=True, compact=False, journal=None):
         """
+        Executes the query specified and yields the records one at a time (see iter_pages).
+
+        Only the current page (and, with prefetch, the next one) is held in memory.
+
+        :param query_string: ZOQL query
+        :param prefetch: Request the next page in the background while the current page is consumed
+        :param compact: Yield Rows instead of suds objects
+        :param journal: JournalSection recording the progress of the query, see iter_pages
+        :return: generator of records
+        """
+        for page in self.iter_pages(query_string, prefetch, compact, journal):
+            for record in query_records(page):
+                yield record
+
+    def iter_queries(self, queries, concurrency=None, key='Id', compact=False):
+        """
+        Runs several queries at once (each following queryMore) and yields their records as
+        one stream, skipping records whose key has already been yielded.
+
+        :param queries: ZOQL queries
+        :param concurrency: Queries running at the same time, defaults to batch_concurrency
+        :param key: Field used to remove duplicates, or None to keep them
+        :param compact: Yield Rows instead of suds objects
+        :return: generator of records
+        """
+        if concurrency is None:
+            concurrency = self.__batch_concurrency
+        queries = list(queries)
+        records = Queue(maxsize=self.__query_batch_size_max)
+        done = object()
+
+        def run(query_string):
+            try:
+                for record in self.iter_query(query_string, prefetch=False, compact=compact):
+                    records.put(record)
+            except Exception as e:
+                records.put(e)
+            records.put(done)
+
+        pool = Pool(concurrency)
+        for query_string in queries:
+            pool.spawn(run, query_string)
+
+        seen = set()
+        remaining = len(queries)
+        try:
+            while remaining:
+                record = records.get()
+                if record is done:
+                    remaining -= 1
+                elif isinstance(record, Exception):
+                    raise record
+                elif key is None:
+                    yield record
+                else:
+                    value = getattr(record, key, None)
+                    if value not in seen:
+                        seen.add(value)
+                        yield record
+        finally:
+            pool.kill(block=False)
+
+    def iter_partitioned(self, query_string, start, end=None, field='CreatedDate', windows=None, window_size=None,
+                         concurrency=None, key=None, compact=False):
+        """
+        Runs a query as one query per time window of field, several at once, and yields their
+        records as one stream (see iter_queries).  A large query is then read concurrency pages
+        at a time instead of one queryMore after another.
+
+        The windows split the time from start to end and do not overlap; the first also takes
+        everything before start and the last everything after end, so no record is left out.
+        With windows the time is split evenly, otherwise it starts as concurrency windows which
+        are halved while a probe query finds more than window_size records in them (the windows
+        before start and after end are probed but not split).
+
+        Records that change while the query runs may move to a window already read when
+        partitioning on UpdatedDate, CreatedDate never changes.  Since the windows do not overlap
+        records are not checked for duplicates unless key is given, which keeps every key read in
+        memory; pass key='Id' when partitioning on a field that can change.
+
+        :param query_string: ZOQL query, without OR conditions
+        :param start: datetime of the earliest records
+        :param end: datetime of the latest records, defaults to now
+        :param field: Datetime field the windows are on, such as CreatedDate or UpdatedDate
+        :param windows: Number of windows, or None to size them by probing
+        :param window_size: Most records in a probed window, defaults to 10 pages
+        :param concurrency: Queries running at the same time, defaults to batch_concurrency
+        :param key: Field used to remove duplicates (e.g. 'Id'), or None to keep them
+        :param compact: Yield Rows instead of suds objects
+        :return: generator of records
+        """
+        if concurrency is None:
+            concurrency = self.__batch_concurrency
+        if end is None:
+            end = datetime.now()
+        if windows is not None:
+            bounds = time_windows(start, end, windows)
+        else:
+            window_size = window_size or 10 * self.__query_batch_size_max
+            windows = [(None, start)] + time_windows(start, end, concurrency, bounded=True) + [(end, None)]
+            bounds = self.probe_windows(query_string, field, windows, window_size, concurrency)
+        logger.debug("Querying %s windows of %s" % (len(bounds), field))
+        queries = [window_query(query_string, field, lower, upper) for lower, upper in bounds]
+        return self.iter_queries(queries, concurrency, key, compact)
+
+    def probe_windows(self, query_string, field, windows, window_size, concurrency=None):
+        """
+        Halve the windows of a query (see iter_partitioned) that hold more than window_size
+        records until none does, and drop the bounded ones that hold none.
+
+        Windows are probed concurrently with the query selecting only Id: the size of its
+        QueryResult is the number of records it matches.
+
+        :param windows: list of (lower, upper) datetimes, None for no bound
+        :return: list of (lower, upper) datetimes
+        """
+        if concurrency is None:
+            concurrency = self.__batch_concurrency
+        probe_query = re.sub(r'^\s*SELECT\s+.+?\s+FROM\s', 'SELECT Id FROM ', query_string, flags=re.I | re.S)
+
+        def probe(window):
+            result = self.query(window_query(probe_query, field, *window), use_cache=False)
+            return int(getattr(result, 'size', 0) or 0)
+
+        pool = Pool(concurrency)
+        probed = []
+        while windows:
+            halves = []
+            for window, size in zip(windows, pool.map(probe, windows)):
+                if size > window_size and len(split_window(*window)) > 1:
+                    halves.extend(split_window(*window))
+                elif size > 0 or None in window:
+                    probed.append(window)
+            windows = halves
+        return sorted(probed, key=lambda window: window[0] or datetime.min)
+
+    def iter_retrieve(self, z_object_type=None, field_list=[], id_list=[]):
+        """
+        Retrieves objects by ID and yields them one at a time.
+
+        The ID list is split into shards of at most retrieve_shard_size Ids (and a bounded WHERE
+        clause length), the shard queries run concurrently and duplicates are removed.
+        """
+        self.__check_retrieve(z_object_type, field_list, id_list)
+
+        select_list = generate_select_list(field_list)
+        shards = shard_values(unique(id_list), max_count=self.__retrieve_shard_size,
+                              max_length=self.__max_search_conditions_length)
+        queries = [
+            "SELECT {select_list} FROM {z_object_type} WHERE {search_conditions}".format(
+                select_list=select_list, z_object_type=z_object_type,
+                search_conditions=generate_search_conditions(values=shard))
+            for shard in shards
+        ]
+        logger.info("Retrieving %s %s Ids in %s queries" % (len(id_list), z_object_type, len(queries)))
+        return self.iter_queries(queries)
+
+    def __check_retrieve(self, z_object_type, field_list, id_list):
         if z_object_type is None:
             raise ValueError("z_object_type cannot be Blank")
         if not isinstance(field_list, (list, tuple)):
-            raise NotImplemented("field_list must be a list, if empty only Id will be selected")
+            raise TypeError("field_list must be a list, if empty only Id will be selected")
         if not isinstance(id_list, (list, tuple)):
-            raise NotImplemented("id_list must be a list")
-        if id_list is []:
+            raise TypeError("id_list must be a list")
+        if len(id_list) == 0:
             raise ValueError("id_list cannot be an empty list")
 
+    def retrieve(self, z_object_type=None, field_list=[], id_list=[]):
+        """
+        Retrieves one or more objects based on the specified object ID(s).
+
+        Id lists longer than retrieve_shard_size are sharded (see iter_retrieve) and the records
+        returned together in one QueryResult.  Use iter_retrieve to stream them instead.
+
+        With a cache only the records not cached for the same fields are fetched.
+        """
+        self.__check_retrieve(z_object_type, field_list, id_list)
+
+        if self.cache is None:
+            return self.__retrieve(z_object_type, field_list, id_list)
+
+        id_list = [str(record_id) for record_id in unique(id_list)]
+        cached = self.cache.get_records(z_object_type, id_list, field_list)
+        missing = [record_id for record_id in id_list if record_id not in cached]
+        records = [cached[record_id] for record_id in id_list if record_id in cached]
+        if missing:
+            fetched = query_records(self.__retrieve(z_object_type, field_list, missing, use_cache=False))
+            self.cache.put_records(z_object_type, fetched, field_list)
+            records.extend(fetched)
+        logger.debug("Retrieved %s %s records, %s from the cache" % (len(records), z_object_type, len(cached)))
+        return self.query_result(records)
+
+    def __retrieve(self, z_object_type, field_list, id_list, use_cache=True):
+        if len(id_list) > self.__retrieve_shard_size:
+            return self.query_result(list(self.iter_retrieve(z_object_type, field_list, id_list)))
+
         select_list = generate_select_list(field_list)
         search_conditions = generate_search_conditions(values=id_list)
 
         query = "SELECT {select_list} FROM {z_object_type} WHERE {search_conditions}"
         query = query.format(select_list=select_list, z_object_type=z_object_type, search_conditions=search_conditions)
-        return self.query(query)
+        return self.query(query, use_cache=use_cache)
+
+    def query_result(self, records):
+        """
+        A complete QueryResult holding records
+        """
+        if self.fast_soap:
+            result = Record('QueryResult')
+        else:
+            result = self.client.factory.create('QueryResult')
+        result.records = records
+        result.size = len(records)
+        result.done = True
+        result.queryLocator = None
+        return result
+
+    def operation(self, name):
+        """
+        The callable for a SOAP operation: the fast SoapCodec's when fast_soap is on and it
+        handles the operation, otherwise the suds method.
+        """
+        if self.fast_soap and name in FAST_OPERATIONS:
+            return getattr(self.fast_service, name)
+        return getattr(self.client.service, name)
 
     def subscribe(self, z_objects):
-        return self.call(self.client.service.subscribe, z_objects)
+        try:
+            return self.call(self.operation('subscribe'), z_objects)
+        finally:
+            self.invalidate(SUBSCRIPTION_OBJECTS)
 
     def create(self, z_objects):
-        return self.call(self.client.service.create, z_objects)
+        try:
+            return self.call(self.operation('create'), z_objects)
+        finally:
+            self.invalidate_records(z_objects)
 
     def update(self, z_objects):
-        return self.call(self.client.service.update, z_objects)
+        try:
+            return self.call(self.operation('update'), z_objects)
+        finally:
+            self.invalidate_records(z_objects)
 
     def delete(self, z_object_type, id_list=[]):
-        return self.call(self.client.service.delete, z_object_type, id_list)
+        try:
+            return self.call(self.operation('delete'), z_object_type, id_list)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(z_object_type, [str(record_id) for record_id in id_list])
 
     def amend(self, amend_request):
-        return self.call(self.client.service.amend, amend_request)
+        try:
+            return self.call(self.client.service.amend, amend_request)
+        finally:
+            self.invalidate(SUBSCRIPTION_OBJECTS)
+
+    def invalidate(self, z_object_types):
+        """
+        Drop everything cached for these object types
+        """
+        if self.cache is not None:
+            for z_object_type in z_object_types:
+                self.cache.invalidate(z_object_type)
+
+    def invalidate_records(self, z_objects):
+        """
+        Drop the cached copies of created or updated records and the cached queries of their types
+        """
+        if self.cache is None:
+            return
+        if not isinstance(z_objects, (list, tuple)):
+            z_objects = [z_objects]
+        ids = {}
+        for z_object in z_objects:
+            record_id = getattr(z_object, 'Id', None)
+            ids.setdefault(record_type(z_object), []).extend([str(record_id)] if record_id else [])
+        for z_object_type, id_list in ids.items():
+            self.cache.invalidate(z_object_type, id_list)
 
     @session_required
     def call(self, f=None, *args, **kwargs):
 
-        self.set_headers(f.method.name)
-        if f.method.name in self.__batch_objects:
-            z_object_type = None
-            if isinstance(args[0], list) and len(args[0]) > self.__batch_max:
-                z_objects_or_id_list = args[0]
-                return self.__batch()
-            elif len(args) > 1 and isinstance(args[1], list) and len(args[1] > self.__batch_max):
-                z_object_type = args[0]
-                z_objects_or_id_list = args[1]
-                return self.__batch()
-        results = f(*args, **kwargs)
+        governed = self.governor.governed(self.with_headers(f))
+        if not self.instrumentation.enabled:
+            return self.__send(governed, *args, **kwargs)
+
+        operation = f.method.name
+        z_object = call_object(operation, args)
+        with self.instrumentation.timer('call', operation=operation, z_object=z_object):
+            try:
+                results = self.__send(governed, *args, **kwargs)
+            except suds.WebFault as e:
+                self.instrumentation.increment('faults', operation=operation, z_object=z_object, code=fault_code(e))
+                raise
+        if operation in ('query', 'queryMore'):
+            count = len(query_records(results))
+        else:
+            count = len(args[-1]) if args and isinstance(args[-1], (list, tuple)) else 1
+        self.instrumentation.increment('records', count, operation=operation, z_object=z_object)
+        return results
+
+    def __send(self, governed, *args, **kwargs):
+        operation = governed.method.name
+        if operation in self.__batch_objects:
+            if len(args) == 1 and isinstance(args[0], (list, tuple)) and len(args[0]) > self.__batch_max:
+                return self.batch(governed, args[0])
+            elif len(args) > 1 and isinstance(args[1], (list, tuple)) and len(args[1]) > self.__batch_max:
+                return self.batch(governed, args[1], args[0])
+            if self.retry is not None and not kwargs:
+                results = self.retry.call(governed, args, operation in IDEMPOTENT_OPERATIONS, self.instrumentation,
+                                          {'operation': operation})
+                return results[0] if len(results) == 1 else results
+        results = governed(*args, **kwargs)
         if len(results) == 1:
             return results[0]
         return results
 
-        # Batch the call so we can do more than the maximum per call (which is usually 50)
-        def __batch():
-            batches = []
-
-            batch_max = self.__batch_max
-            object_or_id_count = len(z_objects_or_id_list)
+    @session_required
+    def batch_call(self, operation, z_objects_or_id_list, z_object_type=None, journal=None):
+        """
+        Send a create, update, delete, subscribe or amend in batches (see batch), however few
+        records there are.
 
-            self.logger.info("%s items requested for batching (batch size is %s)" % (object_or_id_count, batch_max) )
+        With a journal (see journal.JournalSection) the results of each chunk are recorded as it
+        completes and records that already have results are not sent again, so a call that was
+        interrupted is resumed by making it again with the same records in the same order.
 
-            if z_object_type is not None:
-                for i in xrange(0, object_or_id_count, batch_max):
-                    batches.append(
-                        gevent.spawn(
-                            f(z_object_type, z_objects_or_id_list[i:self.__batch_max+i])
-                        )
-                    )
+        :param operation: e.g. 'update'
+        :param z_object_type: The object type, for delete
+        :return: BatchResults
+        """
+        if len(z_objects_or_id_list) == 0:
+            return BatchResults()
+        governed = self.governor.governed(self.with_headers(self.operation(operation)))
+        prefix_args = (z_object_type,) if operation == 'delete' else ()
+        try:
+            return self.batch(governed, z_objects_or_id_list, *prefix_args, journal=journal)
+        finally:
+            if operation in ('subscribe', 'amend'):
+                self.invalidate(SUBSCRIPTION_OBJECTS)
+            elif operation == 'delete':
+                if self.cache is not None:
+                    self.cache.invalidate(z_object_type, [str(record_id) for record_id in z_objects_or_id_list])
             else:
-                for i in xrange(0, object_or_id_count, batch_max):
-                    batches.append(
-                        gevent.spawn(
-                            f(z_objects_or_id_list[i:self.__batch_max+i])
-                        )
-                    )
+                self.invalidate_records(z_objects_or_id_list)
 
-            self.logger.info("%s items placed into %s batches" % (object_or_id_count, len(batches)) )
-
-            gevent.joinall( batches, timeout=2 )
+    def batch(self, f, z_objects_or_id_list, *prefix_args, **kwargs):
+        """
+        Batch the call so we can do more than the maximum per call (which is usually 50)
 
-            results = [batch.value for batch in batches]
+        The records are split into chunks and sent through a pool of batch_concurrency
+        greenlets, which overlap on the default PooledTransport (a custom transport must not
+        block the process, or the socket module must be monkey patched, for them to overlap).
+        Results come back in the same order as the records, with any records
+        Zuora rejected listed in results.failures.  With a retry policy, chunks and records that
+        failed for transient reasons are sent again (see retry.RetryPolicy).
 
-            self.logger.info("Total results...%s" % len(results))
+        With adaptive_batch_size each chunk holds between the min and max batch size records,
+        adjusted from how earlier calls for the same operation and object type went.
 
-            return results
-        return __batch
+        :param journal: JournalSection recording the results (see batch_call)
+        """
+        logger.info("%s items requested for batching (batch size is %s)" %
+                    (len(z_objects_or_id_list), self.__batch_max))
+        z_object_type = prefix_args[0] if prefix_args else record_type(z_objects_or_id_list[0])
+        sizer = None
+        if self.__adaptive_batch_size:
+            sizer = self.batch_sizer(f.method.name, z_object_type)
+        executor = BatchExecutor(batch_size=self.__batch_max, concurrency=self.__batch_concurrency, sizer=sizer,
+                                 instrumentation=self.instrumentation,
+                                 labels={'operation': f.method.name, 'z_object': z_object_type},
+                                 retry=self.retry, idempotent=f.method.name in IDEMPOTENT_OPERATIONS,
+                                 journal=kwargs.get('journal'))
+        # The chunks are sent from the executor's greenlets, out of reach of session_required
+        return executor.run(self.renewing_session(f), z_objects_or_id_list, *prefix_args)
+
+    def batch_sizer(self, method_name, z_object_type):
+        """
+        The AdaptiveBatchSize for an operation on an object type, e.g. ('update', 'Account')
+        """
+        key = (method_name, z_object_type)
+        sizer = self.__batch_sizers.get(key)
+        if sizer is None:
+            sizer = self.__batch_sizers[key] = AdaptiveBatchSize(self.__batch_min, self.__batch_max)
+        return sizer
 
     # Toolkit-specific methods
     def generate_header(self, z_object_type):
@@ -226,12 +690,19 @@ class Zuora(object):
         try:
             return self.client.factory.create(z_object_type)
         except Exception as e:
-            self.logger.info('There is not a SOAP header of type %s' % z_object_type)
+            logger.info('There is not a SOAP header of type %s' % z_object_type)
 
-    def generate_object(self, object_type):
+    def generate_object(self, object_type, operation=None):
         """
         Generate a Zuora object, such as a Account or Contact
+
+        With fast_soap the object is a Record rather than a suds object, unless it is for an
+        operation that fast_soap does not handle (such as subscribe).
+
+        :param operation: The SOAP operation the object will be sent with, if known
         """
+        if self.fast_soap and (operation is None or operation in FAST_OPERATIONS):
+            return Record(object_type)
         if object_type in ("Contact", "RatePlanCharge"):
             object_type = "{http://object.api.zuora.com/%s}" % object_type
         obj = self.client.factory.create(object_type)
@@ -252,47 +723,241 @@ class Zuora(object):
 
         self.client.set_options(soapheaders=headers)
 
+    def with_headers(self, f):
+        """
+        Wrap f so that the SOAP headers for its operation are set right before each call to it.
+
+        The headers are client options, so they are set after any wait for the Governor (or a
+        retry) and the message is built before the next greenlet switch: concurrent calls on one
+        client each send their own headers.
+        """
+        operation = f.method.name
+
+        def call_with_headers(*args, **kwargs):
+            self.set_headers(operation)
+            return f(*args, **kwargs)
+        call_with_headers.method = f.method
+        return call_with_headers
+
+    def renewing_session(self, f):
+        """
+        Wrap f so that if Zuora rejects the session with an INVALID_SESSION fault the session
+        is renewed and f retried once, like session_required does for calls on the caller's
+        greenlet.
+        """
+        def call_renewing_session(*args, **kwargs):
+            session_id = self.get_session_id()
+            try:
+                return f(*args, **kwargs)
+            except suds.WebFault as e:
+                if fault_code(e) != 'INVALID_SESSION':
+                    raise
+                self.renew_session(session_id)
+                return f(*args, **kwargs)
+        call_renewing_session.method = f.method
+        return call_renewing_session
+
+    def renew_session(self, session_id):
+        """
+        Replace session_id after Zuora rejected it, unless another greenlet already did
+        """
+        logger.info("Session rejected by Zuora, logging in again")
+        self.instrumentation.increment('retries', reason='INVALID_SESSION')
+        if self.get_session_id() == session_id:
+            self.session_manager.invalidate(session_id)
+            self.login()
+
     def set_endpoint(self, endpoint):
         """
         Set the endpoint after when Zuora returns the URL after successful login()
 
         Changes URL to point from test.zuora_python_toolkit.com to something like cs2-api.zuora_python_toolkit.com
         """
+        # Store endpoint, a client built later starts with it
+        self.__endpoint = endpoint
+        if self.__client is not None:
+            self.apply_endpoint(self.__client, endpoint)
+
+    @staticmethod
+    def apply_endpoint(client, endpoint):
         # suds 0.3.7+ supports multiple wsdl services, but breaks setlocation :(
         # see https://fedorahosted.org/suds/ticket/261
         try:
-            self.client.set_options(location=endpoint)
+            client.set_options(location=endpoint)
         except:
-            self.client.wsdl.service.setlocation(endpoint)
+            client.wsdl.service.setlocation(endpoint)
 
-        # Store endpoint
-        self.__endpoint = endpoint
+    @property
+    def client(self):
+        """
+        The suds Client, built (and the WSDL parsed) on first use
+        """
+        if self.__client is None:
+            with self.__client_lock:
+                if self.__client is None:
+                    self.__client = self.build_client()
+        return self.__client
+
+    def build_client(self):
+        """
+        Parse the WSDL (or load it from the schema cache) into a suds Client
+        """
+        with self.instrumentation.timer('build_client'):
+            if self.__schema_cache:
+                location = self.__schema_cache if isinstance(self.__schema_cache, basestring) else None
+                cache = schema.SchemaCache(location, duration=self.__cache_duration)
+            else:
+                cache = None
+
+            transport = self.transport
+            if self.__prototype is not None:
+                # Shares the parsed WSDL, the options are this client's own
+                client = self.__prototype.clone()
+                client.set_options(transport=transport)
+            else:
+                client = suds_client.Client(url=self.wsdl, cache=cache, doctor=schema.schema_doctor(),
+                                            transport=transport)
+
+            # Set HTTP headers for logging each request
+            headers = {
+                'User-Agent': Zuora.__name__ + '/' + '.'.join(str(x) for x in "1.0.0"),
+                'Content-Type': 'text/xml; charset=utf-8' #Can we do json?
+            }
+
+            # Only transports that gunzip/inflate the content (such as PooledTransport) can accept it
+            if isinstance(transport, transports.PooledTransport):
+                headers['Accept-Encoding'] = 'gzip, deflate'
+            client.set_options(headers=headers)
+            if cache is None:
+                client.set_options(cache=None)
+
+            if hasattr(self, 'username'):
+                client.set_options(username=self.username)
+            if hasattr(self, 'password'):
+                client.set_options(password=self.password)
+            if self.__endpoint is not None:
+                self.apply_endpoint(client, self.__endpoint)
+        logger.debug("Built the SOAP client for %s" % self.wsdl)
+        return client
+
+    def use_transport(self, transport):
+        """
+        Send SOAP calls through a suds Transport (before the client is built)
+        """
+        if self.__client is not None:
+            raise ZuoraError("The transport must be set before the SOAP client is built")
+        if hasattr(transport, 'instrumentation'):
+            transport.instrumentation = self.instrumentation
+        self.__transport = transport
+
+    @property
+    def transport(self):
+        """
+        The suds Transport for SOAP calls, a PooledTransport unless one was given
+        """
+        if self.__transport is None:
+            self.use_transport(transports.PooledTransport(**self.__transport_options))
+        return self.__transport
+
+    @property
+    def http_session(self):
+        """
+        The requests Session for plain HTTP calls (such as export downloads), shared with the transport
+        (or one on the shared connection pool)
+        """
+        if self.__http_session is None:
+            self.__http_session = getattr(self.transport, 'session', None) or transports.pooled_session()
+        return self.__http_session
+
+    @property
+    def fast_service(self):
+        """
+        The FastService for fast_soap operations, or None without fast_soap
+        """
+        if self.fast_soap and self.__fast_service is None:
+            self.__fast_service = FastService(self.client, SoapCodec.for_wsdl(self.wsdl), self.instrumentation)
+        return self.__fast_service
+
+    def warm_up(self, login=False):
+        """
+        Build the SOAP client (and with fast_soap the SoapCodec) now instead of on the first call,
+        so that long-lived services pay for parsing the WSDL at start up.
+
+        :param login: Log in to Zuora too
+        :return: self
+        """
+        self.client
+        self.fast_service
+        self.http_session
+        if login:
+            self.login()
+        return self
+
+    @property
+    def governor(self):
+        """
+        The Governor shared by every client with the same WSDL and username
+        """
+        if self.__governor is None:
+            self.__governor = Governor.for_key((self.wsdl, getattr(self, 'username', None)),
+                                               **self.__governor_options)
+        return self.__governor
+
+    @property
+    def session_manager(self):
+        """
+        The SessionManager shared by every client with the same WSDL and credentials
+        """
+        if self.__session_manager is None:
+            self.__session_manager = SessionManager.for_credentials(
+                self.wsdl, getattr(self, 'username', None), getattr(self, 'password', None),
+                login=self.login_to_zuora, session_length_millis=self.__session_length_millis)
+        return self.__session_manager
 
-    # TODO: Move login to it's own class.
     def login(self):
         """
         Login to Zuora and starts a client session.
 
+        The session is shared with other clients using the same credentials: if another client
+        has already replaced this client's session, that session is used instead of logging in.
+
         return LoginResult
         """
-        login_result = self.client.service.login(self.username, self.password)
+        session = self.session_manager.login(stale_session_id=self.__session_id, login=self.login_to_zuora)
+        self.use_session(session)
+        return session.login_result
 
+    def login_to_zuora(self):
+        """
+        Call login on Zuora.  Use login() instead, which shares sessions between clients.
+
+        return LoginResult
+        """
+        with self.instrumentation.timer('login'):
+            return self.client.service.login(self.username, self.password)
+
+    def use_session(self, session):
+        """
+        Point this client at the endpoint and session of a Session
+        """
         # set new endpoint
-        self.set_endpoint(login_result['ServerUrl'])
+        self.set_endpoint(session.server_url)
 
         # set session header
         header = self.generate_header('SessionHeader')
-        header.session = login_result['Session']
+        header.session = session.session_id
         self.set_session_header(header)
-        self.set_session_id(login_result['Session'])
-        self.set_next_login_time(
-            datetime.now() + timedelta(microseconds=self.__session_length_millis * 1000)
-        )
+        self.set_session_id(session.session_id)
+        self.set_next_login_time(session.expires)
 
         self.set_headers()
-        return login_result
 
     def login_required(self):
+        session = self.session_manager.current()
+        if session is not None and session.session_id != self.__session_id:
+            # Another client (or the background refresh) already has a newer session
+            self.use_session(session)
+            return False
         if self.__session_id is None or len(self.__session_id) == 0:
             return True
         else:
@@ -301,11 +966,19 @@ class Zuora(object):
     def connection_alive(self):
         return datetime.now() < self.__next_login_time
 
+    def get_session_id(self):
+        return self.__session_id
+
+    def get_endpoint(self):
+        return self.__endpoint
+
     def set_next_login_time(self, next_login_time):
         self.__next_login_time = next_login_time
 
     def set_session_length_millis(self, session_length_millis):
         self.__session_length_millis = session_length_millis
+        if self.__session_manager is not None:
+            self.__session_manager.session_length_millis = session_length_millis
 
     def set_session_id(self, session_id):
         self.__session_id = session_id
@@ -333,3 +1006,15 @@ class Zuora(object):
             raise ValueError("Min Batch Size must be set between 0 and %s" % self.__default_batch_max)
 
         self.__batch_min = min_batch
+        self.__batch_max = max_batch
+        self.__batch_sizers = {}
+
+    def set_batch_concurrency(self, concurrency):
+        if concurrency < 1:
+            raise ValueError("Batch concurrency must be at least 1")
+        self.__batch_concurrency = concurrency
+
+    def set_retrieve_shard_size(self, size):
+        if size < 1:
+            raise ValueError("Retrieve shard size must be at least 1")
+        self.__retrieve_shard_size = size
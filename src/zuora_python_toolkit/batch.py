@@ -0,0 +1,331 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+import logging
+import socket
+import time
+
+import gevent
+from gevent.pool import Pool
+
+from zuora_python_toolkit.lazy import lazy_import
+from zuora_python_toolkit.metrics import NULL
+from zuora_python_toolkit.util import ZuoraError, fault_code, result_errors, result_succeeded
+
+requests_exceptions = lazy_import('requests.exceptions')
+sudsobject = lazy_import('suds.sudsobject')
+
+logger = logging.getLogger(__package__)
+
+# Fault codes that suggest a smaller batch would succeed
+OVERSIZED_FAULT_CODES = ('MAX_RECORDS_EXCEEDED', 'TRANSACTION_TIMEOUT', 'TRANSACTION_TERMINATED')
+
+
+# A record that Zuora rejected (or that never got an answer because its whole chunk failed)
+BatchFailure = namedtuple('BatchFailure', ['index', 'item', 'errors'])
+
+
+class BatchResults(list):
+    """
+    The merged results of a batched call, in the same order as the records that were sent.
+
+    Records in a chunk that raised have a result of None.  Every record that did not
+    succeed is listed in `failures`.
+    """
+
+    def __init__(self, results=(), failures=()):
+        super(BatchResults, self).__init__(results)
+        self.failures = list(failures)
+
+    @property
+    def success(self):
+        return len(self.failures) == 0
+
+
+def chunk(items, size):
+    """
+    Split items into consecutive slices of at most size items.
+
+    :param items: list or tuple to be split
+    :param size: maximum number of items per slice
+    :return: generator of (offset, slice)
+    """
+    if size < 1:
+        raise ValueError("Batch size must be greater than 0")
+    for offset in xrange(0, len(items), size):
+        yield offset, items[offset:offset + size]
+
+
+def is_oversized_fault(exception):
+    """
+    Did the call fail because the batch was too big or too slow (so a smaller batch may succeed)?
+    """
+    if isinstance(exception, (socket.timeout, requests_exceptions.Timeout)):
+        return True
+    if fault_code(exception) in OVERSIZED_FAULT_CODES:
+        return True
+    return 'timed out' in str(exception).lower()
+
+
+def record_weight(record):
+    """
+    Rough payload size of a record: the number of fields set on it (1 for Ids).
+    """
+    if isinstance(record, (sudsobject.Object, dict)):
+        return max(len(record), 1)
+    return 1
+
+
+class AdaptiveBatchSize(object):
+    """
+    Picks the number of records per call between min_size and max_size.
+
+    Batches grow by `increase` records after each call that finishes within target_seconds and
+    shrink in proportion when a call is slower.  A timeout or an oversized-payload fault halves
+    the size.  The time per field set on a record is tracked, so batches of records with many
+    fields (e.g. InvoiceItem) are kept smaller than batches of small records.
+    """
+
+    def __init__(self, min_size=8, max_size=50, target_seconds=10.0, increase=4, decrease=0.5, smoothing=0.3):
+        if min_size < 1 or max_size < min_size:
+            raise ValueError("Batch sizes must be between 1 and max_size")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.increase = increase
+        self.decrease = decrease
+        self.smoothing = smoothing
+        self.size = max_size
+        self.seconds_per_weight = None
+
+    def next_size(self, upcoming):
+        """
+        Number of records to send in the next call.
+
+        :param upcoming: The next max_size records, used to estimate their payload
+        """
+        size = self.size
+        if self.seconds_per_weight and upcoming:
+            average_weight = float(sum(record_weight(r) for r in upcoming)) / len(upcoming)
+            size = min(size, int(self.target_seconds / (self.seconds_per_weight * average_weight)))
+        return max(self.min_size, min(self.max_size, size))
+
+    def observe(self, records, seconds, exception=None):
+        """
+        Record how a call with these records went.
+        """
+        if exception is not None:
+            if is_oversized_fault(exception):
+                self.size = max(self.min_size, int(self.size * self.decrease))
+                logger.info("Batch of %s failed (%s), batch size now %s" % (len(records), exception, self.size))
+            return
+
+        weight = sum(record_weight(r) for r in records)
+        if weight > 0:
+            sample = seconds / weight
+            if self.seconds_per_weight is None:
+                self.seconds_per_weight = sample
+            else:
+                self.seconds_per_weight += self.smoothing * (sample - self.seconds_per_weight)
+
+        if seconds > self.target_seconds:
+            self.size = max(self.min_size, int(len(records) * self.target_seconds / seconds))
+        else:
+            self.size = min(self.max_size, self.size + self.increase)
+
+
+class BatchExecutor(object):
+    """
+    Sends chunks of records through a bounded pool of greenlets and merges the
+    per-chunk results back into input order.
+
+    With a sizer (see AdaptiveBatchSize) each chunk's size is chosen when it is sent,
+    from how the earlier chunks went; otherwise every chunk has batch_size records.
+
+    With a retry policy (see retry.RetryPolicy) chunks that fail for transient reasons are sent
+    again, and records that Zuora rejected for transient reasons are replayed on their own.
+
+    With a journal (see journal.JournalSection) the results of each chunk are recorded as soon
+    as it completes, and records that already have results are not sent again.
+    """
+
+    def __init__(self, batch_size=50, concurrency=5, sizer=None, instrumentation=NULL, labels=None, retry=None,
+                 idempotent=False, journal=None):
+        """
+        :param instrumentation: metrics.Instrumentation told about each batch
+        :param labels: Labels for the batch metrics, e.g. the operation and object type
+        :param retry: RetryPolicy for failed chunks and records, or None to send everything once
+        :param idempotent: Whether f can safely be applied twice (so chunks that may have been
+                           applied, e.g. after a timeout, can be retried)
+        :param journal: JournalSection recording the results, or None
+        """
+        if concurrency < 1:
+            raise ValueError("Batch concurrency must be greater than 0")
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.sizer = sizer
+        self.instrumentation = instrumentation
+        self.labels = labels or {}
+        self.retry = retry
+        self.idempotent = idempotent
+        self.journal = journal
+
+    def chunks(self, items):
+        if self.sizer is None:
+            for offset, records in chunk(items, self.batch_size):
+                yield offset, records
+            return
+        offset = 0
+        while offset < len(items):
+            size = self.sizer.next_size(items[offset:offset + self.sizer.max_size])
+            yield offset, items[offset:offset + size]
+            offset += size
+
+    def send(self, f, records, *prefix_args):
+        if self.retry is None:
+            return self.__send(f, records, *prefix_args)
+        return self.retry.call(self.__send, (f, records) + prefix_args, self.idempotent, self.instrumentation,
+                               self.labels)
+
+    def send_chunk(self, indexes, f, records, *prefix_args):
+        """
+        Send a chunk and record its results in the journal
+        """
+        results = self.send(f, records, *prefix_args)
+        if self.journal is not None:
+            chunk_results = results if isinstance(results, (list, tuple)) else [results]
+            if len(chunk_results) == len(records):
+                # Records rejected for transient reasons are sent again on resume
+                self.journal.record_results(dict(
+                    (index, result) for index, result in zip(indexes, chunk_results)
+                    if result_succeeded(result) or self.retry is None or
+                    not self.retry.replayable(result_errors(result))))
+        return results
+
+    def __send(self, f, records, *prefix_args):
+        if self.instrumentation.enabled:
+            self.instrumentation.increment('batches', **self.labels)
+            self.instrumentation.increment('batch_records', len(records), **self.labels)
+            with self.instrumentation.timer('batch', **self.labels):
+                return self.__call(f, records, *prefix_args)
+        return self.__call(f, records, *prefix_args)
+
+    def __call(self, f, records, *prefix_args):
+        if self.sizer is None:
+            return f(*(prefix_args + (records,)))
+        start = time.time()
+        try:
+            result = f(*(prefix_args + (records,)))
+        except Exception as e:
+            self.sizer.observe(records, time.time() - start, e)
+            raise
+        self.sizer.observe(records, time.time() - start)
+        return result
+
+    def run(self, f, items, *prefix_args):
+        """
+        Call f once per chunk of items, at most `concurrency` calls at a time.
+
+        :param f: SOAP method (or any callable) that takes *prefix_args followed by a list of records
+        :param items: records or Ids to send
+        :param prefix_args: leading arguments for each call, e.g. the object type for delete
+        :return: BatchResults
+        """
+        recorded = self.journal.results() if self.journal is not None else {}
+        indexes = [i for i in xrange(len(items)) if i not in recorded]
+        if recorded:
+            logger.info("Resuming: %s of %s items already have results" % (len(recorded), len(items)))
+            items, all_items = [items[i] for i in indexes], items
+        results = self.run_once(f, items, *prefix_args, indexes=indexes)
+        attempt = 1
+        while self.retry is not None and attempt < self.retry.max_attempts:
+            replay = [failure for failure in results.failures if self.retry.replayable(failure.errors)]
+            if not replay:
+                break
+            gevent.sleep(self.retry.delay(attempt))
+            attempt += 1
+            logger.info("Replaying %s records rejected for transient reasons (attempt %s of %s)" %
+                        (len(replay), attempt, self.retry.max_attempts))
+            self.instrumentation.increment('replayed_records', len(replay), **self.labels)
+            replayed = self.run_once(f, [failure.item for failure in replay], *prefix_args,
+                                     indexes=[indexes[failure.index] for failure in replay])
+            for failure, result in zip(replay, replayed):
+                results[failure.index] = result
+            replayed_indexes = set(failure.index for failure in replay)
+            failures = [failure for failure in results.failures if failure.index not in replayed_indexes]
+            failures.extend(BatchFailure(replay[failure.index].index, failure.item, failure.errors)
+                            for failure in replayed.failures)
+            results.failures = sorted(failures, key=lambda failure: failure.index)
+        if recorded:
+            results = self.merge_recorded(all_items, indexes, results, recorded)
+        if results.failures:
+            self.instrumentation.increment('batch_failures', len(results.failures), **self.labels)
+        return results
+
+    def merge_recorded(self, items, indexes, sent, recorded):
+        """
+        The results of all items, from the journaled results and those of the items just sent
+
+        :param indexes: The index in items of each item sent
+        """
+        results = BatchResults([None] * len(items))
+        for i, result in recorded.items():
+            results[i] = result
+            if not result_succeeded(result):
+                results.failures.append(BatchFailure(i, items[i], result_errors(result)))
+        for i, result in zip(indexes, sent):
+            results[i] = result
+        results.failures.extend(BatchFailure(indexes[failure.index], failure.item, failure.errors)
+                                for failure in sent.failures)
+        results.failures.sort(key=lambda failure: failure.index)
+        return results
+
+    def run_once(self, f, items, *prefix_args, **kwargs):
+        """
+        Send every chunk once (apart from retries of whole chunks), see run
+
+        :param indexes: The index of each item in the journal (defaults to its position)
+        """
+        indexes = kwargs.get('indexes') or range(len(items))
+        logger.info("%s items to be sent in batches (batch size is %s, concurrency is %s)" %
+                    (len(items), self.sizer.size if self.sizer else self.batch_size, self.concurrency))
+
+        pool = Pool(self.concurrency)
+        chunks = []
+        greenlets = []
+        for offset, records in self.chunks(items):
+            chunks.append((offset, records))
+            greenlets.append(pool.spawn(self.send_chunk, indexes[offset:offset + len(records)], f, records,
+                                        *prefix_args))
+            # Wait for a free greenlet before sizing the next chunk, so it is sized as late as possible
+            pool.wait_available()
+        gevent.joinall(greenlets)
+        logger.info("%s items placed into %s batches" % (len(items), len(chunks)))
+
+        results = BatchResults()
+        for (offset, records), greenlet in zip(chunks, greenlets):
+            if greenlet.successful():
+                self.merge(results, offset, records, greenlet.value)
+            else:
+                logger.error("Batch at offset %s failed: %s" % (offset, greenlet.exception))
+                for i, record in enumerate(records):
+                    results.append(None)
+                    results.failures.append(BatchFailure(offset + i, record, [greenlet.exception]))
+
+        logger.info("Total results...%s (%s failed)" % (len(results), len(results.failures)))
+        return results
+
+    def merge(self, results, offset, records, chunk_results):
+        if chunk_results is None:
+            chunk_results = []
+        elif not isinstance(chunk_results, (list, tuple)):
+            chunk_results = [chunk_results]
+        if len(chunk_results) != len(records):
+            raise ZuoraError("Batch at offset %s returned %s results for %s records" %
+                             (offset, len(chunk_results), len(records)))
+
+        for i, (record, result) in enumerate(zip(records, chunk_results)):
+            results.append(result)
+            if not result_succeeded(result):
+                logger.error("Record %s failed: %s" % (offset + i, result_errors(result)))
+                results.failures.append(BatchFailure(offset + i, record, result_errors(result)))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Offline benchmarks against a MockServer.
+
+Each scenario (query pagination, batched create and update, export polling and download) runs
+with the suds client and with fast_soap, and its records per second and memory are saved as
+JSON so that releases can be compared:
+
+    zuora-benchmark --records 100000 --output results.json
+"""
+from datetime import datetime
+from os import path
+import argparse
+import gc
+import json
+import logging
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from zuora_python_toolkit.export import ZuoraExport
+from zuora_python_toolkit.governor import Governor
+from zuora_python_toolkit.mockserver import DEFAULT_WSDL, MockServer
+from zuora_python_toolkit.session import SessionManager
+
+logger = logging.getLogger(__package__)
+
+SCENARIOS = ('query', 'create', 'update', 'export', 'download')
+
+MODES = ('suds', 'fast_soap')
+
+QUERY_FIELDS = ['Id', 'AccountNumber', 'Name', 'Balance', 'BillCycleDay', 'AutoPay', 'Currency', 'CreatedDate',
+                'UpdatedDate', 'Status']
+
+
+def max_rss_kb():
+    """
+    Peak resident memory of this process so far, in KB
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class Benchmark(object):
+    """
+    Runs scenarios against a running MockServer and collects their results
+    """
+
+    def __init__(self, server, records=10000, batch_size=50, query_batch_size=2000, wsdl=DEFAULT_WSDL):
+        """
+        :param server: Running MockServer
+        :param records: Records created and updated by the create and update scenarios
+        :param batch_size: Records per create/update call
+        :param query_batch_size: Records per query page asked for
+        :param wsdl: WSDL the clients are built from, the same one the server was started with
+        """
+        self.server = server
+        self.wsdl = wsdl
+        self.records = records
+        self.batch_size = batch_size
+        self.query_batch_size = query_batch_size
+        self.results = []
+
+    def client(self, mode):
+        Governor.clear()
+        SessionManager.clear()
+        client = ZuoraExport(wsdl=self.wsdl, username='benchmark', password='benchmark',
+                             fast_soap=(mode == 'fast_soap'), batch_size=self.batch_size,
+                             query_batch_size=self.query_batch_size)
+        client.set_endpoint(self.server.endpoint)
+        client.login()
+        return client
+
+    def measure(self, scenario, mode, f, *args):
+        """
+        Time f (which returns the number of records it handled) and record the result
+        """
+        gc.collect()
+        rss_before = max_rss_kb()
+        start = time.time()
+        count = f(*args)
+        seconds = time.time() - start
+        rss_after = max_rss_kb()
+        result = {
+            'scenario': scenario,
+            'mode': mode,
+            'records': count,
+            'seconds': round(seconds, 4),
+            'records_per_second': round(count / seconds, 1) if seconds > 0 else None,
+            'max_rss_kb': rss_after,
+            'max_rss_growth_kb': rss_after - rss_before,
+        }
+        logger.info("%(scenario)s (%(mode)s): %(records)s records in %(seconds)ss, "
+                    "%(records_per_second)s records/s" % result)
+        self.results.append(result)
+        return result
+
+    def run(self, scenarios=SCENARIOS, modes=MODES):
+        for mode in modes:
+            client = self.client(mode)
+            for scenario in scenarios:
+                self.measure(scenario, mode, getattr(self, 'run_%s' % scenario), client)
+        return self.results
+
+    # Scenarios
+    def run_query(self, client):
+        query = "SELECT %s FROM Account" % ", ".join(QUERY_FIELDS)
+        return sum(1 for record in client.iter_query(query))
+
+    def accounts(self, client, with_ids=False):
+        accounts = []
+        for i in xrange(self.records):
+            account = client.generate_object('Account')
+            if with_ids:
+                account.Id = 'mock%028x' % i
+            account.Name = 'Account %s' % i
+            account.Currency = 'USD'
+            account.BillCycleDay = i % 28 + 1
+            accounts.append(account)
+        return accounts
+
+    def run_create(self, client):
+        return len(client.create(self.accounts(client)))
+
+    def run_update(self, client):
+        return len(client.update(self.accounts(client, with_ids=True)))
+
+    def run_export(self, client):
+        droppath = tempfile.mkdtemp()
+        try:
+            downloaded = client.export_many([{'z_object': 'Account', 'fields': QUERY_FIELDS}],
+                                            droppath=droppath + '/', sleep_seconds=0.01)
+            with open(downloaded['Account']) as f:
+                return sum(1 for line in f) - 1
+        finally:
+            shutil.rmtree(droppath)
+
+    def run_download(self, client):
+        file_id = client.export('Account', QUERY_FIELDS, sleep_seconds=0.01)
+        return sum(1 for row in client.download(file_id, compact=True))
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'started': datetime.utcnow().isoformat() + 'Z',
+    }
+
+
+def run(scenarios=SCENARIOS, modes=MODES, records=10000, page_size=2000, latency=0.0, throttle_every=0,
+        export_rows=100000, batch_size=50, wsdl=DEFAULT_WSDL):
+    """
+    Start a MockServer, run the scenarios and return the report (a JSON-serializable dict)
+
+    :param wsdl: WSDL for the server and the clients, defaults to the sandbox WSDL shipped with the package
+    """
+    options = {
+        'records': records,
+        'page_size': page_size,
+        'latency': latency,
+        'throttle_every': throttle_every,
+        'export_rows': export_rows,
+        'batch_size': batch_size,
+    }
+    with MockServer(wsdl=wsdl, records=records, page_size=page_size, latency=latency, throttle_every=throttle_every,
+                    export_rows=export_rows) as server:
+        benchmark = Benchmark(server, records=records, batch_size=batch_size, query_batch_size=page_size, wsdl=wsdl)
+        results = benchmark.run(scenarios, modes)
+    return {'environment': environment(), 'options': options, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the toolkit against a local mock Zuora server')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                        help='Scenario to run, may be repeated (default all)')
+    parser.add_argument('--mode', action='append', choices=MODES, dest='modes',
+                        help='Client mode to run, may be repeated (default all)')
+    parser.add_argument('--records', type=int, default=10000, help='Records queried, created and updated')
+    parser.add_argument('--page-size', type=int, default=2000, help='Records per query page')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds the server waits per request')
+    parser.add_argument('--throttle-every', type=int, default=0,
+                        help='Answer every nth SOAP call with a throttle fault (default never)')
+    parser.add_argument('--export-rows', type=int, default=100000, help='Rows in each export file')
+    parser.add_argument('--batch-size', type=int, default=50, help='Records per create/update call')
+    parser.add_argument('--wsdl', default=DEFAULT_WSDL, help='WSDL to serve and build the clients from '
+                                                             '(default the sandbox WSDL shipped with the package)')
+    parser.add_argument('--output', default=None, help='JSON file for the results (default stdout)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('suds').setLevel(logging.CRITICAL)
+    report = run(args.scenarios or SCENARIOS, args.modes or MODES, records=args.records, page_size=args.page_size,
+                 latency=args.latency, throttle_every=args.throttle_every, export_rows=args.export_rows,
+                 batch_size=args.batch_size, wsdl=path.abspath(args.wsdl))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print json.dumps(report, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
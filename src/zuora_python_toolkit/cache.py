@@ -0,0 +1,238 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+A read-through cache for retrieve and query.
+
+RecordCache keeps records by (object type, Id, fields) and completed query results by
+(object type, query), each for its object type's TTL, and evicts the least recently used
+entries beyond max_entries.  Clients with a cache invalidate the affected entries on create,
+update, delete, subscribe and amend.  A SqliteBackend shares the cache between processes.
+"""
+from collections import OrderedDict
+import cPickle
+import logging
+import re
+import sqlite3
+import time
+
+from zuora_python_toolkit.fastsoap import Record, record_type
+from zuora_python_toolkit.lazy import lazy_import
+
+sudsobject = lazy_import('suds.sudsobject')
+
+logger = logging.getLogger(__package__)
+
+# Objects subscribe and amend can change
+SUBSCRIPTION_OBJECTS = ('Account', 'Contact', 'Subscription', 'RatePlan', 'RatePlanCharge', 'RatePlanChargeTier',
+                        'Amendment', 'Invoice', 'InvoiceItem', 'Payment', 'InvoicePayment')
+
+# Catalog objects rarely change, so they are kept longer by default.  Exports are polled for
+# their Status, so they are never cached.
+DEFAULT_TTLS = {
+    'Product': 3600,
+    'ProductRatePlan': 3600,
+    'ProductRatePlanCharge': 3600,
+    'ProductRatePlanChargeTier': 3600,
+    'Export': 0,
+}
+
+# The Id part of the key of a cached query
+QUERY = ''
+
+
+def query_object(query_string):
+    """
+    The object a ZOQL query selects from, e.g. Account
+    """
+    match = re.search(r'\sfrom\s+(\w+)', query_string or '', re.IGNORECASE)
+    return match.group(1) if match else None
+
+
+def object_key(z_object):
+    """
+    The name of an object type in cache keys and TTLs.  ZOQL object names are case insensitive,
+    so `FROM account` and Account's create must agree.
+    """
+    return z_object.lower() if z_object else z_object
+
+
+def portable(value):
+    """
+    A copy of a suds object (and the objects in it) as Records, which can be pickled
+    """
+    if isinstance(value, sudsobject.Object):
+        return Record(record_type(value), ((name, portable(v)) for name, v in value))
+    if isinstance(value, list):
+        return [portable(v) for v in value]
+    return value
+
+
+class SqliteBackend(object):
+    """
+    Cache entries in a SQLite file, shared by every process that opens it.
+    """
+
+    def __init__(self, filename, timeout=30):
+        self.connection = sqlite3.connect(filename, timeout=timeout, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS cache (z_object TEXT, id TEXT, variant TEXT, "
+                                "expires REAL, value BLOB, PRIMARY KEY (z_object, id, variant))")
+
+    def get(self, key):
+        row = self.connection.execute("SELECT expires, value FROM cache WHERE z_object = ? AND id = ? AND variant = ?",
+                                      key).fetchone()
+        if row is None:
+            return None
+        if row[0] < time.time():
+            self.connection.execute("DELETE FROM cache WHERE z_object = ? AND id = ? AND variant = ?", key)
+            return None
+        return cPickle.loads(str(row[1]))
+
+    def set(self, key, value, expires):
+        self.connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                                key + (expires, sqlite3.Binary(cPickle.dumps(portable(value), 2))))
+
+    def invalidate(self, z_object, ids=None):
+        if ids is None:
+            self.connection.execute("DELETE FROM cache WHERE z_object = ?", (z_object,))
+            return
+        for record_id in list(ids) + [QUERY]:
+            self.connection.execute("DELETE FROM cache WHERE z_object = ? AND id = ?", (z_object, record_id))
+
+    def clear(self):
+        self.connection.execute("DELETE FROM cache")
+
+    def close(self):
+        self.connection.close()
+
+
+class RecordCache(object):
+    """
+    An LRU cache of records and query results with a TTL per object type.  Object types are
+    matched case insensitively.
+
+    Cached records are shared by every caller, so treat them as read only.  Records read from
+    a backend are Records rather than suds objects.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=60, ttls=None, backend=None):
+        """
+        :param max_entries: Most entries kept in memory
+        :param ttl_seconds: Seconds entries are kept, for objects without their own TTL
+        :param ttls: dict of object type to TTL in seconds (0 to not cache it), added to DEFAULT_TTLS
+        :param backend: Shared second level (e.g. SqliteBackend), or None
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.ttls = dict((object_key(z_object), ttl) for z_object, ttl in DEFAULT_TTLS.items())
+        self.ttls.update((object_key(z_object), ttl) for z_object, ttl in (ttls or {}).items())
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()  # (z_object, id, variant): (expires, value)
+        self.__keys = {}  # (z_object, id): set of keys
+
+    def ttl(self, z_object):
+        return self.ttls.get(object_key(z_object), self.ttl_seconds)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            if entry[0] >= time.time():
+                # Most recently used entries are last
+                self.__entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.__forget(key)
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.hits += 1
+                self.__remember(key, value, time.time() + self.ttl(key[0]))
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        ttl = self.ttl(key[0])
+        if ttl <= 0:
+            return
+        expires = time.time() + ttl
+        self.__entries.pop(key, None)
+        self.__remember(key, value, expires)
+        if self.backend is not None:
+            self.backend.set(key, value, expires)
+
+    def __remember(self, key, value, expires):
+        self.__entries[key] = (expires, value)
+        self.__keys.setdefault(key[:2], set()).add(key)
+        while len(self.__entries) > self.max_entries:
+            self.__forget(next(iter(self.__entries)))
+
+    def __forget(self, key):
+        self.__entries.pop(key, None)
+        keys = self.__keys.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.__keys[key[:2]]
+
+    def get_records(self, z_object, ids, fields):
+        """
+        The cached records of z_object with these Ids, fetched with these fields
+
+        :return: dict of Id to record, for the Ids that are cached
+        """
+        z_object = object_key(z_object)
+        variant = fields_key(fields)
+        records = {}
+        for record_id in ids:
+            record = self.get((z_object, record_id, variant))
+            if record is not None:
+                records[record_id] = record
+        return records
+
+    def put_records(self, z_object, records, fields):
+        z_object = object_key(z_object)
+        variant = fields_key(fields)
+        for record in records:
+            record_id = getattr(record, 'Id', None)
+            if record_id is not None:
+                self.set((z_object, str(record_id), variant), record)
+
+    def get_query(self, z_object, query_string):
+        return self.get((object_key(z_object), QUERY, query_string))
+
+    def put_query(self, z_object, query_string, result):
+        self.set((object_key(z_object), QUERY, query_string), result)
+
+    def invalidate(self, z_object, ids=None):
+        """
+        Drop the cached records of z_object with these Ids (or all of them) and its cached queries
+        """
+        z_object = object_key(z_object)
+        if ids is None:
+            keys = [key for key in self.__entries if key[0] == z_object]
+        else:
+            keys = []
+            for record_id in list(ids) + [QUERY]:
+                keys.extend(self.__keys.get((z_object, record_id), ()))
+        for key in keys:
+            self.__forget(key)
+        if self.backend is not None:
+            self.backend.invalidate(z_object, ids)
+
+    def clear(self):
+        self.__entries.clear()
+        self.__keys.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+
+def fields_key(fields):
+    """
+    The part of a record's key that stands for the fields it was fetched with
+    """
+    return ','.join(sorted(set(fields) | set(['Id'])))
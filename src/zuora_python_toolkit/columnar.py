@@ -0,0 +1,258 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Typed columnar (Parquet) files from export downloads.
+
+ColumnarWriter converts rows to columns typed from the WSDL field types and writes them as
+Parquet row groups of row_group_size rows, so an export of any size is converted in bounded
+memory.  Parquet support needs pyarrow (pip install zyrup[columnar]).
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from os import path
+import logging
+import os
+import pkgutil
+import re
+import urllib
+
+from zuora_python_toolkit.fastsoap import ONS, XSD
+from zuora_python_toolkit.lazy import lazy_import
+
+pyarrow = lazy_import('pyarrow')
+parquet = lazy_import('pyarrow.parquet')
+
+logger = logging.getLogger(__package__)
+
+DEFAULT_ROW_GROUP_SIZE = 64 * 1024
+
+# Digits after the decimal point kept for decimal fields
+DECIMAL_SCALE = 9
+
+DATETIME_PATTERN = re.compile(r'(\d{4})-(\d\d)-(\d\d)(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?)?'
+                              r'\s*(Z|[+-]\d\d:?\d\d)?$')
+
+
+def available():
+    """
+    Is pyarrow installed?  (Without importing it, that waits for the first file written)
+    """
+    return pkgutil.find_loader('pyarrow') is not None
+
+
+def parse_datetime(text):
+    """
+    Parse an ISO 8601 date and time as written in exports (e.g. 2015-01-02T03:04:05.000-08:00)
+    to a naive UTC datetime.
+    """
+    match = DATETIME_PATTERN.match(text.strip())
+    if match is None:
+        raise ValueError("Invalid date and time: %s" % text)
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    value = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                     int((fraction or '0').ljust(6, '0')))
+    if offset and offset != 'Z':
+        offset = offset.replace(':', '')
+        minutes = int(offset[1:3]) * 60 + int(offset[3:5])
+        value -= timedelta(minutes=minutes if offset[0] == '+' else -minutes)
+    return value
+
+
+def parse_date(text):
+    return parse_datetime(text).date()
+
+
+def parse_decimal(text):
+    return Decimal(text).quantize(Decimal(1).scaleb(-DECIMAL_SCALE))
+
+
+def parse_boolean(text):
+    return text.strip().lower() in ('true', '1', 'y', 'yes')
+
+
+# How export text is converted for each XSD type (other types are kept as text)
+PARSERS = {
+    'boolean': parse_boolean,
+    'int': int,
+    'long': long,
+    'float': float,
+    'double': float,
+    'decimal': parse_decimal,
+    'date': parse_date,
+    'dateTime': parse_datetime,
+}
+
+
+def arrow_type(xsd_type):
+    """
+    The Arrow type for an XSD type name such as dateTime
+    """
+    return {
+        'boolean': pyarrow.bool_(),
+        'int': pyarrow.int32(),
+        'long': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'double': pyarrow.float64(),
+        'decimal': pyarrow.decimal128(38, DECIMAL_SCALE),
+        'date': pyarrow.date32(),
+        'dateTime': pyarrow.timestamp('ms'),
+    }.get(xsd_type, pyarrow.string())
+
+
+def column_types(codec, columns, z_object=None):
+    """
+    The XSD type of each export column, from the WSDL.
+
+    Columns are named Object.Field (e.g. Account.Name); a column without an object is a field
+    of z_object.  Columns of objects or fields not in the WSDL are strings.
+
+    :param codec: SoapCodec for the WSDL
+    :param columns: Column names, e.g. the export's header
+    :param z_object: The exported object
+    :return: list of XSD type names
+    """
+    types = []
+    for column in columns:
+        if '.' in column:
+            object_name, field_name = column.rsplit('.', 1)
+        else:
+            object_name, field_name = z_object, column
+        xsd_type = 'string'
+        type_name = codec.object_type(object_name) if object_name else None
+        if type_name is not None and type_name[0] == ONS:
+            field = codec.fields(type_name).get(field_name)
+            if field is not None:
+                namespace, name = codec.simple_base(field.type)
+                if namespace == XSD:
+                    xsd_type = name
+        types.append(xsd_type)
+    return types
+
+
+class ColumnarWriter(object):
+    """
+    Writes rows as typed Parquet row groups.
+
+    Without partition_by every row group goes to the file `location`.  With it, `location` is
+    a directory with one file per value of that column, at {location}/{column}={value}/part-0.parquet,
+    with the value's UTF-8 percent-encoded so that distinct values never share a file.
+    At most row_group_size rows are held in memory across all partitions.
+    """
+
+    def __init__(self, location, columns, types, row_group_size=DEFAULT_ROW_GROUP_SIZE, partition_by=None,
+                 compression='snappy'):
+        """
+        :param location: Parquet file, or directory when partitioned
+        :param columns: Column names
+        :param types: XSD type name of each column, see column_types
+        :param row_group_size: Rows per row group
+        :param partition_by: Column to partition the files by
+        :param compression: Parquet compression codec
+        """
+        if not available():
+            raise ImportError("Columnar files need pyarrow, install it with pip install zyrup[columnar]")
+        if row_group_size < 1:
+            raise ValueError("Row group size must be greater than 0")
+        self.location = location
+        self.columns = list(columns)
+        self.parsers = [PARSERS.get(xsd_type) for xsd_type in types]
+        self.schema = pyarrow.schema([pyarrow.field(column, arrow_type(xsd_type))
+                                      for column, xsd_type in zip(self.columns, types)])
+        self.row_group_size = row_group_size
+        self.partition_index = self.columns.index(partition_by) if partition_by is not None else None
+        self.compression = compression
+        self.rows_written = 0
+        self.__buffers = {}
+        self.__buffered = 0
+        self.__writers = {}  # filename: writer
+        self.__partitions = {}  # filename: partition value written to it
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def convert(self, values):
+        """
+        Convert a row of export text to typed values (empty text is null)
+        """
+        row = []
+        for value, parser in zip(values, self.parsers):
+            if value is None or value == '':
+                row.append(None)
+            elif parser is None:
+                row.append(value)
+            else:
+                try:
+                    row.append(parser(value))
+                except (ValueError, InvalidOperation):
+                    logger.warning("Could not convert %r, writing null" % (value,))
+                    row.append(None)
+        return row
+
+    def write(self, values):
+        """
+        Add a row of export text (e.g. a Row read by iter_csv_rows)
+        """
+        row = self.convert(values)
+        partition = row[self.partition_index] if self.partition_index is not None else None
+        self.__buffers.setdefault(partition, []).append(row)
+        self.__buffered += 1
+        if self.__buffered >= self.row_group_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for values in rows:
+            self.write(values)
+        return self
+
+    def flush(self):
+        """
+        Write every buffered row
+        """
+        for partition, rows in self.__buffers.items():
+            self.__write_row_group(partition, rows)
+        self.__buffers.clear()
+        self.__buffered = 0
+
+    def __write_row_group(self, partition, rows):
+        arrays = [pyarrow.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self.schema)]
+        table = pyarrow.Table.from_arrays(arrays, schema=self.schema)
+        filename = self.filename(partition)
+        writer = self.__writers.get(filename)
+        if writer is None:
+            writer = self.__writers[filename] = parquet.ParquetWriter(filename, self.schema,
+                                                                      compression=self.compression)
+            self.__partitions[filename] = partition
+        elif self.__partitions[filename] != partition:
+            raise ValueError("Partitions %r and %r would both be written to %s" %
+                             (self.__partitions[filename], partition, filename))
+        writer.write_table(table)
+        self.rows_written += len(rows)
+
+    def filename(self, partition):
+        if self.partition_index is None:
+            return self.location
+        if partition is None:
+            value = '__null__'
+        else:
+            if isinstance(partition, str):
+                partition = partition.decode('utf-8')
+            value = urllib.quote(unicode(partition).encode('utf-8'), safe='')
+        directory = path.join(self.location, '%s=%s' % (self.columns[self.partition_index], value))
+        if not path.isdir(directory):
+            os.makedirs(directory)
+        return path.join(directory, 'part-0.parquet')
+
+    def close(self):
+        self.flush()
+        if not self.__writers and self.partition_index is None:
+            # Still write a (schema only) file when there were no rows
+            self.__writers[self.location] = parquet.ParquetWriter(self.location, self.schema,
+                                                                  compression=self.compression)
+        for writer in self.__writers.values():
+            writer.close()
+        self.__writers.clear()
+        self.__partitions.clear()
+        logger.info("%s rows written to %s" % (self.rows_written, self.location))
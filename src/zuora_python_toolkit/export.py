@@ -2,62 +2,76 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 import csv
-import re
+import os
+import shutil
 import time
-import requests
 import logging
-from urlparse import parse_qs
+from urlparse import urlparse
+
+import gevent
 
 from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.columnar import DEFAULT_ROW_GROUP_SIZE, ColumnarWriter, column_types
+from zuora_python_toolkit.fastsoap import SoapCodec
+from zuora_python_toolkit.records import iter_csv_rows
+from zuora_python_toolkit.util import ZuoraError, generate_search_conditions, result_errors, result_succeeded
 
 logger = logging.getLogger(__package__)
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Statuses of an Export that will never complete
+FAILED_STATUSES = ('Failed', 'Canceled', 'Cancelled')
+
 
 class ZuoraExport(Zuora):
 
-    def export(self, z_object='', fields=[], filters='', sleep_seconds=5, max_tries=None):
+    def export(self, z_object='', fields=[], filters='', sleep_seconds=5, max_tries=None, journal=None):
         """
         Uses the Export object from Zuora to pull down a Datasource
         version of the object specified.
-        """
-        self.set_headers('export')
-        logger.debug("Getting %ss" % z_object)
 
-        logger.debug("Generating Export Object")
-        fields = ", ".join(["%s" % f for f in fields])
-        if filters == '':
-            logger.debug("Query All")
-            query = "SELECT %s FROM %s" % (fields, z_object)
-        else:
-            logger.debug("Query Filter")
-            query = "SELECT %s FROM %s WHERE %s" % (fields,
-                                                    z_object,
-                                                    filters
-                                                    )
-        logger.debug(query)
+        With a journal (see journal.JournalSection) the Export Id is recorded once it is
+        created, and the same export made again (here or in export_many) waits for that Export
+        instead of creating another.
 
-        export = self.generate_object("Export")
-        export.Name = '%s%s' % (z_object, time.time())
-        export.Query = query
-        export.Format = 'csv'
-        results = self.create(export)
+        :raises ZuoraError: If the Export fails, is canceled or is not found (it is then dropped from the journal)
+        """
+        key = export_key(z_object, fields, filters)
+        export_id = journal.get(key) if journal is not None else None
+        if export_id is None:
+            export = self.generate_export(z_object, fields, filters)
+            results = self.create(export)
+            if results.Success:
+                export_id = results.Id
+                logger.info('Export Object (%s) created' % export_id)
+                if journal is not None:
+                    journal.put(key, export_id)
+        else:
+            logger.info('Reattaching to Export Object (%s)' % export_id)
 
-        if results.Success:
-            logger.info('Export Object (%s) created' % results.Id)
-            export_query = "SELECT status, fileId, query, size FROM Export WHERE Id ='%s'" % results.Id
+        if export_id is not None:
+            export_query = "SELECT status, fileId, query, size FROM Export WHERE Id ='%s'" % export_id
             done = False
 
             tries = 0
             while (not done) and ((max_tries is None) or (tries < max_tries)):
-                results = self.query(export_query)
+                results = self.query(export_query, use_cache=False)
+                self.instrumentation.increment('export_polls', z_object=z_object)
                 tries += 1
                 if results.done:
-                    if results.size == 1:
-                        status = results.records[0].Status
-                        done = True if status == 'Completed' else False
+                    status = results.records[0].Status if results.size == 1 else None
+                    done = True if status == 'Completed' else False
+                    if status is None or status in FAILED_STATUSES:
+                        # Waiting longer will not help, and the journal must not reattach to it
+                        if journal is not None:
+                            journal.remove(key)
+                        problem = 'was not found' if status is None else 'finished with status %s' % status
+                        raise ZuoraError("Export %s for %s %s" % (export_id, z_object, problem))
                 if not done:
                     logger.debug("sleeping for %s..." % sleep_seconds)
-                    time.sleep(sleep_seconds)
+                    with self.instrumentation.timer('export_wait', z_object=z_object):
+                        time.sleep(sleep_seconds)
                 else:
                     file_id = results.records[0].FileId
                     logger.debug("Returning file_id (%s)" % file_id)
@@ -69,38 +83,291 @@ class ZuoraExport(Zuora):
             logger.error(results)
             return None
 
-    def download(self, file_id, filename=None, droppath=""):
+    def generate_export(self, z_object='', fields=[], filters=''):
+        """
+        Build (but do not create) an Export object for the object, fields and filters given.
+        """
+        self.set_headers('export')
+        logger.debug("Getting %ss" % z_object)
+
+        logger.debug("Generating Export Object")
+        query = export_query(z_object, fields, filters)
+        logger.debug(query)
+
+        export = self.generate_object("Export")
+        export.Name = '%s%s' % (z_object, time.time())
+        export.Query = query
+        export.Format = 'csv'
+        return export
+
+    def export_status(self, export_ids):
+        """
+        Look up several Export objects with a single query.
+
+        :param export_ids: Ids of Export objects
+        :return: dict of Export Id to its record (with Status and FileId)
+        """
+        search_conditions = generate_search_conditions(values=export_ids)
+        export_query = "SELECT Id, Status, FileId FROM Export WHERE %s" % search_conditions
+        return dict((record.Id, record) for record in self.iter_query(export_query))
+
+    def export_many(self, exports, droppath="", sleep_seconds=5, max_sleep_seconds=60, backoff=1.5,
+                    max_tries=None, journal=None):
+        """
+        Create several exports at once, poll them together and download each file as soon as
+        its export completes.
+
+        Every poll is a single query over all pending Export Ids.  The wait between polls starts
+        at sleep_seconds, grows by backoff (up to max_sleep_seconds) while nothing completes and
+        drops back to sleep_seconds once something does.
+
+        With a journal (see journal.JournalSection) the Export Ids are recorded as soon as they
+        are created and each download once it is written.  The same exports made again skip the
+        files already downloaded and wait for the recorded Exports (including those created by
+        export) instead of creating new ones.
+
+        :param exports: list of dicts with z_object, fields, and optionally filters and filename
+                        (filename defaults to z_object)
+        :param droppath: Directory prefix for the downloaded files
+        :param max_tries: Give up on exports still pending after this many polls
+        :param journal: JournalSection recording the progress of the exports
+        :return: dict of filename to downloaded path, or None for exports that failed
+        """
+        downloaded = {}
+        pending = {}
+        created = []
+        keys = {}
+        for export in exports:
+            filename = export.get('filename', export['z_object'])
+            downloaded[filename] = None
+            keys[filename] = export_key(export['z_object'], export['fields'], export.get('filters', ''))
+            if journal is not None:
+                path = journal.get('download/%s' % filename)
+                if path is not None and os.path.exists(path):
+                    logger.info("%s already downloaded to %s" % (filename, path))
+                    downloaded[filename] = path
+                    continue
+                export_id = journal.get(keys[filename])
+                if export_id is not None:
+                    logger.info('Reattaching to Export Object (%s) for %s' % (export_id, filename))
+                    pending[export_id] = filename
+                    continue
+            created.append((filename, export))
+
+        if created:
+            z_exports = [self.generate_export(export['z_object'], export['fields'], export.get('filters', ''))
+                         for filename, export in created]
+            results = self.create(z_exports)
+            if not isinstance(results, (list, tuple)):
+                results = [results]
+
+            for (filename, export), result in zip(created, results):
+                if result_succeeded(result):
+                    logger.info('Export Object (%s) created for %s' % (result.Id, filename))
+                    pending[result.Id] = filename
+                else:
+                    logger.error("Export for %s not created: %s" % (filename, result_errors(result)))
+            if journal is not None:
+                journal.put_many((keys[filename], export_id) for export_id, filename in pending.items())
+
+        def download(file_id, filename):
+            path = self.download(file_id, filename, droppath)
+            if journal is not None:
+                journal.put('download/%s' % filename, path)
+            return path
+
+        downloads = {}
+        tries = 0
+        wait = sleep_seconds
+        while pending and ((max_tries is None) or (tries < max_tries)):
+            tries += 1
+            completed = False
+            self.instrumentation.increment('export_polls')
+            with self.instrumentation.timer('export_poll'):
+                statuses = self.export_status(pending.keys())
+            for export_id, record in statuses.items():
+                if export_id not in pending:
+                    continue
+                status = record.Status
+                if status == 'Completed':
+                    filename = pending.pop(export_id)
+                    logger.info("Export %s completed, downloading %s" % (export_id, filename))
+                    downloads[filename] = gevent.spawn(download, record.FileId, filename)
+                    completed = True
+                elif status in FAILED_STATUSES:
+                    filename = pending.pop(export_id)
+                    logger.error("Export %s for %s finished with status %s" % (export_id, filename, status))
+                    if journal is not None:
+                        journal.remove(keys[filename])
+
+            if pending:
+                wait = sleep_seconds if completed else min(wait * backoff, max_sleep_seconds)
+                logger.debug("%s exports pending, sleeping for %s..." % (len(pending), wait))
+                with self.instrumentation.timer('export_wait'):
+                    gevent.sleep(wait)
+
+        for export_id, filename in pending.items():
+            logger.error("Unable to retrieve export FileID for %s (%s) from Zuora" % (filename, export_id))
+
+        gevent.joinall(downloads.values())
+        for filename, greenlet in downloads.items():
+            if greenlet.successful():
+                downloaded[filename] = greenlet.value
+            else:
+                logger.error("Download of %s failed: %s" % (filename, greenlet.exception))
+        return downloaded
+
+    def export_columnar(self, z_object='', fields=[], location='', filters='', sleep_seconds=5, max_tries=None,
+                        **kwargs):
+        """
+        Export an object and convert the download to typed Parquet files, see download_columnar.
+
+        :return: location, or None if the export failed
+        """
+        file_id = self.export(z_object, fields, filters, sleep_seconds, max_tries)
+        if file_id is None:
+            return None
+        return self.download_columnar(file_id, location, z_object, **kwargs)
+
+    def download_columnar(self, file_id, location, z_object=None, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                          partition_by=None, gzip=True, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Stream an export file into typed Parquet row groups (see columnar.ColumnarWriter).
+
+        The column types come from the WSDL: dateTime columns become timestamps, decimals
+        become decimals, and so on.  Only row_group_size rows are held in memory.
+
+        :param file_id: FileId of a completed Export
+        :param location: Parquet file, or directory when partitioned
+        :param z_object: The exported object, for columns without an Object. prefix
+        :param row_group_size: Rows per row group
+        :param partition_by: Column to partition the files by, e.g. Account.Currency
+        :return: location
+        """
+        rows = self.download(file_id, gzip=gzip, chunk_size=chunk_size, compact=True)
+        first = next(rows, None)
+        columns = list(first._fields) if first is not None else []
+        types = column_types(SoapCodec.for_wsdl(self.wsdl), columns, z_object)
+        with ColumnarWriter(location, columns, types, row_group_size, partition_by) as writer:
+            if first is not None:
+                writer.write(first)
+                writer.write_rows(rows)
+        return location
+
+    def download_to_store(self, file_id, store, z_object, batch_size=5000, gzip=True, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        Stream an export file into a local store (see replica.SqliteStore), batch_size rows at a time.
+
+        Columns of the exported object lose their prefix (Account.Name is stored as Name) and the
+        Ids of joined objects become foreign keys (Account.Id is stored as AccountId).
+
+        :param file_id: FileId of a completed Export
+        :param store: Store with a load method, e.g. a SqliteStore
+        :param z_object: The exported object, whose table the rows are merged into
+        :return: number of records inserted or changed
+        """
+        rows = self.download(file_id, gzip=gzip, chunk_size=chunk_size, compact=True)
+        return store.load(z_object, rows, batch_size)
+
+    def download(self, file_id, filename=None, droppath="", gzip=True, backup=True, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 compact=False):
+        """
+        Download an export file.
+
+        The body is streamed in chunks of chunk_size bytes.  With a filename it is written to
+        {droppath}{filename}.csv, and (with backup) a timestamped backup is kept as a hard link
+        to the same file rather than a second copy.  Without a filename a csv.DictReader over
+        the streamed rows is returned, or with compact an iterator of Rows (see records).
+
+        :param file_id: FileId of a completed Export
+        :param filename: Name of the csv file to write, without the extension
+        :param droppath: Directory prefix for filename
+        :param gzip: Ask Zuora to gzip the file in transit
+        :param backup: Keep a timestamped backup next to the file
+        :param chunk_size: Number of bytes read from the connection at a time
+        :param compact: Return Rows, which share the column names, instead of a dict per row
+        :return: path of the written file, or a row iterator
+        """
         logger.info("Beginning download ....")
-        auth = {
-            "Authorization": "ZSession %s" % self._sessionId
+        headers = {
+            "Authorization": "ZSession %s" % self.get_session_id(),
+            "Accept-Encoding": "gzip, deflate" if gzip else "identity",
         }
 
-        o = parse_qs(self.__endpoint)
-        try:
-            loc = o.netloc
-        except:
-            loc = o.host
-        url = "%s://%s/apps/api/file/%s" % (o.scheme, loc, file_id)
-        r = requests.get(url, headers=auth)
-        if r.status != 200:
-            raise Exception("Download failed")
-
-        if filename is not None:
-            src = "%s%s.csv" % (droppath, filename)
-            f = open(src, "w+")
-            f.write(r.data)
-            f.close()
-            logger.info("%s written" % src)
-
-            import shutil
+        o = urlparse(self.get_endpoint())
+        url = "%s://%s/apps/api/file/%s" % (o.scheme, o.netloc, file_id)
+        r = self.http_session.get(url, headers=headers, stream=True)
+        if r.status_code != 200:
+            r.close()
+            raise ZuoraError("Download of %s failed with status %s" % (file_id, r.status_code))
+
+        if filename is None:
+            if compact:
+                return iter_csv_rows(iter_lines(r.iter_content(chunk_size)))
+            return csv.DictReader(iter_lines(r.iter_content(chunk_size)))
+
+        src = "%s%s.csv" % (droppath, filename)
+        part = "%s.%s.part" % (src, os.getpid())
+        with open(part, "wb") as f, self.instrumentation.timer('download'):
+            for data in r.iter_content(chunk_size):
+                f.write(data)
+
+        if backup:
             now = datetime.now()
-            now = "%s_%s_%s_%s_%s" %(now.year, now.day, now.month, now.hour, now.minute)
+            now = "%s_%s_%s_%s_%s" % (now.year, now.day, now.month, now.hour, now.minute)
             dst = src.replace('.csv', '.%s.csv' % now)
-            shutil.copyfile(src, dst)
-            logger.info("backup copy of %s.csv copied to %s" % (filename, dst))
+            os.rename(part, dst)
+            link_or_copy(dst, src)
+            logger.info("backup of %s.csv linked to %s" % (filename, dst))
         else:
-            try:
-                reader = csv.DictReader(re.split("[\n\r]+", r.data))
-                return list(reader)
-            except Exception as e:
-                self.fatal_error("Cannot read export", exception=e)
\ No newline at end of file
+            os.rename(part, src)
+        logger.info("%s written" % src)
+        return src
+
+
+def export_query(z_object, fields, filters=''):
+    """
+    The ZOQL query of an Export of z_object's fields
+    """
+    query = "SELECT %s FROM %s" % (", ".join("%s" % f for f in fields), z_object)
+    if filters:
+        query = "%s WHERE %s" % (query, filters)
+    return query
+
+
+def export_key(z_object, fields, filters=''):
+    """
+    The journal key of an export's Export Id, the same for export and export_many
+    """
+    return 'export/%s' % export_query(z_object, fields, filters)
+
+
+def iter_lines(chunks):
+    """
+    Re-split a stream of byte chunks into lines, keeping the line endings so the csv module
+    can still read quoted values that contain newlines.  A line ending in '\r' is held back
+    until the next chunk, in case it is the first half of a '\r\n'.
+    """
+    pending = ''
+    for data in chunks:
+        lines = (pending + data).splitlines(True)
+        pending = ''
+        if lines and not lines[-1].endswith('\n'):
+            pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def link_or_copy(src, dst):
+    """
+    Atomically replace dst with a hard link to src.  Falls back to a copy on filesystems
+    (or platforms) without hard links.
+    """
+    tmp = "%s.%s.link" % (dst, os.getpid())
+    try:
+        os.link(src, tmp)
+    except (AttributeError, OSError):
+        shutil.copyfile(src, tmp)
+    os.rename(tmp, dst)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+import gevent
+from gevent.event import AsyncResult
+
+from zuora_python_toolkit.util import fault_code
+
+logger = logging.getLogger(__package__)
+
+# Fault codes Zuora uses when a tenant's concurrency or rate limits are exceeded
+THROTTLE_FAULT_CODES = ('REQUEST_EXCEEDED_LIMIT', 'REQUEST_EXCEEDED_RATE')
+
+
+def is_throttle_fault(exception):
+    """
+    Is the exception Zuora (or its load balancer) refusing a request because of request limits?
+    """
+    if fault_code(exception) in THROTTLE_FAULT_CODES:
+        return True
+    # suds raises Exception((status, reason)) for HTTP errors other than 500
+    args = getattr(exception, 'args', ())
+    return len(args) == 1 and isinstance(args[0], tuple) and len(args[0]) == 2 and args[0][0] == 429
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` requests per second on average, with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.time()
+
+    def take(self):
+        """
+        Take a token, sleeping until one is available
+        """
+        while True:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            gevent.sleep((1 - self.tokens) / self.rate)
+
+
+class Governor(object):
+    """
+    Limits the SOAP calls in flight and (optionally) the rate they are sent at.
+
+    The concurrency limit adapts AIMD-style: each throttle fault multiplies it by `decrease`
+    (down to min_concurrency) and each successful call adds increase / limit to it (about
+    `increase` per round of calls) up to max_concurrency.  Throttled calls are retried after
+    a short back-off, up to throttle_retries times.
+
+    Governors are shared by every client with the same key, see for_key.
+    """
+
+    # Shared governors, keyed on (wsdl, username)
+    __governors = {}
+
+    def __init__(self, max_concurrency=20, rate=None, burst=None, min_concurrency=1, increase=1.0, decrease=0.5,
+                 throttle_retries=3, throttle_sleep_seconds=1):
+        """
+        :param max_concurrency: Most calls in flight at once
+        :param rate: Most calls started per second, or None for no rate limit
+        :param burst: Calls that may be started at once when under the rate (defaults to rate)
+        :param min_concurrency: The concurrency limit never drops below this
+        :param increase: Added to the limit for each round of successful calls
+        :param decrease: The limit is multiplied by this on a throttle fault
+        :param throttle_retries: Times a throttled call is retried
+        :param throttle_sleep_seconds: Back-off before the first retry, doubled each retry
+        """
+        if min_concurrency < 1 or max_concurrency < min_concurrency:
+            raise ValueError("Concurrency must be between 1 and max_concurrency")
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.increase = increase
+        self.decrease = decrease
+        self.throttle_retries = throttle_retries
+        self.throttle_sleep_seconds = throttle_sleep_seconds
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.in_flight = 0
+        self.throttled = 0
+        self.__waiters = []
+
+    @classmethod
+    def for_key(cls, key, **kwargs):
+        """
+        Return the governor shared by every client with key, creating it with kwargs the first time.
+        """
+        governor = cls.__governors.get(key)
+        if governor is None:
+            governor = cls.__governors[key] = cls(**kwargs)
+        return governor
+
+    @classmethod
+    def clear(cls):
+        cls.__governors.clear()
+
+    @property
+    def concurrency(self):
+        return max(self.min_concurrency, int(self.limit))
+
+    def acquire(self):
+        """
+        Wait for a free slot (and a token, with a rate limit).  A caller killed while waiting
+        leaves no trace: it gives up its place, or passes on the wake-up it was given, and
+        releases any slot it had taken.
+        """
+        while self.in_flight >= self.concurrency:
+            waiter = AsyncResult()
+            self.__waiters.append(waiter)
+            try:
+                waiter.get()
+            except BaseException:
+                if waiter in self.__waiters:
+                    self.__waiters.remove(waiter)
+                else:
+                    self.wake()
+                raise
+        self.in_flight += 1
+        if self.bucket is not None:
+            try:
+                self.bucket.take()
+            except BaseException:
+                self.release()
+                raise
+
+    def release(self):
+        self.in_flight -= 1
+        self.wake()
+
+    def wake(self):
+        """
+        Wake as many waiters as there are free slots
+        """
+        for i in xrange(min(len(self.__waiters), self.concurrency - self.in_flight)):
+            self.__waiters.pop(0).set()
+
+    def on_success(self):
+        if self.limit < self.max_concurrency:
+            self.limit = min(self.max_concurrency, self.limit + self.increase / self.limit)
+
+    def on_throttle(self):
+        self.throttled += 1
+        self.limit = max(self.min_concurrency, self.limit * self.decrease)
+        logger.info("Zuora throttled a request, concurrency limit now %s" % self.concurrency)
+
+    def call(self, f, *args, **kwargs):
+        """
+        Call f within the limits, retrying if Zuora throttles it.
+        """
+        sleep_seconds = self.throttle_sleep_seconds
+        retries = 0
+        while True:
+            self.acquire()
+            try:
+                result = f(*args, **kwargs)
+            except Exception as e:
+                if not is_throttle_fault(e):
+                    raise
+                self.on_throttle()
+                if retries >= self.throttle_retries:
+                    raise
+            else:
+                self.on_success()
+                return result
+            finally:
+                self.release()
+            retries += 1
+            gevent.sleep(sleep_seconds)
+            sleep_seconds *= 2
+
+    def governed(self, f):
+        """
+        Wrap f so that every call to it goes through call()
+        """
+        def governed_call(*args, **kwargs):
+            return self.call(f, *args, **kwargs)
+        governed_call.method = getattr(f, 'method', None)
+        return governed_call
@@ -0,0 +1,132 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+A durable journal of the progress of long-running jobs, so that a restarted job continues
+where it stopped instead of starting over.
+
+Each step of a job writes to its own section of the journal as it goes:
+
+    journal = Journal('jobs.db')
+    zuora.batch_call('update', accounts, journal=journal.section('update-accounts'))
+    zuora.export_many(exports, journal=journal.section('nightly-exports'))
+    for record in zuora.iter_query(query, journal=journal.section('invoice-items')):
+        ...
+
+A batched write records the results of each chunk as soon as it completes and skips records
+that already have results; an export run records the Export Ids it creates (and the files it
+downloads) and reattaches to them; a query records its queryLocator after each page is
+consumed.  Rerun a step with the same arguments, in the case of writes the same records in the
+same order, to resume it.  Clear a section once its step is done to run it afresh.
+"""
+import cPickle
+import logging
+import sqlite3
+
+from zuora_python_toolkit.cache import portable
+
+logger = logging.getLogger(__package__)
+
+
+class Journal(object):
+    """
+    Entries by section and key in a SQLite file, committed as they are written
+    """
+
+    def __init__(self, filename, timeout=30):
+        """
+        :param filename: SQLite file
+        :param timeout: Seconds to wait for another process's lock
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=timeout, isolation_level=None)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS journal (section TEXT, key TEXT, value BLOB, "
+                                "PRIMARY KEY (section, key))")
+
+    def section(self, name):
+        return JournalSection(self, name)
+
+    def get(self, section, key, default=None):
+        row = self.connection.execute("SELECT value FROM journal WHERE section = ? AND key = ?",
+                                      (section, key)).fetchone()
+        if row is None:
+            return default
+        return cPickle.loads(str(row[0]))
+
+    def put(self, section, key, value):
+        self.put_many(section, [(key, value)])
+
+    def put_many(self, section, entries):
+        """
+        Write several entries in one transaction
+
+        :param entries: (key, value) pairs
+        """
+        rows = [(section, key, sqlite3.Binary(cPickle.dumps(portable(value), 2))) for key, value in entries]
+        self.connection.execute("BEGIN")
+        try:
+            self.connection.executemany("INSERT OR REPLACE INTO journal VALUES (?, ?, ?)", rows)
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def items(self, section, prefix=''):
+        """
+        The entries of a section whose keys start with prefix, as a dict
+        """
+        rows = self.connection.execute("SELECT key, value FROM journal WHERE section = ? AND substr(key, 1, ?) = ?",
+                                       (section, len(prefix), prefix))
+        return dict((key, cPickle.loads(str(value))) for key, value in rows)
+
+    def remove(self, section, key=None):
+        """
+        Remove an entry, or the whole section
+        """
+        if key is None:
+            self.connection.execute("DELETE FROM journal WHERE section = ?", (section,))
+        else:
+            self.connection.execute("DELETE FROM journal WHERE section = ? AND key = ?", (section, key))
+
+    def close(self):
+        self.connection.close()
+
+
+class JournalSection(object):
+    """
+    The entries of one step of a job, see Journal
+    """
+
+    def __init__(self, journal, name):
+        self.journal = journal
+        self.name = name
+
+    def get(self, key, default=None):
+        return self.journal.get(self.name, key, default)
+
+    def put(self, key, value):
+        self.journal.put(self.name, key, value)
+
+    def put_many(self, entries):
+        self.journal.put_many(self.name, entries)
+
+    def items(self, prefix=''):
+        return self.journal.items(self.name, prefix)
+
+    def remove(self, key):
+        self.journal.remove(self.name, key)
+
+    def clear(self):
+        self.journal.remove(self.name)
+
+    # Batched writes
+    def results(self):
+        """
+        The results recorded for a batched write, as a dict of record index to result
+        """
+        return dict((int(key.split('/', 1)[1]), value) for key, value in self.items('result/').items())
+
+    def record_results(self, results):
+        """
+        :param results: dict of record index to result
+        """
+        self.put_many(('result/%d' % index, result) for index, result in results.items())
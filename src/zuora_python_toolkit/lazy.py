@@ -0,0 +1,56 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Modules imported on first use.
+
+suds, requests and pyarrow each take a noticeable part of a second to import.  Modules on the
+path of `import zuora_python_toolkit.base` refer to them through lazy_import, so they are only
+imported once something is actually read from them:
+
+    sudsobject = lazy_import('suds.sudsobject')
+    ...
+    isinstance(value, sudsobject.Object)  # suds is imported here
+"""
+import importlib
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module until an attribute is read from it
+    """
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+        self.__module = None
+
+    def load(self):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name__)
+            self.__dict__.update(self.__module.__dict__)
+        return self.__module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        state = 'loaded' if self.__module is not None else 'not loaded'
+        return '<lazy module %r (%s)>' % (self.__name__, state)
+
+
+def lazy_import(name):
+    """
+    The module `name` if it has been imported already, else a LazyModule for it
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+def loaded(name):
+    """
+    Has the module `name` really been imported?
+    """
+    return name in sys.modules
@@ -0,0 +1,219 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Instrumentation hooks for SOAP calls, batches and exports.
+
+Clients report timings by phase (login, call, serialize, network, parse, export_poll) and
+counts (records, batches, faults, retries) to an Instrumentation, labelled with the operation
+and object type where they are known.  The default Instrumentation does nothing, and its
+`enabled` flag lets hot paths skip working out labels.  MetricsRegistry keeps counters and
+histograms with a Prometheus text exposition, and SpanHook passes each timed phase to a
+tracing callback.
+"""
+from collections import namedtuple
+import logging
+import time
+
+logger = logging.getLogger(__package__)
+
+# Upper bounds (in seconds) of the histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# A timed phase, as passed to SpanHook callbacks
+Span = namedtuple('Span', ['name', 'start', 'seconds', 'labels', 'error'])
+
+
+class Timer(object):
+    """
+    Context manager that reports the time spent in its block to an Instrumentation
+    """
+    __slots__ = ('instrumentation', 'name', 'labels', 'start')
+
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.observe(self.name, self.start, time.time() - self.start, exc_value, **self.labels)
+
+
+class NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+NULL_TIMER = NullTimer()
+
+
+class Instrumentation(object):
+    """
+    Does nothing.  Subclasses override observe and increment.
+    """
+    enabled = False
+
+    def timer(self, name, **labels):
+        """
+        Context manager timing its block as the phase `name`
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    def observe(self, name, start, seconds, error=None, **labels):
+        """
+        A phase took `seconds` from `start`, ending with `error` if it raised
+        """
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add value to the counter `name`
+        """
+
+# The default for clients created without instrumentation
+NULL = Instrumentation()
+
+
+def label_key(labels):
+    return tuple(sorted((name, value) for name, value in labels.items() if value is not None))
+
+
+class Histogram(object):
+    """
+    Counts of observations in cumulative buckets, with their count and sum
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry(Instrumentation):
+    """
+    Counters and per-phase histograms by label, in memory.  Timed phases that raise are also
+    counted as `errors`.
+    """
+    enabled = True
+
+    def __init__(self, prefix='zuora', buckets=DEFAULT_BUCKETS):
+        """
+        :param prefix: Prefix of the metric names in the exposition
+        :param buckets: Histogram bucket upper bounds in seconds
+        """
+        self.prefix = prefix
+        self.buckets = buckets
+        self.counters = {}  # (name, labels): value
+        self.histograms = {}  # (name, labels): Histogram
+
+    def observe(self, name, start, seconds, error=None, **labels):
+        key = (name, label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+        if error is not None:
+            self.increment('errors', phase=name, **labels)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, label_key(labels)), 0)
+
+    def histogram(self, name, **labels):
+        return self.histograms.get((name, label_key(labels)))
+
+    def clear(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def exposition(self):
+        """
+        The metrics in the Prometheus text format
+        """
+        lines = []
+        for name in sorted(set(key[0] for key in self.counters)):
+            metric = '%s_%s_total' % (self.prefix, name)
+            lines.append('# TYPE %s counter' % metric)
+            for (counter_name, labels), value in sorted(self.counters.items()):
+                if counter_name == name:
+                    lines.append('%s%s %s' % (metric, format_labels(labels), value))
+        for name in sorted(set(key[0] for key in self.histograms)):
+            metric = '%s_%s_seconds' % (self.prefix, name)
+            lines.append('# TYPE %s histogram' % metric)
+            for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                if histogram_name != name:
+                    continue
+                for bound, count in histogram.cumulative():
+                    lines.append('%s_bucket%s %s' % (metric, format_labels(labels + (('le', repr(bound)),)), count))
+                lines.append('%s_bucket%s %s' % (metric, format_labels(labels + (('le', '+Inf'),)), histogram.count))
+                lines.append('%s_sum%s %r' % (metric, format_labels(labels), histogram.sum))
+                lines.append('%s_count%s %s' % (metric, format_labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in labels)
+
+
+class SpanHook(Instrumentation):
+    """
+    Passes each timed phase to callback as a Span, e.g. to record it as a tracing span
+    """
+    enabled = True
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def observe(self, name, start, seconds, error=None, **labels):
+        try:
+            self.callback(Span(name, start, seconds, labels, error))
+        except Exception as e:
+            logger.warning("Span callback failed: %s" % e)
+
+
+class Instruments(Instrumentation):
+    """
+    Reports to several Instrumentations, e.g. a MetricsRegistry and a SpanHook
+    """
+
+    def __init__(self, *instrumentations):
+        self.instrumentations = [i for i in instrumentations if i.enabled]
+        self.enabled = len(self.instrumentations) > 0
+
+    def observe(self, name, start, seconds, error=None, **labels):
+        for instrumentation in self.instrumentations:
+            instrumentation.observe(name, start, seconds, error, **labels)
+
+    def increment(self, name, value=1, **labels):
+        for instrumentation in self.instrumentations:
+            instrumentation.increment(name, value, **labels)
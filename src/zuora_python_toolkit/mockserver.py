@@ -0,0 +1,320 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the Zuora SOAP API and export file downloads, for benchmarks and tests.
+
+MockZuora is a WSGI application answering login, query, queryMore, create, update and delete
+with records generated from the WSDL's field types.  Page sizes, latency, throttle faults and
+the size of export files are configurable.  MockServer runs it in a child process, so the
+server never competes with the client being measured.
+"""
+from os import path
+from xml.etree import cElementTree as ElementTree
+from xml.sax.saxutils import escape
+import itertools
+import logging
+import multiprocessing
+import re
+
+import gevent
+from gevent.pywsgi import WSGIServer
+
+from zuora_python_toolkit.fastsoap import ONS, SOAP_ENV, XSD, XSI_TYPE, ZNS, SoapCodec, local_name
+from zuora_python_toolkit.schema import wsdl_url
+
+logger = logging.getLogger(__package__)
+
+# The sandbox WSDL shipped with the package (package_data)
+DEFAULT_WSDL = path.join(path.dirname(path.abspath(__file__)), 'wsdl', 'apisandbox.zuora.a.63.0.wsdl')
+
+SERVICE_PATH = '/apps/services/a/63.0'
+
+QUERY_PATTERN = re.compile(r'\s*select\s+(.+?)\s+from\s+(\w+)(?:\s+where\s+(.*))?$', re.IGNORECASE | re.DOTALL)
+ID_CONDITION = re.compile(r"\bId\s*=\s*'([^']*)'", re.IGNORECASE)
+
+ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<soapenv:Envelope xmlns:soapenv="%s" xmlns:ns1="%s" xmlns:ns2="%s" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+            '<soapenv:Body>%%s</soapenv:Body></soapenv:Envelope>' % (SOAP_ENV, ZNS, ONS))
+
+FAULT = ('<soapenv:Fault><faultcode>fns:%(code)s</faultcode><faultstring>%(message)s</faultstring>'
+         '<detail><ns1:fault xmlns:ns1="http://fault.api.zuora.com/"><ns1:FaultCode>%(code)s</ns1:FaultCode>'
+         '<ns1:FaultMessage>%(message)s</ns1:FaultMessage></ns1:fault></detail></soapenv:Fault>')
+
+
+def record_id(index):
+    return 'mock%028x' % index
+
+
+def sample_value(xsd_type, name, index):
+    """
+    A value of an XSD type as text, varying with index
+    """
+    if xsd_type == 'boolean':
+        return 'true' if index % 2 else 'false'
+    if xsd_type in ('int', 'long'):
+        return str(index % 28 + 1)
+    if xsd_type in ('decimal', 'double', 'float'):
+        return '%d.%02d' % (index % 1000, index % 100)
+    if xsd_type == 'dateTime':
+        return '2015-01-%02dT03:04:05.000-08:00' % (index % 28 + 1)
+    if xsd_type == 'date':
+        return '2015-01-%02d' % (index % 28 + 1)
+    return '%s %s' % (name, index)
+
+
+class MockZuora(object):
+    """
+    WSGI application standing in for Zuora.
+
+    Queries of any object return `records` generated records (or the records named by Id
+    conditions), `page_size` at a time or fewer if the client's QueryOptions ask for fewer.
+    Exports complete after `export_polls` status queries and download as `export_rows` rows.
+    """
+
+    def __init__(self, wsdl=DEFAULT_WSDL, records=10000, page_size=2000, latency=0.0, throttle_every=0,
+                 export_rows=100000, export_polls=1):
+        """
+        :param wsdl: WSDL the records' fields and types are taken from
+        :param records: Records each query returns
+        :param page_size: Most records per query or queryMore page
+        :param latency: Seconds each request waits before it is answered
+        :param throttle_every: Answer every nth SOAP call with a REQUEST_EXCEEDED_LIMIT fault (0 never)
+        :param export_rows: Rows in each export file
+        :param export_polls: Status queries before an export completes
+        """
+        self.codec = SoapCodec.for_wsdl(wsdl_url(wsdl))
+        self.records = records
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.export_rows = export_rows
+        self.export_polls = export_polls
+        self.calls = 0
+        self.exports = {}  # Id: [query, polls]
+        self.__ids = itertools.count(10 ** 9)
+
+    def __call__(self, environ, start_response):
+        if self.latency:
+            gevent.sleep(self.latency)
+        if environ['REQUEST_METHOD'] == 'GET' and environ['PATH_INFO'].startswith('/apps/api/file/'):
+            return self.download(environ['PATH_INFO'].rsplit('/', 1)[1], start_response)
+
+        envelope = ElementTree.fromstring(environ['wsgi.input'].read())
+        header = envelope.find('{%s}Header' % SOAP_ENV)
+        request = envelope.find('{%s}Body' % SOAP_ENV)[0]
+        operation = local_name(request.tag)
+        self.calls += 1
+        if self.throttle_every and operation != 'login' and self.calls % self.throttle_every == 0:
+            return self.fault(start_response, 'REQUEST_EXCEEDED_LIMIT', 'Request limit exceeded')
+
+        handler = getattr(self, 'soap_%s' % operation, None)
+        if handler is None:
+            return self.fault(start_response, 'INVALID_VALUE', 'Operation %s is not supported' % operation)
+        try:
+            result = handler(request, header, environ)
+        except ValueError as e:
+            return self.fault(start_response, 'MALFORMED_QUERY', str(e))
+        return self.respond(start_response, '200 OK', '<ns1:%sResponse>%s</ns1:%sResponse>' %
+                            (operation, result, operation))
+
+    def respond(self, start_response, status, body):
+        content = ENVELOPE % body
+        start_response(status, [('Content-Type', 'text/xml; charset=utf-8'), ('Content-Length', str(len(content)))])
+        return [content]
+
+    def fault(self, start_response, code, message):
+        return self.respond(start_response, '500 Internal Server Error',
+                            FAULT % {'code': code, 'message': escape(message)})
+
+    # Operations
+    def soap_login(self, request, header, environ):
+        server_url = 'http://%s%s' % (environ['HTTP_HOST'], SERVICE_PATH)
+        return ('<ns1:result><ns1:ServerUrl>%s</ns1:ServerUrl><ns1:Session>mock-session-%s</ns1:Session>'
+                '</ns1:result>' % (escape(server_url), next(self.__ids)))
+
+    def soap_query(self, request, header, environ):
+        query_string = request.findtext('{%s}queryString' % ZNS)
+        match = QUERY_PATTERN.match(query_string or '')
+        if match is None:
+            raise ValueError("Cannot parse query: %s" % query_string)
+        select_list, z_object, conditions = match.groups()
+        fields = self.field_names(z_object, [field.strip() for field in select_list.split(',')])
+        ids = ID_CONDITION.findall(conditions or '')
+        if z_object.lower() == 'export':
+            return self.export_status(fields, ids)
+        page_size = self.page_size
+        batch_size = header.findtext('.//{%s}batchSize' % ZNS) if header is not None else None
+        if batch_size:
+            page_size = min(page_size, int(batch_size))
+        return self.page(z_object, fields, ids or None, 0, page_size)
+
+    def soap_queryMore(self, request, header, environ):
+        z_object, names, offset, page_size = request.findtext('{%s}queryLocator' % ZNS).split('|')
+        return self.page(z_object, self.field_names(z_object, names.split(',')), None, int(offset), int(page_size))
+
+    def page(self, z_object, fields, ids, offset, page_size):
+        total = len(ids) if ids is not None else self.records
+        end = min(offset + page_size, total)
+        records = []
+        for index in xrange(offset, end):
+            records.append(self.record(z_object, fields, index, ids[index] if ids is not None else None))
+        if end < total:
+            locator = '<ns1:queryLocator>%s|%s|%s|%s</ns1:queryLocator>' % (
+                z_object, ','.join(name for name, xsd_type in fields), end, page_size)
+            done = 'false'
+        else:
+            locator = ''
+            done = 'true'
+        return '<ns1:result><ns1:done>%s</ns1:done>%s%s<ns1:size>%s</ns1:size></ns1:result>' % (
+            done, locator, ''.join(records), total)
+
+    def record(self, z_object, fields, index, id_value=None, values=None):
+        parts = ['<ns1:records xsi:type="ns2:%s">' % z_object]
+        for name, xsd_type in fields:
+            if values is not None:
+                value = values.get(name)
+                if value is None:
+                    continue
+            elif name == 'Id':
+                value = id_value or record_id(index)
+            else:
+                value = sample_value(xsd_type, name, index)
+            parts.append('<ns2:%s>%s</ns2:%s>' % (name, escape(unicode(value).encode('utf-8')), name))
+        parts.append('</ns1:records>')
+        return ''.join(parts)
+
+    def field_names(self, z_object, names):
+        """
+        The WSDL name and XSD type of each field of z_object in a select list (names are case insensitive)
+        """
+        type_name = self.codec.object_type(z_object)
+        wsdl_fields = self.codec.fields(type_name) if type_name is not None else {}
+        by_name = dict((name.lower(), field) for name, field in wsdl_fields.items())
+        fields = []
+        for name in names:
+            field = by_name.get(name.lower())
+            if field is None:
+                fields.append((name, 'string'))
+                continue
+            namespace, xsd_type = self.codec.simple_base(field.type)
+            fields.append((field.name, xsd_type if namespace == XSD else 'string'))
+        return fields
+
+    def export_status(self, fields, ids):
+        records = []
+        for index, export_id in enumerate(ids):
+            export = self.exports.get(export_id)
+            if export is None:
+                continue
+            export[1] += 1
+            values = {
+                'Id': export_id,
+                'Status': 'Completed' if export[1] >= self.export_polls else 'Processing',
+                'FileId': export_id,
+                'Query': export[0],
+                'Size': self.export_rows,
+            }
+            records.append(self.record('Export', fields, index, values=values))
+        return '<ns1:result><ns1:done>true</ns1:done>%s<ns1:size>%s</ns1:size></ns1:result>' % (
+            ''.join(records), len(records))
+
+    def soap_create(self, request, header, environ):
+        results = []
+        for z_object in request.findall('{%s}zObjects' % ZNS):
+            new_id = record_id(next(self.__ids))
+            if local_name(z_object.get(XSI_TYPE, '')).split(':')[-1] == 'Export':
+                self.exports[new_id] = [z_object.findtext('{%s}Query' % ONS), 0]
+            results.append('<ns1:result><ns1:Id>%s</ns1:Id><ns1:Success>true</ns1:Success></ns1:result>' % new_id)
+        return ''.join(results)
+
+    def soap_update(self, request, header, environ):
+        return ''.join('<ns1:result><ns1:Id>%s</ns1:Id><ns1:Success>true</ns1:Success></ns1:result>' %
+                       escape(z_object.findtext('{%s}Id' % ONS) or '')
+                       for z_object in request.findall('{%s}zObjects' % ZNS))
+
+    def soap_delete(self, request, header, environ):
+        return ''.join('<ns1:result><ns1:id>%s</ns1:id><ns1:success>true</ns1:success></ns1:result>' %
+                       escape(element.text or '') for element in request.findall('{%s}ids' % ZNS))
+
+    # Export files
+    def download(self, file_id, start_response):
+        export = self.exports.get(file_id)
+        if export is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return ['Not found']
+        match = QUERY_PATTERN.match(export[0] or '')
+        z_object = match.group(2)
+        names = [name.strip() for name in match.group(1).split(',')]
+        fields = self.field_names(z_object, [name.split('.')[-1] for name in names])
+        columns = [name if '.' in name else '%s.%s' % (z_object, field[0]) for name, field in zip(names, fields)]
+        start_response('200 OK', [('Content-Type', 'text/csv')])
+        return self.iter_csv(columns, fields)
+
+    def iter_csv(self, columns, fields, rows_per_chunk=1000):
+        yield ','.join(columns) + '\n'
+        lines = []
+        for index in xrange(self.export_rows):
+            lines.append(','.join(record_id(index) if name == 'Id' else sample_value(xsd_type, name, index)
+                                  for name, xsd_type in fields))
+            if len(lines) >= rows_per_chunk:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+
+def serve(connection, options):
+    gevent.reinit()
+    server = WSGIServer(('127.0.0.1', 0), MockZuora(**options), log=None)
+    server.start()
+    connection.send(server.server_port)
+    server.serve_forever()
+
+
+class MockServer(object):
+    """
+    Runs a MockZuora in a child process.
+
+        with MockServer(records=50000) as server:
+            client.set_endpoint(server.endpoint)
+    """
+
+    def __init__(self, **options):
+        """
+        :param options: MockZuora options
+        """
+        self.options = options
+        self.process = None
+        self.url = None
+
+    @property
+    def endpoint(self):
+        """
+        The SOAP endpoint, for Zuora.set_endpoint
+        """
+        return self.url + SERVICE_PATH
+
+    def start(self):
+        parent, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=serve, args=(child, self.options))
+        self.process.daemon = True
+        self.process.start()
+        if not parent.poll(60):
+            self.stop()
+            raise RuntimeError("Mock Zuora server did not start")
+        self.url = 'http://127.0.0.1:%s' % parent.recv()
+        logger.info("Mock Zuora server listening on %s" % self.url)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
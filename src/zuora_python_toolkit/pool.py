@@ -0,0 +1,142 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Zuora clients for many tenants in one process.
+
+A ClientPool keeps one client per tenant, made on first use from the pool's options and the
+tenant's own (username, password and any other Zuora option):
+
+    pool = ClientPool(wsdl='zuora.a.63.0.wsdl', fast_soap=True)
+    pool.register('acme', username='api@acme.com', password='...')
+    pool.register('initech', username='api@initech.com', password='...')
+    accounts = pool.run(lambda client: client.query("SELECT Id FROM Account"))
+
+The WSDL is parsed once per pool: every client clones the same suds Client, so only its
+options (endpoint, SOAP headers, credentials) are its own.  Connections come from the
+process-wide keep-alive pool, while sessions, HTTP cookies, Governors and batch settings stay
+per tenant.
+"""
+import logging
+
+from gevent.lock import Semaphore
+from gevent.pool import Pool
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger(__package__)
+
+DEFAULT_CONCURRENCY = 10
+
+
+class ClientPool(object):
+    """
+    Clients for registered tenants, sharing one parsed WSDL
+    """
+
+    def __init__(self, client_class=Zuora, transport_factory=None, concurrency=DEFAULT_CONCURRENCY, **options):
+        """
+        :param client_class: Zuora or a subclass (e.g. ZuoraExport)
+        :param transport_factory: Called for a new suds Transport per client, defaults to Zuora's PooledTransport
+        :param concurrency: Tenants run() calls at the same time
+        :param options: Zuora options for every client, at least 'wsdl'
+        """
+        if 'wsdl' not in options:
+            raise ValueError("A ClientPool needs a wsdl")
+        if 'transport' in options:
+            raise ValueError("Clients cannot share a transport, use transport_factory")
+        self.client_class = client_class
+        self.transport_factory = transport_factory
+        self.concurrency = concurrency
+        self.options = options
+        self.__prototype = None
+        self.__tenants = {}
+        self.__clients = {}
+        self.__lock = Semaphore()
+
+    @property
+    def prototype(self):
+        """
+        The suds Client every client of the pool clones, parsed on first use
+        """
+        if self.__prototype is None:
+            with self.__lock:
+                if self.__prototype is None:
+                    self.__prototype = self.client_class(**self.options).client
+        return self.__prototype
+
+    def register(self, tenant, **options):
+        """
+        Add a tenant, or replace its options (its client is made again on next use)
+
+        :param tenant: Any hashable key for the tenant
+        :param options: Zuora options for the tenant, such as username and password
+        """
+        self.__tenants[tenant] = options
+        self.__clients.pop(tenant, None)
+
+    def remove(self, tenant):
+        self.__tenants.pop(tenant, None)
+        self.__clients.pop(tenant, None)
+
+    def client(self, tenant):
+        """
+        The tenant's client
+        """
+        client = self.__clients.get(tenant)
+        if client is None:
+            if tenant not in self.__tenants:
+                raise ZuoraError("Unknown tenant %s" % (tenant,))
+            options = dict(self.options)
+            options.update(self.__tenants[tenant])
+            options['suds_client'] = self.prototype
+            if self.transport_factory is not None:
+                options['transport'] = self.transport_factory()
+            client = self.__clients[tenant] = self.client_class(**options)
+        return client
+
+    def __getitem__(self, tenant):
+        return self.client(tenant)
+
+    def __contains__(self, tenant):
+        return tenant in self.__tenants
+
+    def __len__(self):
+        return len(self.__tenants)
+
+    @property
+    def tenants(self):
+        return list(self.__tenants)
+
+    def run(self, f, tenants=None):
+        """
+        Call f(client) for each tenant, concurrency tenants at a time.
+
+        :param tenants: Tenants to run for, defaults to all of them
+        :return: dict of tenant to f's result, or to the exception f raised
+        """
+        tenants = self.tenants if tenants is None else tenants
+
+        def run_one(tenant):
+            try:
+                return tenant, f(self.client(tenant))
+            except Exception as e:
+                logger.error("Tenant %s failed: %s" % (tenant, e))
+                return tenant, e
+        return dict(Pool(self.concurrency).imap_unordered(run_one, tenants))
+
+    def warm_up(self, login=False):
+        """
+        Parse the WSDL and make every tenant's client now, see Zuora.warm_up
+
+        :param login: Log every tenant in too (concurrently)
+        :return: dict of tenant to the client, or to the exception raised logging it in
+        """
+        self.prototype
+        return self.run(lambda client: client.warm_up(login=login))
+
+    def clear(self):
+        """
+        Drop every tenant's client (but not the tenants)
+        """
+        self.__clients.clear()
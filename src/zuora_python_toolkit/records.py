@@ -0,0 +1,216 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Compact records for large query results and exports.
+
+A Row is a tuple with attribute access to its fields; the field names are stored once, on
+its class, which is shared by every row with the same type and fields.  A Page holds the
+rows of one query page and can be read column by column without copying the rows.
+"""
+from collections import OrderedDict, Sequence
+from operator import itemgetter
+import csv
+import logging
+import re
+
+logger = logging.getLogger(__package__)
+
+# Row classes, keyed on (type, fields)
+_row_classes = {}
+
+
+def attribute_name(field):
+    """
+    The attribute a field is read with, e.g. Account.Name (an export column) is Account_Name
+    """
+    return re.sub(r'\W', '_', field)
+
+
+class Row(tuple):
+    """
+    A record as a tuple of its field values, see row_class.  Fields a row does not have
+    (such as nulls Zuora left out) are None.
+    """
+    __slots__ = ()
+    _fields = ()
+    type = None
+
+    def get(self, field, default=None):
+        try:
+            return self[self._index[field]]
+        except (KeyError, IndexError):
+            return default
+
+    def _asdict(self):
+        return OrderedDict(zip(self._fields, self))
+
+    def __reduce__(self):
+        return make_row, (self.type, self._fields, tuple(self))
+
+    def __repr__(self):
+        return '%s(%s)' % (self.type, ', '.join('%s=%r' % item for item in zip(self._fields, self)))
+
+
+def row_class(type_name, fields):
+    """
+    The Row class for a record type and fields (in order), created the first time it is needed.
+    """
+    fields = tuple(fields)
+    key = (type_name, fields)
+    cls = _row_classes.get(key)
+    if cls is None:
+        namespace = {
+            '__slots__': (),
+            '_fields': fields,
+            '_index': dict((field, i) for i, field in enumerate(fields)),
+            'type': type_name,
+        }
+        for i, field in enumerate(fields):
+            namespace[attribute_name(field)] = property(itemgetter(i))
+        cls = _row_classes[key] = type(str(attribute_name(type_name or 'Row')), (Row,), namespace)
+    return cls
+
+
+def make_row(type_name, fields, values):
+    return row_class(type_name, fields)(values)
+
+
+def record_fields(record):
+    """
+    The (name, value) pairs set on a suds object, Record or Row
+    """
+    if isinstance(record, Row):
+        return zip(record._fields, record)
+    if isinstance(record, dict):
+        return record.items()
+    return [(name, value) for name, value in record if value is not None]
+
+
+def select_fields(query_string):
+    """
+    The fields in the SELECT list of a ZOQL query, e.g. ['Id', 'Name']
+    """
+    match = re.match(r'\s*select\s+(.*?)\s+from\s', query_string or '', re.IGNORECASE | re.DOTALL)
+    if match is None:
+        return []
+    return [field.strip() for field in match.group(1).split(',') if field.strip()]
+
+
+class RowFactory(object):
+    """
+    Turns the records of one query into Rows that share a class.
+
+    The fields start as the SELECT list; any other field Zuora returns is appended (rows made
+    before that keep the shorter class).
+    """
+
+    def __init__(self, fields=()):
+        self.fields = list(fields)
+        self.__positions = dict((field, i) for i, field in enumerate(self.fields))
+        self.__classes = {}
+
+    def row(self, record):
+        """
+        Convert a suds object or Record to a Row
+        """
+        type_name = getattr(record, 'type', None) or record.__class__.__name__
+        values = [None] * len(self.fields)
+        for name, value in record_fields(record):
+            position = self.__positions.get(name)
+            if position is None:
+                position = self.__positions[name] = len(self.fields)
+                self.fields.append(name)
+                values.append(None)
+            values[position] = value
+        cls = self.__classes.get(type_name)
+        if cls is None or len(cls._fields) != len(self.fields):
+            cls = self.__classes[type_name] = row_class(type_name, self.fields)
+        return cls(values)
+
+    def page(self, records):
+        """
+        Convert a page of records to a Page
+        """
+        rows = [self.row(record) for record in records]
+        return Page(self.fields, rows)
+
+
+class Column(Sequence):
+    """
+    One field of a Page's rows, read from the rows as it is indexed (the rows are not copied).
+    """
+
+    def __init__(self, rows, index):
+        self.rows = rows
+        self.index = index
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self)))]
+        row = self.rows[i]
+        return row[self.index] if self.index < len(row) else None
+
+    def __iter__(self):
+        index = self.index
+        for row in self.rows:
+            yield row[index] if index < len(row) else None
+
+
+class Page(object):
+    """
+    A page of Rows with the same fields.  `records` holds the rows, so util.query_records
+    works on Pages as it does on QueryResults.
+    """
+    __slots__ = ('fields', 'records')
+
+    def __init__(self, fields, records):
+        self.fields = tuple(fields)
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, i):
+        return self.records[i]
+
+    @property
+    def size(self):
+        return len(self.records)
+
+    def column(self, field):
+        """
+        A zero-copy view of one field of every row
+        """
+        return Column(self.records, self.fields.index(field))
+
+    def columns(self):
+        """
+        Zero-copy views of every field, by field name
+        """
+        return OrderedDict((field, Column(self.records, i)) for i, field in enumerate(self.fields))
+
+
+def iter_csv_rows(lines, type_name='Row'):
+    """
+    Read CSV lines (with a header line) as Rows.  Like csv.DictReader, but the column names
+    are stored once rather than in every row, and like it empty lines are skipped.
+    """
+    reader = csv.reader(lines)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
+    cls = row_class(type_name, header)
+    width = len(header)
+    for values in reader:
+        if not values:
+            continue
+        if len(values) < width:
+            values = values + [None] * (width - len(values))
+        yield cls(values)
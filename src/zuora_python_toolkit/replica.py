@@ -0,0 +1,243 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+A local replica of Zuora objects in SQLite, for lookups and joins without going back to Zuora.
+
+Each object has a table named after it with a column per field, added as fields are first
+seen.  Id is the primary key, and foreign keys (fields named like AccountId or SubscriptionId)
+are indexed, so keyed lookups and joins across objects use the indexes:
+
+    store = SqliteStore('replica.db')
+    zuora.download_to_store(zuora.export('Subscription', fields), store, 'Subscription')
+    store.find('Subscription', AccountId=account_id)
+    store.sql('SELECT a.Name, s.Name FROM Account a JOIN Subscription s ON s.AccountId = a.Id')
+
+SqliteStore can also be the store of an IncrementalSync (it has the same upsert, get, count
+and close as sync.ShelfStore), so the replica is kept up to date incrementally.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+import logging
+import re
+import sqlite3
+
+from zuora_python_toolkit.records import record_fields
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger(__package__)
+
+# Fields pointing at another object, which get an index
+FOREIGN_KEY_PATTERN = re.compile(r'^\w+Id$')
+
+# Foreign keys that are seldom looked up
+UNINDEXED_FIELDS = ('CreatedById', 'UpdatedById')
+
+# Ids per lookup of the stored records of a batch (SQLite allows 999 parameters)
+LOOKUP_SIZE = 500
+
+
+def quote(name):
+    """
+    A table or column name quoted for SQLite
+    """
+    return '"%s"' % name.replace('"', '""')
+
+
+def storable(value):
+    """
+    A field value as stored: dates and times as ISO 8601 text, decimals as text, booleans as 0 or 1
+    """
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, long, float, unicode)) or value is None:
+        return value
+    return unicode(str(value), 'utf-8')
+
+
+def column_name(column, z_object):
+    """
+    The field for an export column: Account.Name is Name in an Account export, and
+    Account.Id is AccountId in the export of another object.
+    """
+    if '.' not in column:
+        return column
+    prefix, field = column.split('.', 1)
+    if prefix == z_object:
+        return field
+    if field == 'Id':
+        return '%sId' % prefix
+    return column
+
+
+class SqliteStore(object):
+    """
+    Records by object and Id in a SQLite file, see the module documentation
+    """
+
+    def __init__(self, filename, timeout=30):
+        """
+        :param filename: SQLite file, or ':memory:'
+        :param timeout: Seconds to wait for another process's lock
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename, timeout=timeout)
+        self.connection.row_factory = sqlite3.Row
+        self.__columns = {}
+
+    def columns(self, z_object):
+        """
+        The columns of z_object's table (creating the table)
+        """
+        columns = self.__columns.get(z_object)
+        if columns is None:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS %s (Id TEXT PRIMARY KEY)" % quote(z_object))
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(%s)" % quote(z_object))]
+            columns = self.__columns[z_object] = set(columns)
+        return columns
+
+    def add_columns(self, z_object, names):
+        columns = self.columns(z_object)
+        for name in names:
+            if name in columns:
+                continue
+            self.connection.execute("ALTER TABLE %s ADD COLUMN %s" % (quote(z_object), quote(name)))
+            columns.add(name)
+            if FOREIGN_KEY_PATTERN.match(name) and name not in UNINDEXED_FIELDS:
+                self.index(z_object, name)
+
+    def index(self, z_object, column):
+        """
+        Index a column (foreign keys are indexed when they are added)
+        """
+        self.columns(z_object)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" %
+                                (quote('%s_%s' % (z_object, column)), quote(z_object), quote(column)))
+
+    def get(self, z_object, record_id):
+        """
+        The stored record with this Id as a dict of its fields, or None
+        """
+        rows = self.stored(z_object, [str(record_id)])
+        return rows.get(str(record_id))
+
+    def count(self, z_object):
+        self.columns(z_object)
+        return self.connection.execute("SELECT COUNT(*) FROM %s" % quote(z_object)).fetchone()[0]
+
+    def stored(self, z_object, ids):
+        """
+        The stored records with these Ids, as a dict of Id to the record's fields
+        """
+        self.columns(z_object)
+        stored = {}
+        for offset in xrange(0, len(ids), LOOKUP_SIZE):
+            shard = ids[offset:offset + LOOKUP_SIZE]
+            query = "SELECT * FROM %s WHERE Id IN (%s)" % (quote(z_object), ", ".join("?" * len(shard)))
+            for row in self.connection.execute(query, shard):
+                values = dict((name, value) for name, value in zip(row.keys(), row) if value is not None)
+                stored[values['Id']] = values
+        return stored
+
+    def upsert(self, z_object, records):
+        """
+        Merge records into the store.  A record replaces the stored one with the same Id unless
+        the stored one has a later UpdatedDate.
+
+        :param records: suds objects, Records, Rows or dicts, with an Id
+        :return: number of records inserted or changed
+        :raise ZuoraError: if a record has no Id
+        """
+        merged = {}
+        for record in records:
+            values = dict((name, storable(value)) for name, value in record_fields(record) if value is not None)
+            if not values.get('Id'):
+                raise ZuoraError("Cannot store a %s without an Id: %s" % (z_object, values))
+            values['Id'] = str(values['Id'])
+            merged[values['Id']] = values
+        if not merged:
+            return 0
+
+        stored = self.stored(z_object, merged.keys())
+        changes = {}
+        for key, values in merged.items():
+            previous = stored.get(key)
+            if previous is not None:
+                if previous == values:
+                    continue
+                if values.get('UpdatedDate') and previous.get('UpdatedDate') and \
+                        previous['UpdatedDate'] > values['UpdatedDate']:
+                    continue
+            changes.setdefault(tuple(sorted(values)), []).append(values)
+
+        with self.connection:
+            for names, rows in changes.items():
+                self.add_columns(z_object, names)
+                query = "INSERT OR REPLACE INTO %s (%s) VALUES (%s)" % (
+                    quote(z_object), ", ".join(quote(name) for name in names), ", ".join("?" * len(names)))
+                self.connection.executemany(query, [[row[name] for name in names] for row in rows])
+        return sum(len(rows) for rows in changes.values())
+
+    def load(self, z_object, rows, batch_size=5000):
+        """
+        Merge the rows of an export download (dicts or Rows, see ZuoraExport.download) or of a
+        query into the store, batch_size rows at a time.  Rows without an Id are skipped.
+
+        :return: number of records inserted or changed
+        """
+        changed = 0
+        skipped = 0
+        batch = []
+        for row in rows:
+            values = dict((column_name(name, z_object), value) for name, value in record_fields(row)
+                          if value not in (None, ''))
+            if 'Id' not in values:
+                skipped += 1
+                continue
+            batch.append(values)
+            if len(batch) >= batch_size:
+                changed += self.upsert(z_object, batch)
+                batch = []
+        if batch:
+            changed += self.upsert(z_object, batch)
+        if skipped:
+            logger.warning("Skipped %s %s rows without an Id" % (skipped, z_object))
+        logger.info("Loaded %s: %s changed, %s stored" % (z_object, changed, self.count(z_object)))
+        return changed
+
+    def find(self, z_object, **conditions):
+        """
+        The stored records whose fields equal the conditions, e.g. find('Subscription', AccountId=...)
+
+        :return: list of dicts
+        """
+        columns = self.columns(z_object)
+        for name in conditions:
+            if name not in columns:
+                return []
+        query = "SELECT * FROM %s" % quote(z_object)
+        if conditions:
+            query += " WHERE %s" % " AND ".join("%s = ?" % quote(name) for name in conditions)
+        return self.sql(query, [storable(value) for value in conditions.values()])
+
+    def sql(self, query, parameters=()):
+        """
+        Run a SQL query (e.g. a join) over the replica's tables
+
+        :return: list of dicts, without null columns
+        """
+        return [dict((name, value) for name, value in zip(row.keys(), row) if value is not None)
+                for row in self.connection.execute(query, parameters)]
+
+    def close(self):
+        self.connection.close()
+        self.__columns.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
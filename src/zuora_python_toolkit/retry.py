@@ -0,0 +1,161 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Retries of failed SOAP calls and replays of records Zuora rejected for transient reasons.
+
+Failures are classified as fatal, retryable (Zuora did not apply the call, so sending it again
+is always safe) or ambiguous (the call may have been applied, e.g. the response timed out).
+Ambiguous failures are only retried for idempotent operations, so a create or amend is never
+sent twice unless Zuora said the first one failed.  Throttle faults are left to the Governor.
+"""
+import errno
+import httplib
+import logging
+import random
+import socket
+
+import gevent
+
+from zuora_python_toolkit.lazy import lazy_import
+from zuora_python_toolkit.metrics import NULL
+from zuora_python_toolkit.util import fault_code
+
+requests_exceptions = lazy_import('requests.exceptions')
+suds = lazy_import('suds')
+suds_transport = lazy_import('suds.transport')
+
+logger = logging.getLogger(__package__)
+
+FATAL = 'fatal'
+RETRYABLE = 'retryable'
+AMBIGUOUS = 'ambiguous'
+
+# Fault and error codes for transient failures, after which nothing was applied
+RETRYABLE_CODES = ('LOCK_COMPETITION', 'SERVER_UNAVAILABLE', 'TEMPORARY_ERROR', 'TRANSACTION_FAILED',
+                   'TRANSACTION_TERMINATED')
+
+# Fault codes for transient failures after which the call may have been applied
+AMBIGUOUS_CODES = ('TRANSACTION_TIMEOUT', 'UNKNOWN_ERROR')
+
+# Operations that can safely be applied twice
+IDEMPOTENT_OPERATIONS = ('update', 'delete', 'query', 'queryMore')
+
+# HTTP statuses from proxies and load balancers: 503 was refused, 502 and 504 may have been applied
+REFUSED_STATUSES = (503,)
+AMBIGUOUS_STATUSES = (502, 504)
+
+
+def classify(exception, retryable_codes=RETRYABLE_CODES, ambiguous_codes=AMBIGUOUS_CODES):
+    """
+    Is a failed call FATAL, RETRYABLE (not applied) or AMBIGUOUS (may have been applied)?
+    """
+    if isinstance(exception, suds.WebFault):
+        return classify_code(fault_code(exception), retryable_codes, ambiguous_codes)
+    if isinstance(exception, suds_transport.TransportError):
+        if exception.httpcode in REFUSED_STATUSES:
+            return RETRYABLE
+        if exception.httpcode in AMBIGUOUS_STATUSES:
+            return AMBIGUOUS
+        return FATAL
+    if isinstance(exception, requests_exceptions.Timeout):
+        return AMBIGUOUS
+    if isinstance(exception, requests_exceptions.ConnectionError):
+        # requests wraps every socket error, refused connections are the ones where nothing was sent
+        cause = exception.args[0] if exception.args else None
+        return RETRYABLE if refused(getattr(cause, 'reason', cause)) else AMBIGUOUS
+    if refused(exception):
+        return RETRYABLE
+    if isinstance(exception, (socket.error, httplib.HTTPException)):
+        return AMBIGUOUS
+    return classify_code(fault_code(exception), retryable_codes, ambiguous_codes)
+
+
+def classify_code(code, retryable_codes=RETRYABLE_CODES, ambiguous_codes=AMBIGUOUS_CODES):
+    if code in retryable_codes:
+        return RETRYABLE
+    if code in ambiguous_codes:
+        return AMBIGUOUS
+    return FATAL
+
+
+def refused(exception):
+    """
+    Was a connection refused (so the request was never sent)?
+    """
+    if isinstance(exception, socket.error) and exception.errno == errno.ECONNREFUSED:
+        return True
+    return 'connection refused' in str(exception).lower()
+
+
+def error_code(error):
+    return str(getattr(error, 'Code', None) or getattr(error, 'code', None) or '')
+
+
+class RetryPolicy(object):
+    """
+    How often and how long to wait before sending a failed call again.
+
+    Waits grow exponentially from base_seconds up to max_seconds and are jittered, so that
+    greenlets that failed together do not retry together.
+    """
+
+    def __init__(self, max_attempts=4, base_seconds=1.0, max_seconds=30.0, jitter=0.5,
+                 retryable_codes=RETRYABLE_CODES, ambiguous_codes=AMBIGUOUS_CODES):
+        """
+        :param max_attempts: Most times a call (or a record) is sent, including the first
+        :param base_seconds: Wait before the first retry
+        :param max_seconds: Longest wait
+        :param jitter: Fraction of each wait that is random
+        :param retryable_codes: Fault and error codes of transient failures
+        :param ambiguous_codes: Fault codes of transient failures that may have been applied, so
+                                they are only retried for idempotent calls
+        """
+        if max_attempts < 1:
+            raise ValueError("Attempts must be greater than 0")
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.jitter = jitter
+        self.retryable_codes = retryable_codes
+        self.ambiguous_codes = ambiguous_codes
+
+    def delay(self, attempt):
+        """
+        Seconds to wait before sending for the attempt+1th time
+        """
+        seconds = min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1))
+        return seconds * (1 - self.jitter * random.random())
+
+    def retryable(self, exception, idempotent=False):
+        kind = classify(exception, self.retryable_codes, self.ambiguous_codes)
+        return kind == RETRYABLE or (kind == AMBIGUOUS and idempotent)
+
+    def replayable(self, errors):
+        """
+        Did Zuora reject a record only for transient reasons (so it can be sent again)?
+
+        :param errors: The record's errors, as listed in a BatchFailure
+        """
+        return len(errors) > 0 and all(error_code(error) in self.retryable_codes for error in errors)
+
+    def call(self, f, args=(), idempotent=False, instrumentation=NULL, labels=None):
+        """
+        Call f(*args), retrying retryable failures.
+
+        :param idempotent: Whether f can safely be applied twice, so ambiguous failures are retried too
+        :param instrumentation: metrics.Instrumentation counting the retries
+        :param labels: Labels for the retry counter
+        """
+        attempt = 1
+        while True:
+            try:
+                return f(*args)
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.retryable(e, idempotent):
+                    raise
+                wait = self.delay(attempt)
+                logger.info("Call failed (%s), attempt %s of %s in %.2f seconds" %
+                            (e, attempt + 1, self.max_attempts, wait))
+                instrumentation.increment('retries', reason=fault_code(e) or e.__class__.__name__, **(labels or {}))
+            attempt += 1
+            gevent.sleep(wait)
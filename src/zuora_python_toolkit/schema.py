@@ -0,0 +1,190 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Precompiled WSDL schemas.
+
+Parsing the Zuora WSDL is the slowest part of creating a client.  SchemaCache stores the parsed
+suds Definitions as a pickle keyed on the WSDL's contents, the suds version and the toolkit's
+schema version, so each WSDL is parsed once and then loaded from the artifact.
+
+Loading a pickle runs code, so the compiled schemas are kept in a per-user directory
+(~/.cache/zuora_python_toolkit by default, created with mode 0700), and a schema is only
+loaded when it and its directory belong to the current user and nobody else can write to them.
+
+Schemas can be compiled ahead of time (for example when building an image) with:
+
+    python -m zuora_python_toolkit.schema [--location DIR] path/to/zuora.a.63.0.wsdl ...
+"""
+from datetime import datetime, timedelta
+from os import path
+import argparse
+import cPickle
+import hashlib
+import logging
+import os
+import stat
+import sys
+import urllib2
+
+import suds
+from suds.cache import Cache
+from suds.client import Client
+from suds.xsd.doctor import Import, ImportDoctor
+
+from zuora_python_toolkit.util import wsdl_url
+
+logger = logging.getLogger(__package__)
+
+# Bump when the way the toolkit builds the schema (e.g. the ImportDoctor) changes
+SCHEMA_VERSION = 1
+
+SCHEMA_URL = 'http://object.api.zuora_python_toolkit.com/'
+
+DEFAULT_LOCATION = path.join(os.environ.get('XDG_CACHE_HOME') or path.join(path.expanduser('~'), '.cache'),
+                             'zuora_python_toolkit')
+
+
+def trusted(filename):
+    """
+    Is filename owned by the current user and writable only by them?
+    """
+    info = os.stat(filename)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        return False
+    return not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def schema_doctor():
+    """
+    Fix missing types with ImportDoctor
+    """
+    schema_import = Import(SCHEMA_URL)
+    return ImportDoctor(schema_import)
+
+
+class SchemaCache(Cache):
+    """
+    A suds object cache for parsed WSDL Definitions.
+
+    Only Definitions are cached; the XML documents they are parsed from are not needed once
+    the Definitions are available.
+    """
+    suffix = 'pw'
+
+    def __init__(self, location=None, duration=0):
+        """
+        :param location: Directory for the compiled schemas (defaults to $ZUORA_SCHEMA_CACHE or a
+                         per-user cache directory)
+        :param duration: Seconds before a compiled schema is rebuilt, or 0 to keep it until the WSDL changes
+        """
+        if location is None:
+            location = os.environ.get('ZUORA_SCHEMA_CACHE', DEFAULT_LOCATION)
+        self.location = location
+        self.duration = duration
+
+    def key(self, url):
+        """
+        Cache key for a WSDL url.  Local files are keyed on their contents, so the same
+        WSDL gets the same key wherever it is installed.
+        """
+        digest = hashlib.sha1()
+        digest.update('%s:%s:%s.%s:' % (SCHEMA_VERSION, suds.__version__, sys.version_info[0], sys.version_info[1]))
+        if url.startswith('file://'):
+            with open(urllib2.url2pathname(url[len('file://'):]), 'rb') as f:
+                digest.update(f.read())
+        else:
+            digest.update(url)
+        return digest.hexdigest()
+
+    def filename(self, url):
+        name = path.splitext(path.basename(url))[0]
+        return path.join(self.location, '%s-%s.%s' % (name, self.key(url)[:20], self.suffix))
+
+    def get(self, id):
+        if getattr(id, 'suffix', None) != self.suffix:
+            return None
+        try:
+            fn = self.filename(id.name)
+            if self.duration > 0:
+                created = datetime.fromtimestamp(path.getmtime(fn))
+                if created + timedelta(seconds=self.duration) < datetime.now():
+                    return None
+            if not (trusted(self.location) and trusted(fn)):
+                logger.warning("Not loading compiled schema %s: it or its directory is writable by other users" % fn)
+                return None
+            with open(fn, 'rb') as f:
+                return cPickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            logger.info("Ignoring unreadable compiled schema for %s: %s" % (id.name, e))
+            return None
+
+    def put(self, id, object):
+        if getattr(id, 'suffix', None) != self.suffix:
+            return object
+        try:
+            fn = self.filename(id.name)
+            if not path.isdir(self.location):
+                os.makedirs(self.location, 0700)
+            # Write then rename so other processes never load a partial schema
+            tmp = '%s.%s.tmp' % (fn, os.getpid())
+            with open(tmp, 'wb') as f:
+                cPickle.dump(object, f, cPickle.HIGHEST_PROTOCOL)
+            os.chmod(tmp, 0600)
+            os.rename(tmp, fn)
+            logger.info("Compiled schema for %s written to %s" % (id.name, fn))
+        except Exception as e:
+            logger.info("Unable to write compiled schema for %s: %s" % (id.name, e))
+        return object
+
+    def purge(self, id):
+        try:
+            os.remove(self.filename(id.name))
+        except (IOError, OSError):
+            pass
+
+    def clear(self):
+        if not path.isdir(self.location):
+            return
+        for fn in os.listdir(self.location):
+            if fn.endswith('.' + self.suffix):
+                os.remove(path.join(self.location, fn))
+
+
+def compile_schema(wsdl, location=None):
+    """
+    Parse a WSDL and write its compiled schema.
+
+    :param wsdl: Path or URL of the WSDL
+    :param location: Directory for the compiled schema
+    :return: Path of the compiled schema
+    """
+    url = wsdl_url(wsdl)
+    cache = SchemaCache(location)
+    cache.purge(_SchemaId(url))
+    Client(url=url, cache=cache, doctor=schema_doctor())
+    return cache.filename(url)
+
+
+class _SchemaId(object):
+    # Stands in for suds.reader.ObjectId
+
+    def __init__(self, name):
+        self.name = name
+        self.suffix = SchemaCache.suffix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompile Zuora WSDL files for fast client construction')
+    parser.add_argument('wsdl', nargs='+', help='WSDL files to compile')
+    parser.add_argument('--location', default=None,
+                        help='Directory for the compiled schemas (default $ZUORA_SCHEMA_CACHE or %s)'
+                             % DEFAULT_LOCATION)
+    args = parser.parse_args(argv)
+    for wsdl in args.wsdl:
+        print compile_schema(wsdl, args.location)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import logging
+import weakref
+
+import gevent
+from gevent.lock import Semaphore
+
+logger = logging.getLogger(__package__)
+
+
+def weak_callable(f):
+    """
+    f, holding only a weak reference to the object of a bound method (such as a client's
+    login_to_zuora), so the callable does not keep the object alive.  Calling it once the
+    object is gone raises ReferenceError.
+    """
+    owner = getattr(f, '__self__', None)
+    if owner is None:
+        return f
+    owner = weakref.ref(owner)
+    function = f.__func__
+
+    def call(*args, **kwargs):
+        target = owner()
+        if target is None:
+            raise ReferenceError("The owner of %s is gone" % function.__name__)
+        return function(target, *args, **kwargs)
+    return call
+
+
+class Session(object):
+    """
+    A Zuora session returned by login()
+    """
+
+    def __init__(self, login_result, session_length_millis):
+        self.login_result = login_result
+        self.session_id = login_result['Session']
+        self.server_url = login_result['ServerUrl']
+        self.expires = datetime.now() + timedelta(microseconds=session_length_millis * 1000)
+
+    def alive(self):
+        return datetime.now() < self.expires
+
+
+class SessionManager(object):
+    """
+    Shares one Zuora session between every Zuora instance logged in with the same
+    WSDL and credentials.
+
+    Concurrent logins are deduplicated: callers that find a login already running wait for
+    it and use its session.  A greenlet renews the session refresh_margin_millis before it
+    runs out so that calls do not have to wait for a login.
+
+    The manager only holds weak references to the clients whose login it calls, so the
+    refresh stops once every client using the session is gone (or the manager is closed).
+    """
+
+    # Shared managers, keyed on (wsdl, username, password)
+    __managers = {}
+
+    def __init__(self, login, session_length_millis=600000, refresh_margin_millis=None, refresh=True):
+        """
+        :param login: Callable that logs in to Zuora and returns a LoginResult, such as a
+                      client's login_to_zuora (which is referenced weakly)
+        :param session_length_millis: How long a session may be used for
+        :param refresh_margin_millis: How long before expiry the session is renewed (default 10%)
+        :param refresh: Renew the session in the background
+        """
+        self.login_function = weak_callable(login)
+        self.session_length_millis = session_length_millis
+        self.refresh_margin_millis = refresh_margin_millis
+        self.refresh = refresh
+        self.session = None
+        self.__lock = Semaphore()
+        self.__refresher = None
+
+    @classmethod
+    def for_credentials(cls, wsdl, username, password, login, **kwargs):
+        """
+        Return the manager shared by every client using this WSDL and these credentials,
+        creating it with login and kwargs the first time.
+        """
+        key = (wsdl, username, password)
+        manager = cls.__managers.get(key)
+        if manager is None:
+            manager = cls.__managers[key] = cls(login, **kwargs)
+        return manager
+
+    @classmethod
+    def clear(cls):
+        """
+        Stop and forget every shared manager
+        """
+        for manager in cls.__managers.values():
+            manager.stop()
+        cls.__managers.clear()
+
+    def close(self):
+        """
+        Stop the background refresh, drop the session and stop sharing this manager
+        """
+        self.stop()
+        self.session = None
+        for key, manager in self.__managers.items():
+            if manager is self:
+                del self.__managers[key]
+
+    def current(self):
+        """
+        Return the current session if it is still alive, without logging in.
+        """
+        session = self.session
+        if session is not None and session.alive():
+            return session
+        return None
+
+    def login(self, stale_session_id=None, login=None):
+        """
+        Return a live session, logging in unless another caller already replaced stale_session_id.
+
+        :param stale_session_id: The session the caller holds and wants replaced, if any
+        :param login: The caller's login callable, used from now on (also for the refresh)
+        :return: Session
+        """
+        if login is not None:
+            self.login_function = weak_callable(login)
+        with self.__lock:
+            session = self.current()
+            if session is not None and session.session_id != stale_session_id:
+                return session
+
+            logger.info("Logging in to Zuora")
+            self.session = Session(self.login_function(), self.session_length_millis)
+            self.schedule_refresh()
+            return self.session
+
+    def invalidate(self, session_id):
+        """
+        Drop session_id (for example after an INVALID_SESSION fault) so the next login replaces it.
+        """
+        session = self.session
+        if session is not None and session.session_id == session_id:
+            self.session = None
+
+    def schedule_refresh(self):
+        if not self.refresh:
+            return
+        self.stop()
+        margin = self.refresh_margin_millis
+        if margin is None:
+            margin = self.session_length_millis / 10
+        delay = max(self.session_length_millis - margin, 0) / 1000.0
+        self.__refresher = gevent.spawn_later(delay, self.__refresh)
+
+    def stop(self):
+        """
+        Cancel the background refresh
+        """
+        if self.__refresher is not None:
+            self.__refresher.kill(block=False)
+            self.__refresher = None
+
+    def __refresh(self):
+        self.__refresher = None
+        session = self.session
+        try:
+            self.login(stale_session_id=session.session_id if session is not None else None)
+        except ReferenceError:
+            logger.info("No client is using the Zuora session any more, no longer refreshing it")
+        except Exception as e:
+            logger.error("Unable to refresh Zuora session: %s" % e)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Bulk subscribe: many subscriptions created from a stream of input rows.
+
+Rows are read a window at a time, each built into a SubscribeRequest only when its window is
+sent, and the window is subscribed in batches of up to the client's batch size (50 by
+default, Zuora's limit) through its pool of batch_concurrency greenlets:
+
+    subscriber = BulkSubscribe(zuora)
+    for outcome in subscriber.run(rows):
+        if outcome.success:
+            print outcome.row['Account']['Name'], outcome.account_id, outcome.subscription_id
+        else:
+            print outcome.row['Account']['Name'], outcome.errors
+
+Each SubscribeOutcome carries its input row and index, so results can be matched to the rows
+they came from even when some rows fail.
+"""
+from collections import namedtuple
+from itertools import islice
+import logging
+
+from zuora_python_toolkit.batch import BatchResults
+from zuora_python_toolkit.util import result_errors, result_succeeded
+
+logger = logging.getLogger(__package__)
+
+DEFAULT_WINDOW_SIZE = 1000
+
+# Types of the SubscribeRequest fields that are not named after their type
+FIELD_TYPES = {
+    'BillToContact': 'Contact',
+    'SoldToContact': 'Contact',
+}
+
+# The result of subscribing one input row
+SubscribeOutcome = namedtuple('SubscribeOutcome', ['index', 'row', 'success', 'account_id', 'account_number',
+                                                   'subscription_id', 'subscription_number', 'invoice_id',
+                                                   'invoice_number', 'payment_id', 'errors'])
+
+
+def fill(zuora, z_object, values):
+    """
+    Set the fields of z_object from values, making objects for nested dicts (and lists of dicts)
+
+    :param zuora: Zuora client making the objects
+    :param z_object: suds object (or Record)
+    :param values: dict of field name to value, dict or list of dicts
+    :return: z_object
+    """
+    for name, value in values.items():
+        object_type = FIELD_TYPES.get(name, name)
+        if isinstance(value, dict):
+            child = getattr(z_object, name, None)
+            if child is None:
+                child = zuora.generate_object(object_type, operation='subscribe')
+            value = fill(zuora, child, value)
+        elif isinstance(value, (list, tuple)) and value and isinstance(value[0], dict):
+            value = [fill(zuora, zuora.generate_object(object_type, operation='subscribe'), item) for item in value]
+        setattr(z_object, name, value)
+    return z_object
+
+
+def subscribe_request(zuora, row):
+    """
+    Build a SubscribeRequest from a row of nested dicts, e.g.
+
+        {'Account': {'Name': 'Acme', 'Currency': 'USD', ...},
+         'BillToContact': {'FirstName': 'Ann', ...},
+         'SubscriptionData': {'Subscription': {'ContractEffectiveDate': ..., ...},
+                              'RatePlanData': [{'RatePlan': {'ProductRatePlanId': ...}}]}}
+    """
+    return fill(zuora, zuora.generate_object('SubscribeRequest', operation='subscribe'), row)
+
+
+def outcome(index, row, result, errors=None):
+    """
+    The SubscribeOutcome of a row from its SubscribeResult (None if it was never answered)
+    """
+    if errors is None:
+        errors = result_errors(result)
+    return SubscribeOutcome(
+        index=index,
+        row=row,
+        success=result_succeeded(result),
+        account_id=getattr(result, 'AccountId', None),
+        account_number=getattr(result, 'AccountNumber', None),
+        subscription_id=getattr(result, 'SubscriptionId', None),
+        subscription_number=getattr(result, 'SubscriptionNumber', None),
+        invoice_id=getattr(result, 'InvoiceId', None),
+        invoice_number=getattr(result, 'InvoiceNumber', None),
+        payment_id=getattr(result, 'PaymentId', None),
+        errors=errors,
+    )
+
+
+class BulkSubscribe(object):
+    """
+    Subscribes rows a window at a time through a Zuora client, see the module documentation
+    """
+
+    def __init__(self, zuora, build=subscribe_request, window_size=DEFAULT_WINDOW_SIZE):
+        """
+        :param zuora: Zuora client, its batch size and concurrency apply to the subscribe calls
+        :param build: Called with the client and a row for the row's SubscribeRequest
+        :param window_size: Rows built and sent at a time, which bounds the memory used
+        """
+        if window_size < 1:
+            raise ValueError("Window size must be greater than 0")
+        self.zuora = zuora
+        self.build = build
+        self.window_size = window_size
+
+    def run(self, rows):
+        """
+        Subscribe every row
+
+        :param rows: Iterable of rows (read lazily)
+        :return: generator of SubscribeOutcomes, in the order of the rows
+        """
+        rows = iter(rows)
+        offset = 0
+        while True:
+            window = list(islice(rows, self.window_size))
+            if not window:
+                break
+            for result in self.subscribe(offset, window):
+                yield result
+            offset += len(window)
+
+    def subscribe(self, offset, rows):
+        """
+        Build and subscribe one window of rows
+
+        :param offset: Index of the first row
+        :return: list of SubscribeOutcomes
+        """
+        outcomes = [None] * len(rows)
+        requests = []
+        sent = []
+        for i, row in enumerate(rows):
+            try:
+                requests.append(self.build(self.zuora, row))
+                sent.append(i)
+            except Exception as e:
+                logger.error("Row %s could not be built: %s" % (offset + i, e))
+                outcomes[i] = outcome(offset + i, row, None, [e])
+        if requests:
+            results, failures = self.send(requests)
+            for position, i in enumerate(sent):
+                outcomes[i] = outcome(offset + i, rows[i], results[position], failures.get(position))
+        logger.info("Subscribed rows %s to %s (%s failed)" %
+                    (offset, offset + len(rows) - 1, sum(1 for o in outcomes if not o.success)))
+        return outcomes
+
+    def send(self, requests):
+        """
+        Subscribe requests in batches
+
+        :return: (results, dict of position to errors for requests whose whole call failed)
+        """
+        try:
+            results = self.zuora.subscribe(requests)
+        except Exception as e:
+            logger.error("Subscribe of %s requests failed: %s" % (len(requests), e))
+            return [None] * len(requests), dict((position, [e]) for position in range(len(requests)))
+        if isinstance(results, BatchResults):
+            return results, dict((failure.index, failure.errors) for failure in results.failures
+                                 if results[failure.index] is None)
+        if not isinstance(results, (list, tuple)):
+            results = [results]
+        return results, {}
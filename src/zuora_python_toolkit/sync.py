@@ -0,0 +1,217 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+"""
+Incremental sync of Zuora objects into a local keyed store.
+
+For each object SyncState keeps a high-water mark: the latest UpdatedDate fetched.  The next
+sync only asks for records updated since then, less an overlap to cover clock skew and records
+committed late, and the store merges them by Id so the overlap never duplicates anything.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from os import path
+import json
+import logging
+import os
+import shelve
+
+import gevent
+
+from zuora_python_toolkit.lazy import lazy_import
+from zuora_python_toolkit.records import record_fields
+from zuora_python_toolkit.util import generate_select_list, zoql_datetime
+
+sax_date = lazy_import('suds.sax.date')
+
+logger = logging.getLogger(__package__)
+
+# The result of syncing one object
+SyncResult = namedtuple('SyncResult', ['z_object', 'fetched', 'changed', 'watermark'])
+
+
+class SyncState(object):
+    """
+    High-water marks by object, saved as JSON in filename.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__state = {}
+        if path.isfile(filename):
+            with open(filename) as f:
+                self.__state = json.load(f)
+
+    def watermark(self, z_object):
+        """
+        The latest UpdatedDate synced for z_object, or None if it has not been synced
+        """
+        entry = self.__state.get(z_object)
+        if not entry or not entry.get('watermark'):
+            return None
+        return sax_date.DateTime(str(entry['watermark'])).datetime
+
+    def set_watermark(self, z_object, watermark):
+        self.__state[z_object] = {
+            'watermark': unicode(sax_date.DateTime(watermark)) if watermark is not None else None,
+            'synced': unicode(sax_date.DateTime(datetime.now())),
+        }
+        self.save()
+
+    def reset(self, z_object):
+        """
+        Forget z_object's watermark, so the next sync fetches every record
+        """
+        self.__state.pop(z_object, None)
+        self.save()
+
+    def save(self):
+        # Write then rename so a crash never leaves a partial state file
+        tmp = '%s.%s.tmp' % (self.filename, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.__state, f, indent=2, sort_keys=True)
+        os.rename(tmp, self.filename)
+
+
+class ShelfStore(object):
+    """
+    Records by Id, in a shelve file per object in directory.  Records are stored as dicts.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.__shelves = {}
+        if not path.isdir(directory):
+            os.makedirs(directory)
+
+    def shelf(self, z_object):
+        shelf = self.__shelves.get(z_object)
+        if shelf is None:
+            shelf = self.__shelves[z_object] = shelve.open(path.join(self.directory, '%s.db' % z_object),
+                                                           protocol=2)
+        return shelf
+
+    def get(self, z_object, record_id):
+        return self.shelf(z_object).get(str(record_id))
+
+    def count(self, z_object):
+        return len(self.shelf(z_object))
+
+    def upsert(self, z_object, records):
+        """
+        Merge records into the store.  A record replaces the stored one with the same Id unless
+        the stored one has a later UpdatedDate.
+
+        :return: number of records inserted or changed
+        """
+        shelf = self.shelf(z_object)
+        changed = 0
+        for record in records:
+            values = dict(record_fields(record))
+            key = str(values['Id'])
+            stored = shelf.get(key)
+            if stored is not None:
+                if stored == values:
+                    continue
+                if values.get('UpdatedDate') and stored.get('UpdatedDate') and \
+                        stored['UpdatedDate'] > values['UpdatedDate']:
+                    continue
+            shelf[key] = values
+            changed += 1
+        shelf.sync()
+        return changed
+
+    def close(self):
+        for shelf in self.__shelves.values():
+            shelf.close()
+        self.__shelves.clear()
+
+
+class IncrementalSync(object):
+    """
+    Fetches the records of an object updated since its last sync and merges them into a store.
+
+    The watermark is only advanced once the records are in the store, so an interrupted sync
+    is simply repeated.
+    """
+
+    def __init__(self, zuora, state, store, overlap_seconds=300, batch_size=2000):
+        """
+        :param zuora: Zuora client
+        :param state: SyncState with the watermarks
+        :param store: Store the records are merged into (e.g. ShelfStore)
+        :param overlap_seconds: Seconds before the watermark to fetch again, for clock skew
+        :param batch_size: Records merged into the store at a time
+        """
+        self.zuora = zuora
+        self.state = state
+        self.store = store
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.batch_size = batch_size
+
+    def query(self, z_object, fields, since=None, filters=''):
+        """
+        The ZOQL query for the records of z_object updated since `since`
+
+        :param filters: More ZOQL conditions, joined to the UpdatedDate condition with AND
+        """
+        conditions = []
+        if since is not None:
+            conditions.append("UpdatedDate >= %s" % zoql_datetime(since - self.overlap))
+        if filters:
+            conditions.append(filters)
+        query = "SELECT %s FROM %s" % (generate_select_list(list(fields) + ['UpdatedDate']), z_object)
+        if conditions:
+            query += " WHERE %s" % " AND ".join(conditions)
+        return query
+
+    def sync(self, z_object, fields, filters=''):
+        """
+        Sync one object.
+
+        :param z_object: e.g. Account
+        :param fields: Fields to fetch (Id and UpdatedDate are always fetched)
+        :param filters: More ZOQL conditions
+        :return: SyncResult
+        """
+        since = self.state.watermark(z_object)
+        query = self.query(z_object, fields, since, filters)
+        logger.info("Syncing %s updated since %s" % (z_object, since))
+
+        watermark = since
+        fetched = 0
+        changed = 0
+        batch = []
+        for record in self.zuora.iter_query(query, compact=True):
+            fetched += 1
+            updated = getattr(record, 'UpdatedDate', None)
+            if updated is not None and (watermark is None or updated > watermark):
+                watermark = updated
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                changed += self.store.upsert(z_object, batch)
+                batch = []
+        if batch:
+            changed += self.store.upsert(z_object, batch)
+
+        self.state.set_watermark(z_object, watermark)
+        logger.info("Synced %s: %s fetched, %s changed, watermark %s" % (z_object, fetched, changed, watermark))
+        return SyncResult(z_object, fetched, changed, watermark)
+
+    def sync_many(self, objects):
+        """
+        Sync several objects at once.
+
+        :param objects: dict of z_object to its fields
+        :return: dict of z_object to SyncResult, or to the exception if its sync failed
+        """
+        greenlets = dict((z_object, gevent.spawn(self.sync, z_object, fields))
+                         for z_object, fields in objects.items())
+        gevent.joinall(greenlets.values())
+        results = {}
+        for z_object, greenlet in greenlets.items():
+            if greenlet.successful():
+                results[z_object] = greenlet.value
+            else:
+                logger.error("Sync of %s failed: %s" % (z_object, greenlet.exception))
+                results[z_object] = greenlet.exception
+        return results
@@ -0,0 +1,162 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import gzip
+import httplib
+import unittest
+import logging
+from StringIO import StringIO
+from mock import Mock
+
+import gevent
+from gevent.pywsgi import WSGIServer
+from suds.sudsobject import Object
+from suds.transport import Request, TransportError
+
+from zuora_python_toolkit.async_client import AsyncZuora
+from zuora_python_toolkit.transport import CooperativeTransport, decode_content
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def gzipped(content):
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+class CooperativeTransportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.server = WSGIServer(('127.0.0.1', 0), self.application, log=None)
+        self.server.start()
+        self.url = 'http://127.0.0.1:%s/apps/services/a/63.0' % self.server.server_port
+        self.transport = CooperativeTransport(pool_size=2)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def application(self, environ, start_response):
+        body = environ['wsgi.input'].read()
+        self.requests.append((environ, body))
+        if environ['PATH_INFO'].endswith('/fault'):
+            start_response('500 Internal Server Error', [('Content-Type', 'text/xml')])
+            return ['<soapenv:Fault/>']
+        if environ['PATH_INFO'].endswith('/slow'):
+            gevent.sleep(0.1)
+        if environ['PATH_INFO'].endswith('/hang'):
+            gevent.sleep(0.5)
+        content = gzipped('<soapenv:Envelope>%s</soapenv:Envelope>' % body)
+        start_response('200 OK', [('Content-Type', 'text/xml'), ('Content-Encoding', 'gzip'),
+                                  ('Content-Length', str(len(content)))])
+        return [content]
+
+    def test_send(self):
+        reply = self.transport.send(Request(self.url, '<xml/>'))
+        self.assertEqual(reply.code, 200)
+        self.assertEqual(reply.message, '<soapenv:Envelope><xml/></soapenv:Envelope>')
+        environ = self.requests[0][0]
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(environ['HTTP_ACCEPT_ENCODING'], 'gzip, deflate')
+
+    def test_connection_is_reused(self):
+        self.transport.send(Request(self.url, '<first/>'))
+        self.transport.send(Request(self.url, '<second/>'))
+        self.assertEqual(self.requests[0][0]['REMOTE_PORT'], self.requests[1][0]['REMOTE_PORT'])
+
+    def test_send_fault(self):
+        try:
+            self.transport.send(Request(self.url + '/fault', '<xml/>'))
+            self.fail("TransportError not raised")
+        except TransportError as e:
+            self.assertEqual(e.httpcode, 500)
+            self.assertEqual(e.fp.read(), '<soapenv:Fault/>')
+
+    def test_timeout_on_reused_connection_is_not_resent(self):
+        self.transport.options.timeout = 0.2
+        self.transport.send(Request(self.url, '<login/>'))
+        self.assertRaises(Exception, self.transport.send, Request(self.url + '/hang', '<create/>'))
+        self.assertEqual([body for environ, body in self.requests], ['<login/>', '<create/>'])
+
+    def test_closed_idle_connection_is_resent(self):
+        self.transport.send(Request(self.url, '<login/>'))
+        connection = self.transport.connection('http', '127.0.0.1:%s' % self.server.server_port)[0]
+        # The server closes the idle connection: the request is written but nothing comes back
+        connection.getresponse = Mock(side_effect=httplib.BadStatusLine(
+            "No status line received - the server has closed the connection"))
+        self.transport.release('http', '127.0.0.1:%s' % self.server.server_port, connection)
+        self.assertEqual(self.transport.send(Request(self.url, '<create/>')).code, 200)
+        self.assertEqual(self.requests[-1][1], '<create/>')
+
+    def test_sends_are_concurrent(self):
+        greenlets = [gevent.spawn(self.transport.send, Request(self.url + '/slow', '<xml/>')) for i in range(5)]
+        with gevent.Timeout(0.4):
+            gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual(len(self.requests), 5)
+
+    def test_decode_content(self):
+        self.assertEqual(decode_content(gzipped('abc'), 'gzip'), 'abc')
+        self.assertEqual(decode_content('abc'.encode('zlib'), 'deflate'), 'abc')
+        self.assertEqual(decode_content('abc', ''), 'abc')
+
+
+def query_result(records, done=True, locator=None):
+    result = Object()
+    result.records = records
+    result.size = len(records)
+    result.done = done
+    result.queryLocator = locator
+    return result
+
+
+class AsyncZuoraTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.zuora = Mock()
+        self.client = AsyncZuora(self.zuora)
+
+    def test_calls_return_futures(self):
+        self.zuora.create.return_value = ['created']
+        future = self.client.create(['account'])
+        self.assertIsInstance(future, gevent.Greenlet)
+        self.assertEqual(future.get(), ['created'])
+        self.zuora.create.assert_called_with(['account'])
+
+    def test_errors_are_raised_by_get(self):
+        self.zuora.query.side_effect = IOError("connection reset")
+        self.assertRaises(IOError, self.client.query("SELECT Id FROM Account").get)
+
+    def test_iter_pages(self):
+        self.zuora.query.return_value = query_result(['a', 'b'], done=False, locator='L1')
+        self.zuora.query_more.side_effect = [query_result(['c'], done=False, locator='L2'),
+                                             query_result(['d'])]
+        pages = self.client.iter_pages("SELECT Id FROM Account")
+        first = next(pages)
+        self.assertEqual(first.get().records, ['a', 'b'])
+        # The next page was requested before the caller asked for it
+        gevent.sleep(0)
+        self.zuora.query_more.assert_called_with('L1')
+        self.assertEqual([page.get().records for page in pages], [['c'], ['d']])
+
+    def test_iter_pages_stopped_early_kills_prefetch(self):
+        self.zuora.query.return_value = query_result(['a'], done=False, locator='L1')
+        self.zuora.query_more.side_effect = lambda locator: gevent.sleep(10)
+        spawned = []
+        query_more = self.client.query_more
+        self.client.query_more = lambda locator: spawned.append(query_more(locator)) or spawned[-1]
+        pages = self.client.iter_pages("SELECT Id FROM Account")
+        next(pages)
+        gevent.sleep(0)
+        pages.close()
+        gevent.sleep(0)
+        self.assertTrue(spawned[0].dead)
+
+    def test_iter_records(self):
+        self.zuora.query.return_value = query_result(['a'], done=False, locator='L1')
+        self.zuora.query_more.return_value = query_result(['b'])
+        self.assertEqual(list(self.client.iter_records("SELECT Id FROM Account")), ['a', 'b'])
+
+if __name__ == "__main__":
+    unittest.main()
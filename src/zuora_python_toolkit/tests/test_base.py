@@ -1,10 +1,17 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import re
 import unittest
 import logging
 from mock import Mock, patch
 
+from suds.sax.date import DateTime
+from suds.sudsobject import Object
+
 from zuora_python_toolkit.base import Zuora, session_required
+from zuora_python_toolkit.util import ZuoraError, generate_search_conditions, shard_values, time_windows, \
+    window_query
 
 logger = logging.getLogger("zuora_python_toolkit")
 suds_logger = logging.getLogger("suds.client")
@@ -70,6 +77,51 @@ class ZuoraQueryTestCase(ZuoraBaseTestCase):
         self.assertEqual(len(result.records), 100)
 
 
+def query_result(records, locator=None):
+    result = Object()
+    result.done = locator is None
+    result.queryLocator = locator
+    result.records = records
+    result.size = len(records)
+    return result
+
+
+class ZuoraIterQueryTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraIterQueryTestCase, self).setUp()
+        pages = {
+            'page-2': query_result([3, 4], 'page-3'),
+            'page-3': query_result([5]),
+        }
+        self.client.query = Mock(return_value=query_result([1, 2], 'page-2'))
+        self.client.query_more = Mock(side_effect=lambda locator: pages[locator])
+
+    def test_iter_query_follows_query_more(self):
+        records = list(self.client.iter_query("SELECT Id FROM Account"))
+        self.assertEqual(records, [1, 2, 3, 4, 5])
+        self.assertEqual(self.client.query_more.call_count, 2)
+
+    def test_iter_query_without_prefetch(self):
+        records = list(self.client.iter_query("SELECT Id FROM Account", prefetch=False))
+        self.assertEqual(records, [1, 2, 3, 4, 5])
+
+    def test_iter_query_single_page(self):
+        self.client.query = Mock(return_value=query_result([]))
+        self.assertEqual(list(self.client.iter_query("SELECT Id FROM Account")), [])
+        self.assertFalse(self.client.query_more.called)
+
+    def test_iter_pages_compact(self):
+        self.client.query = Mock(return_value=query_result([record('a'), record('b')], 'page-2'))
+        self.client.query_more = Mock(return_value=query_result([record('c')]))
+        pages = list(self.client.iter_pages("SELECT Id, Name FROM Account", compact=True))
+        self.assertEqual([page.fields for page in pages], [('Id', 'Name'), ('Id', 'Name')])
+        self.assertEqual(list(pages[0].column('Id')), ['a', 'b'])
+        row = pages[1][0]
+        self.assertEqual((row.Id, row.Name), ('c', None))
+        self.assertIs(type(row), type(pages[0][0]))
+
+
 class ZuoraRetrieveTestCase(ZuoraBaseTestCase):
 
     def test_retrieve(self):
@@ -79,6 +131,149 @@ class ZuoraRetrieveTestCase(ZuoraBaseTestCase):
         results = self.client.retrieve(z_object_type, field_list, id_list)
         print results
 
+
+def record(id):
+    result = Object()
+    result.Id = id
+    return result
+
+
+class ZuoraShardedRetrieveTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraShardedRetrieveTestCase, self).setUp()
+        self.client.set_retrieve_shard_size(3)
+        self.queries = []
+
+        def iter_query(query_string, prefetch=True, compact=False):
+            self.queries.append(query_string)
+            ids = query_string.split("WHERE ")[1].replace("Id=", "").replace("'", "").split(" OR ")
+            return iter([record(id) for id in ids])
+        self.client.iter_query = Mock(side_effect=iter_query)
+
+    def test_iter_retrieve_shards_and_dedupes(self):
+        id_list = ['a', 'b', 'c', 'd', 'a', 'e', 'f', 'g']
+        records = list(self.client.iter_retrieve('Account', ['Name'], id_list))
+        self.assertEqual(sorted(r.Id for r in records), ['a', 'b', 'c', 'd', 'e', 'f', 'g'])
+        self.assertEqual(len(self.queries), 3)
+
+    def test_retrieve_large_id_list(self):
+        result = self.client.retrieve('Account', ['Name'], ['a', 'b', 'c', 'd'])
+        self.assertTrue(result.done)
+        self.assertEqual(result.size, 4)
+        self.assertEqual(len(self.queries), 2)
+
+    def test_retrieve_empty_id_list(self):
+        self.assertRaises(ValueError, self.client.retrieve, 'Account', [], [])
+
+    def test_shard_failure_is_raised(self):
+        self.client.iter_query = Mock(side_effect=IOError("connection reset"))
+        records = self.client.iter_retrieve('Account', [], ['a', 'b', 'c', 'd'])
+        self.assertRaises(IOError, list, records)
+
+
+def created_records(prefix, start, count):
+    records = []
+    for i in range(count):
+        result = record('%s%s' % (prefix, i))
+        result.CreatedDate = start + timedelta(minutes=i)
+        records.append(result)
+    return records
+
+
+def window_bounds(query_string):
+    bounds = dict((operator, DateTime(value).datetime) for operator, value in
+                  re.findall(r"CreatedDate (>=|<) '([^']+)'", query_string))
+    return bounds.get('>='), bounds.get('<')
+
+
+class ZuoraPartitionedQueryTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraPartitionedQueryTestCase, self).setUp()
+        self.start = datetime(2020, 1, 1)
+        # Most records are in the last hour
+        self.records = created_records('a', self.start, 10) + created_records('b', self.start + timedelta(hours=23), 50)
+        self.queries = []
+
+        def matching(query_string):
+            lower, upper = window_bounds(query_string)
+            return [r for r in self.records if (lower is None or r.CreatedDate >= lower) and
+                    (upper is None or r.CreatedDate < upper)]
+
+        def iter_query(query_string, prefetch=True, compact=False):
+            self.queries.append(query_string)
+            return iter(matching(query_string))
+        self.client.iter_query = Mock(side_effect=iter_query)
+        self.client.query = Mock(side_effect=lambda query_string, use_cache=True: query_result(matching(query_string)))
+
+    def test_fixed_windows(self):
+        records = list(self.client.iter_partitioned("SELECT Id FROM InvoiceItem WHERE Amount > 0", self.start,
+                                                    self.start + timedelta(days=1), windows=4))
+        self.assertEqual(sorted(r.Id for r in records), sorted(r.Id for r in self.records))
+        self.assertEqual(len(self.queries), 4)
+        self.assertTrue(all(" WHERE Amount > 0 AND CreatedDate " in query for query in self.queries))
+        self.assertEqual(window_bounds(self.queries[0])[0], None)
+        self.assertFalse(self.client.query.called)
+
+    def test_probed_windows(self):
+        records = list(self.client.iter_partitioned("SELECT Id, Amount FROM InvoiceItem", self.start,
+                                                    self.start + timedelta(days=1), window_size=20, concurrency=2))
+        self.assertEqual(sorted(r.Id for r in records), sorted(r.Id for r in self.records))
+        self.assertTrue(all(query.startswith("SELECT Id FROM InvoiceItem WHERE")
+                            for query in [c[0][0] for c in self.client.query.call_args_list]))
+        # Windows never overlap, empty ones are dropped and full ones split
+        windows = sorted((window_bounds(query) for query in self.queries), key=lambda w: w[0] or datetime.min)
+        for (lower, upper), (next_lower, next_upper) in zip(windows, windows[1:]):
+            self.assertTrue(upper <= next_lower)
+        self.assertTrue(len(windows) > 3)
+        self.assertTrue(all(len([r for r in records if (lower is None or r.CreatedDate >= lower) and
+                                 (upper is None or r.CreatedDate < upper)]) <= 20 for lower, upper in windows))
+
+    def test_duplicates_are_only_removed_on_request(self):
+        self.client.iter_queries = Mock(return_value=iter([]))
+        list(self.client.iter_partitioned("SELECT Id FROM InvoiceItem", self.start, windows=2))
+        self.assertIsNone(self.client.iter_queries.call_args[0][2])
+        list(self.client.iter_partitioned("SELECT Id FROM InvoiceItem", self.start, windows=2, key='Id'))
+        self.assertEqual(self.client.iter_queries.call_args[0][2], 'Id')
+
+    def test_or_conditions_cannot_be_partitioned(self):
+        self.assertRaises(ZuoraError, self.client.iter_partitioned,
+                          "SELECT Id FROM InvoiceItem WHERE Amount > 0 OR Amount < 0", self.start, windows=2)
+
+
+class ZuoraTimeWindowsTestCase(unittest.TestCase):
+
+    def test_time_windows(self):
+        start = datetime(2020, 1, 1, 0, 0, 0, 5)
+        windows = time_windows(start, datetime(2020, 1, 1, 0, 0, 10), 4)
+        self.assertEqual([(lower and lower.second, upper and upper.second) for lower, upper in windows],
+                         [(None, 2), (2, 5), (5, 7), (7, None)])
+        self.assertEqual(time_windows(start, start, 4), [(None, None)])
+        self.assertEqual(time_windows(start, start + timedelta(seconds=4), 2, bounded=True)[0][0], datetime(2020, 1, 1))
+
+    def test_window_query(self):
+        self.assertEqual(window_query("SELECT Id FROM Account", 'UpdatedDate'), "SELECT Id FROM Account")
+        query = window_query("SELECT Id FROM Account where Status = 'Active'", 'UpdatedDate', upper=datetime.now())
+        self.assertTrue(query.startswith("SELECT Id FROM Account WHERE Status = 'Active' AND UpdatedDate < '"))
+
+
+class ZuoraSearchConditionsTestCase(unittest.TestCase):
+
+    def test_generate_search_conditions(self):
+        self.assertEqual(generate_search_conditions(values=['a', 'b']), "Id='a' OR Id='b'")
+        self.assertEqual(generate_search_conditions('Amount', False, 'AND', [1]), "Amount=1")
+
+    def test_shard_values_by_count(self):
+        self.assertEqual(list(shard_values(range(5), max_count=2)), [[0, 1], [2, 3], [4]])
+
+    def test_shard_values_by_length(self):
+        values = ['a' * 32] * 5
+        for shard in shard_values(values, max_length=90):
+            self.assertTrue(len(generate_search_conditions(values=shard)) <= 90)
+        self.assertEqual([len(shard) for shard in shard_values(values, max_length=90)], [2, 2, 1])
+
+
 class ZuoraCreateAccountTestCase(ZuoraBaseTestCase):
     def test_create(self):
         pass
@@ -0,0 +1,190 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import socket
+import time
+import unittest
+import logging
+from mock import Mock, patch
+
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.batch import AdaptiveBatchSize, BatchExecutor, chunk, is_oversized_fault
+from zuora_python_toolkit.governor import Governor
+from zuora_python_toolkit.mockserver import DEFAULT_WSDL, MockServer
+from zuora_python_toolkit.session import SessionManager
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from zuora_python_toolkit.tests.test_governor import throttle_fault
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def save_result(success=True, id=None, errors=None):
+    result = Object()
+    result.Success = success
+    result.Id = id
+    if errors is not None:
+        result.Errors = errors
+    return result
+
+
+def fake_create(z_objects):
+    return [save_result(id='id-%s' % z_object) for z_object in z_objects]
+
+
+class ChunkTestCase(unittest.TestCase):
+
+    def test_chunk(self):
+        chunks = list(chunk(range(7), 3))
+        self.assertEqual(chunks, [(0, [0, 1, 2]), (3, [3, 4, 5]), (6, [6])])
+
+    def test_chunk_size_must_be_positive(self):
+        self.assertRaises(ValueError, list, chunk(range(7), 0))
+
+
+class BatchExecutorTestCase(unittest.TestCase):
+
+    def test_results_in_input_order(self):
+        executor = BatchExecutor(batch_size=10, concurrency=3)
+        results = executor.run(fake_create, range(95))
+        self.assertEqual(len(results), 95)
+        self.assertEqual([r.Id for r in results], ['id-%s' % i for i in range(95)])
+        self.assertTrue(results.success)
+
+    def test_record_failures(self):
+        def create(z_objects):
+            return [save_result(success=(z_object % 7 != 0), errors=['bad']) for z_object in z_objects]
+
+        executor = BatchExecutor(batch_size=10, concurrency=3)
+        results = executor.run(create, range(30))
+        self.assertEqual([failure.index for failure in results.failures], [0, 7, 14, 21, 28])
+        self.assertEqual(results.failures[1].item, 7)
+        self.assertEqual(results.failures[1].errors, ['bad'])
+
+    def test_chunk_exception(self):
+        def create(z_objects):
+            if 10 in z_objects:
+                raise IOError("connection reset")
+            return fake_create(z_objects)
+
+        executor = BatchExecutor(batch_size=10, concurrency=3)
+        results = executor.run(create, range(30))
+        self.assertEqual(len(results), 30)
+        self.assertEqual(results[10:20], [None] * 10)
+        self.assertEqual([failure.index for failure in results.failures], range(10, 20))
+
+    def test_prefix_args(self):
+        delete = Mock(side_effect=lambda z_object_type, ids: [save_result() for i in ids])
+        executor = BatchExecutor(batch_size=2, concurrency=2)
+        executor.run(delete, ['a', 'b', 'c'], 'Account')
+        delete.assert_any_call('Account', ['a', 'b'])
+        delete.assert_any_call('Account', ['c'])
+
+
+class AdaptiveBatchSizeTestCase(unittest.TestCase):
+
+    def test_grows_while_fast(self):
+        sizer = AdaptiveBatchSize(min_size=8, max_size=50, increase=4)
+        sizer.size = 8
+        for i in range(3):
+            sizer.observe(range(sizer.size), 0.1)
+        self.assertEqual(sizer.size, 20)
+        for i in range(20):
+            sizer.observe(range(sizer.size), 0.1)
+        self.assertEqual(sizer.size, 50)
+
+    def test_shrinks_when_slow(self):
+        sizer = AdaptiveBatchSize(min_size=8, max_size=50, target_seconds=10)
+        sizer.observe(range(50), 20.0)
+        self.assertEqual(sizer.size, 25)
+        sizer.observe(range(25), 100.0)
+        self.assertEqual(sizer.size, 8)
+
+    def test_shrinks_on_timeout(self):
+        sizer = AdaptiveBatchSize(min_size=8, max_size=50)
+        sizer.observe(range(50), 60.0, socket.timeout('timed out'))
+        self.assertEqual(sizer.size, 25)
+        sizer.observe(range(25), 1.0, ValueError('INVALID_VALUE'))
+        self.assertEqual(sizer.size, 25)
+
+    def test_heavy_records_get_smaller_batches(self):
+        sizer = AdaptiveBatchSize(min_size=1, max_size=50, target_seconds=10)
+        light = [save_result(id=i) for i in range(50)]
+        sizer.observe(light, 5.0)
+        self.assertEqual(sizer.next_size(light), 50)
+        heavy = []
+        for i in range(50):
+            record = save_result(id=i, errors=[])
+            for field in range(20):
+                setattr(record, 'Field%s' % field, field)
+            heavy.append(record)
+        self.assertTrue(sizer.next_size(heavy) < 10)
+
+    def test_is_oversized_fault(self):
+        self.assertTrue(is_oversized_fault(socket.timeout('timed out')))
+        self.assertTrue(is_oversized_fault(throttle_fault('MAX_RECORDS_EXCEEDED')))
+        self.assertFalse(is_oversized_fault(throttle_fault('INVALID_VALUE')))
+        self.assertFalse(is_oversized_fault(Exception("Server raised fault: 'MAX_RECORDS_EXCEEDED'")))
+
+    def test_executor_uses_sizer(self):
+        sizer = AdaptiveBatchSize(min_size=5, max_size=20)
+        sizer.size = 5
+        executor = BatchExecutor(concurrency=1, sizer=sizer)
+        f = Mock(side_effect=fake_create)
+        results = executor.run(f, range(100))
+        self.assertEqual(len(results), 100)
+        self.assertEqual([len(c[0][0]) for c in f.call_args_list][:4], [5, 9, 13, 17])
+
+
+@patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+class ZuoraBatchCallTestCase(ZuoraBaseTestCase):
+
+    def test_call_batches_large_lists(self, login_required_mock):
+        f = Mock(side_effect=fake_create)
+        f.method.name = 'create'
+        results = self.client.call(f, range(120))
+        self.assertEqual(f.call_count, 3)
+        self.assertEqual(len(results), 120)
+
+    def test_call_batches_delete_ids(self, login_required_mock):
+        f = Mock(side_effect=lambda z_object_type, ids: [save_result() for i in ids])
+        f.method.name = 'delete'
+        self.client.set_batch_size(20)
+        results = self.client.call(f, 'Account', range(50))
+        self.assertEqual(f.call_count, 3)
+        self.assertEqual(len(results), 50)
+
+
+class ZuoraBatchConcurrencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer(latency=0.3).start()
+        # suds' debug logging (captured by the test runner) costs more than the calls themselves
+        self.suds_logger = logging.getLogger('suds')
+        self.suds_level = self.suds_logger.level
+        self.suds_logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.suds_logger.setLevel(self.suds_level)
+        self.server.stop()
+        Governor.clear()
+        SessionManager.clear()
+
+    def test_chunks_overlap_with_the_default_transport(self):
+        client = Zuora(wsdl=DEFAULT_WSDL, username='batch', password='batch', batch_size=10, batch_concurrency=4)
+        client.set_endpoint(self.server.endpoint)
+        client.login()
+        accounts = []
+        for i in range(40):
+            account = client.generate_object('Account')
+            account.Name = 'Account %s' % i
+            accounts.append(account)
+        started = time.time()
+        results = client.create(accounts)
+        # Four chunks of ten sent one after another would take at least 1.2s
+        self.assertLess(time.time() - started, 0.9)
+        self.assertEqual(len(results), 40)
+        self.assertTrue(results.success)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from os import path
+import json
+import shutil
+import tempfile
+import unittest
+import logging
+
+from zuora_python_toolkit import benchmark, mockserver
+from zuora_python_toolkit.governor import Governor
+from zuora_python_toolkit.session import SessionManager
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        Governor.clear()
+        SessionManager.clear()
+
+    def test_run(self):
+        report = benchmark.run(records=25, page_size=10, throttle_every=7, export_rows=30, batch_size=10)
+        counts = dict(((result['scenario'], result['mode']), result['records']) for result in report['results'])
+        self.assertEqual(counts, {
+            ('query', 'suds'): 25, ('create', 'suds'): 25, ('update', 'suds'): 25,
+            ('export', 'suds'): 30, ('download', 'suds'): 30,
+            ('query', 'fast_soap'): 25, ('create', 'fast_soap'): 25, ('update', 'fast_soap'): 25,
+            ('export', 'fast_soap'): 30, ('download', 'fast_soap'): 30,
+        })
+        self.assertEqual(report['options']['throttle_every'], 7)
+
+    def test_default_wsdl_is_shipped_with_the_package(self):
+        self.assertEqual(path.relpath(mockserver.DEFAULT_WSDL, path.dirname(mockserver.__file__)),
+                         path.join('wsdl', 'apisandbox.zuora.a.63.0.wsdl'))
+        self.assertTrue(path.isfile(mockserver.DEFAULT_WSDL))
+
+    def test_main_writes_json(self):
+        output = path.join(self.directory, 'results.json')
+        benchmark.main(['--scenario', 'query', '--mode', 'fast_soap', '--records', '5', '--output', output])
+        results = json.load(open(output))['results']
+        self.assertEqual([(r['scenario'], r['mode'], r['records']) for r in results], [('query', 'fast_soap', 5)])
+
+if __name__ == "__main__":
+    unittest.main()
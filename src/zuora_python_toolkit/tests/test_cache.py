@@ -0,0 +1,140 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from os import path
+import shutil
+import tempfile
+import unittest
+import logging
+from mock import Mock, patch
+
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.cache import RecordCache, SqliteBackend, query_object
+from zuora_python_toolkit.fastsoap import Record
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase, query_result
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def account(record_id, name='Acme'):
+    return Record('Account', Id=record_id, Name=name)
+
+
+@patch('zuora_python_toolkit.cache.time.time', return_value=1000.0)
+class RecordCacheTestCase(unittest.TestCase):
+
+    def test_records_are_keyed_by_fields(self, time_mock):
+        cache = RecordCache()
+        cache.put_records('Account', [account('a'), account('b')], ['Name'])
+        self.assertEqual(sorted(cache.get_records('Account', ['a', 'b', 'c'], ['Name', 'Id'])), ['a', 'b'])
+        self.assertEqual(cache.get_records('Account', ['a'], ['Name', 'Balance']), {})
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_ttl(self, time_mock):
+        cache = RecordCache(ttl_seconds=10, ttls={'Invoice': 0})
+        cache.put_records('Account', [account('a')], [])
+        cache.put_records('Invoice', [Record('Invoice', Id='i')], [])
+        self.assertEqual(len(cache), 1)
+        time_mock.return_value = 1011.0
+        self.assertEqual(cache.get_records('Account', ['a'], []), {})
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_are_evicted(self, time_mock):
+        cache = RecordCache(max_entries=2)
+        cache.put_records('Account', [account('a'), account('b')], [])
+        cache.get_records('Account', ['a'], [])
+        cache.put_records('Account', [account('c')], [])
+        self.assertEqual(sorted(cache.get_records('Account', ['a', 'b', 'c'], [])), ['a', 'c'])
+
+    def test_invalidate(self, time_mock):
+        cache = RecordCache()
+        cache.put_records('Account', [account('a'), account('b')], [])
+        cache.put_records('Account', [account('a')], ['Name'])
+        cache.put_query('Account', 'SELECT Id FROM Account', query_result([]))
+        cache.invalidate('Account', ['a'])
+        self.assertEqual(cache.get_records('Account', ['a', 'b'], []).keys(), ['b'])
+        self.assertEqual(cache.get_records('Account', ['a'], ['Name']), {})
+        self.assertIsNone(cache.get_query('Account', 'SELECT Id FROM Account'))
+        cache.invalidate('Account')
+        self.assertEqual(len(cache), 0)
+
+    def test_query_object(self, time_mock):
+        self.assertEqual(query_object("select Id, Name from Account where Status = 'Active'"), 'Account')
+        self.assertIsNone(query_object(None))
+
+
+class SqliteBackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = path.join(self.directory, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared_between_caches(self):
+        first = RecordCache(backend=SqliteBackend(self.filename))
+        record = Object()
+        record.Id = 'a'
+        record.Name = 'Acme'
+        first.put_records('Account', [record], ['Name'])
+
+        second = RecordCache(backend=SqliteBackend(self.filename))
+        cached = second.get_records('Account', ['a'], ['Name'])['a']
+        self.assertEqual(cached, {'Id': 'a', 'Name': 'Acme'})
+        self.assertEqual(cached.Name, 'Acme')
+
+        first.invalidate('Account', ['a'])
+        self.assertEqual(RecordCache(backend=SqliteBackend(self.filename)).get_records('Account', ['a'], ['Name']), {})
+
+
+class ZuoraCacheTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraCacheTestCase, self).setUp()
+        self.client.cache = RecordCache()
+        self.queries = []
+
+        def call(f, *args):
+            if f.method.name == 'query':
+                self.queries.append(args[0])
+                ids = args[0].split("WHERE ")[1].replace("Id=", "").replace("'", "").split(" OR ")
+                return query_result([account(record_id) for record_id in ids])
+            return Record('SaveResult', Success=True)
+        self.client.call = Mock(side_effect=call)
+
+    def test_retrieve_fetches_missing_records(self):
+        self.client.retrieve('Account', ['Name'], ['a', 'b'])
+        result = self.client.retrieve('Account', ['Name'], ['b', 'c'])
+        self.assertEqual(sorted(r.Id for r in result.records), ['b', 'c'])
+        self.assertEqual(self.queries, ["SELECT Name, Id FROM Account WHERE Id='a' OR Id='b'",
+                                        "SELECT Name, Id FROM Account WHERE Id='c'"])
+
+    def test_update_and_delete_invalidate(self):
+        self.client.retrieve('Account', ['Name'], ['a', 'b'])
+        self.client.update(account('a', 'Initech'))
+        self.client.delete('Account', ['b'])
+        self.client.retrieve('Account', ['Name'], ['a', 'b'])
+        self.assertEqual(self.queries[-1], "SELECT Name, Id FROM Account WHERE Id='a' OR Id='b'")
+
+    def test_query_is_cached_until_create(self):
+        query = "SELECT Id FROM Account WHERE Id='a'"
+        self.client.query(query)
+        self.client.query(query)
+        self.assertEqual(len(self.queries), 1)
+        self.client.create(Record('Account', Name='New'))
+        self.client.query(query)
+        self.assertEqual(len(self.queries), 2)
+
+    def test_object_names_are_case_insensitive(self):
+        query = "SELECT Id FROM account WHERE Id='a'"
+        self.client.query(query)
+        self.client.create(Record('Account', Name='New'))
+        self.client.query(query)
+        self.assertEqual(len(self.queries), 2)
+        self.client.query("SELECT Id FROM export WHERE Id='a'")
+        self.client.query("SELECT Id FROM export WHERE Id='a'")
+        self.assertEqual(len(self.queries), 4)
+
+if __name__ == "__main__":
+    unittest.main()
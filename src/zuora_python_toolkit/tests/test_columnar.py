@@ -0,0 +1,137 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from datetime import date, datetime
+from decimal import Decimal
+from os import path
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+from mock import patch
+
+from zuora_python_toolkit import columnar
+from zuora_python_toolkit.columnar import ColumnarWriter, column_types, parse_datetime
+from zuora_python_toolkit.fastsoap import SoapCodec
+from zuora_python_toolkit.tests.test_export import ZuoraExportBaseTestCase, download_response
+from zuora_python_toolkit.tests.test_fastsoap import WSDLS
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+if columnar.available():
+    import pyarrow.parquet
+
+requires_pyarrow = unittest.skipIf(not columnar.available(), "pyarrow is not installed")
+
+COLUMNS = ['Account.Id', 'Account.Name', 'Account.Balance', 'Account.BillCycleDay', 'Account.CreatedDate',
+           'Account.AutoPay', 'Account.Currency', 'Extra']
+
+
+class ColumnTypesTestCase(unittest.TestCase):
+
+    def test_column_types(self):
+        codec = SoapCodec(open(WSDLS[0]).read())
+        self.assertEqual(column_types(codec, COLUMNS + ['Name', 'Nope.Id'], 'Account'),
+                         ['string', 'string', 'decimal', 'int', 'dateTime', 'boolean', 'string', 'string',
+                          'string', 'string'])
+
+    def test_parse_datetime(self):
+        self.assertEqual(parse_datetime('2015-01-02T03:04:05.000-08:00'), datetime(2015, 1, 2, 11, 4, 5))
+        self.assertEqual(parse_datetime('2015-01-02T03:04:05+0100'), datetime(2015, 1, 2, 2, 4, 5))
+        self.assertEqual(parse_datetime('2015-01-02 03:04:05'), datetime(2015, 1, 2, 3, 4, 5))
+        self.assertEqual(parse_datetime('2015-01-02'), datetime(2015, 1, 2))
+        self.assertRaises(ValueError, parse_datetime, '01/02/2015')
+
+
+@requires_pyarrow
+class ColumnarWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.types = ['string', 'string', 'decimal', 'int', 'dateTime', 'boolean', 'string', 'string']
+        self.rows = [
+            ['1', 'Acme', '10.50', '15', '2015-01-02T03:04:05.000-08:00', 'true', 'USD', ''],
+            ['2', 'Initech', '', '1', '2015-02-03T00:00:00.000-08:00', 'false', 'EUR', 'x'],
+            ['3', 'Globex', '0', 'n/a', '', 'false', 'USD', ''],
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_row_groups(self):
+        filename = path.join(self.location, 'accounts.parquet')
+        with ColumnarWriter(filename, COLUMNS, self.types, row_group_size=2) as writer:
+            writer.write_rows(self.rows)
+        parquet = pyarrow.parquet.ParquetFile(filename)
+        self.assertEqual(parquet.num_row_groups, 2)
+        data = parquet.read().to_pydict()
+        self.assertEqual(data['Account.Balance'], [Decimal('10.5'), None, Decimal('0')])
+        self.assertEqual(data['Account.BillCycleDay'], [15, 1, None])
+        self.assertEqual(data['Account.CreatedDate'][0], datetime(2015, 1, 2, 11, 4, 5))
+        self.assertEqual(data['Account.AutoPay'], [True, False, False])
+        self.assertEqual(data['Extra'], [None, u'x', None])
+
+    def test_partitions(self):
+        with ColumnarWriter(self.location, COLUMNS, self.types, partition_by='Account.Currency') as writer:
+            writer.write_rows(self.rows)
+        self.assertEqual(sorted(os.listdir(self.location)), ['Account.Currency=EUR', 'Account.Currency=USD'])
+        usd = pyarrow.parquet.read_table(path.join(self.location, 'Account.Currency=USD', 'part-0.parquet'))
+        self.assertEqual(usd.to_pydict()['Account.Id'], [u'1', u'3'])
+
+    def test_partition_names_do_not_collide(self):
+        rows = [['1', 'a', '', '', '', '', 'North America', ''], ['2', 'b', '', '', '', '', 'North_America', ''],
+                ['3', 'c', '', '', '', '', 'a/b', ''], ['4', 'd', '', '', '', '', 'Montr\xc3\xa9al', '']]
+        with ColumnarWriter(self.location, COLUMNS, self.types, partition_by='Account.Currency') as writer:
+            writer.write_rows(rows)
+        self.assertEqual(sorted(os.listdir(self.location)), [
+            'Account.Currency=Montr%C3%A9al', 'Account.Currency=North%20America',
+            'Account.Currency=North_America', 'Account.Currency=a%2Fb'])
+        montreal = pyarrow.parquet.read_table(path.join(self.location, 'Account.Currency=Montr%C3%A9al',
+                                                        'part-0.parquet'))
+        self.assertEqual(montreal.to_pydict()['Account.Currency'], [u'Montr\xe9al'])
+
+    def test_partitions_never_share_a_writer(self):
+        writer = ColumnarWriter(self.location, COLUMNS, self.types, partition_by='Account.Currency')
+        writer.filename = lambda partition: path.join(self.location, 'part-0.parquet')
+        writer.write_rows(self.rows)
+        self.assertRaises(ValueError, writer.close)
+
+    def test_no_rows(self):
+        filename = path.join(self.location, 'empty.parquet')
+        ColumnarWriter(filename, COLUMNS, self.types).close()
+        self.assertEqual(pyarrow.parquet.read_table(filename).num_rows, 0)
+
+
+@requires_pyarrow
+@patch('zuora_python_toolkit.transport.requests.Session.get')
+class ZuoraDownloadColumnarTestCase(ZuoraExportBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraDownloadColumnarTestCase, self).setUp()
+        self.client.set_endpoint('https://apisandbox.zuora.com/apps/services/a/63.0')
+        self.client.set_session_id('session')
+        self.location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_download_columnar(self, get_mock):
+        get_mock.return_value = download_response(['Account.Id,Account.Created', 'Date,Account.Balance\n',
+                                                   '1,2015-01-02T03:04:05.000-08:00,1.5\n'])
+        filename = path.join(self.location, 'accounts.parquet')
+        self.assertEqual(self.client.download_columnar('file-id', filename, 'Account'), filename)
+        data = pyarrow.parquet.read_table(filename).to_pydict()
+        self.assertEqual(data['Account.CreatedDate'], [datetime(2015, 1, 2, 11, 4, 5)])
+        self.assertEqual(data['Account.Balance'], [Decimal('1.5')])
+
+    def test_crlf_split_across_chunks_adds_no_rows(self, get_mock):
+        get_mock.return_value = download_response(['Account.Id,Account.Balance\r', '\n1,1.5\r',
+                                                   '\n2,2.5\r\n'])
+        filename = path.join(self.location, 'accounts.parquet')
+        self.client.download_columnar('file-id', filename, 'Account')
+        data = pyarrow.parquet.read_table(filename).to_pydict()
+        self.assertEqual(data['Account.Id'], ['1', '2'])
+        self.assertEqual(data['Account.Balance'], [Decimal('1.5'), Decimal('2.5')])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,24 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
 import unittest
 import logging
 from mock import Mock, patch
 
-from zuora_python_toolkit.export import ZuoraExport
-from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.cache import RecordCache
+from zuora_python_toolkit.export import ZuoraExport, iter_lines
+from zuora_python_toolkit.records import iter_csv_rows
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase, query_result
 
 logger = logging.getLogger("zuora_python_toolkit")
 suds_logger = logging.getLogger("suds.client")
 
 
-class ZuoraExportTestCase(ZuoraBaseTestCase):
+class ZuoraExportBaseTestCase(ZuoraBaseTestCase):
 
     def setUp(self):
         wsdl = 'apisandbox.zuora.a.63.0.wsdl'
@@ -26,11 +33,169 @@ class ZuoraExportTestCase(ZuoraBaseTestCase):
         }
         self.client = ZuoraExport(**kwargs)
 
+
+class ZuoraExportTestCase(ZuoraExportBaseTestCase):
+
     def test_export__account(self):
         fields = ['Id', 'AccountNumber', 'UpdatedById', 'UpdatedDate']
 
         results = self.client.export('account', fields)
         print results
+
+
+def export_record(export_id, status, file_id=None):
+    record = Object()
+    record.Id = export_id
+    record.Status = status
+    record.FileId = file_id
+    return record
+
+
+def save_result(export_id, success=True):
+    result = Object()
+    result.Id = export_id
+    result.Success = success
+    return result
+
+
+@patch('zuora_python_toolkit.export.gevent.sleep')
+class ZuoraExportManyTestCase(ZuoraExportBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraExportManyTestCase, self).setUp()
+        self.client.create = Mock(return_value=[save_result('e1'), save_result('e2'), save_result(None, False)])
+        self.client.download = Mock(side_effect=lambda file_id, filename, droppath: droppath + filename)
+        self.exports = [
+            {'z_object': 'Account', 'fields': ['Id']},
+            {'z_object': 'Invoice', 'fields': ['Id'], 'filters': "Status = 'Posted'", 'filename': 'invoices'},
+            {'z_object': 'Payment', 'fields': ['Id']},
+        ]
+
+    def test_export_many(self, sleep_mock):
+        polls = [
+            {'e1': export_record('e1', 'Processing'), 'e2': export_record('e2', 'Processing')},
+            {'e1': export_record('e1', 'Processing'), 'e2': export_record('e2', 'Completed', 'f2')},
+            {'e1': export_record('e1', 'Completed', 'f1')},
+        ]
+        self.client.export_status = Mock(side_effect=polls)
+
+        downloaded = self.client.export_many(self.exports, droppath='/tmp/', sleep_seconds=2, backoff=2)
+        self.assertEqual(downloaded, {'Account': '/tmp/Account', 'invoices': '/tmp/invoices', 'Payment': None})
+        self.assertEqual(self.client.export_status.call_count, 3)
+        self.assertEqual(sorted(self.client.export_status.call_args_list[0][0][0]), ['e1', 'e2'])
+        self.assertEqual(self.client.export_status.call_args_list[2][0][0], ['e1'])
+        self.client.download.assert_any_call('f2', 'invoices', '/tmp/')
+        self.assertEqual([c[0][0] for c in sleep_mock.call_args_list], [4, 2])
+
+    def test_export_many_gives_up(self, sleep_mock):
+        self.client.export_status = Mock(return_value={'e1': export_record('e1', 'Processing'),
+                                                       'e2': export_record('e2', 'Failed')})
+        downloaded = self.client.export_many(self.exports, max_tries=3)
+        self.assertEqual(self.client.export_status.call_count, 3)
+        self.assertEqual(downloaded, {'Account': None, 'invoices': None, 'Payment': None})
+        self.assertFalse(self.client.download.called)
+
+    def test_export_status_single_query(self, sleep_mock):
+        self.client.iter_query = Mock(return_value=iter([export_record('a', 'Completed', 'f')]))
+        statuses = self.client.export_status(['a', 'b'])
+        self.assertEqual(statuses.keys(), ['a'])
+        self.client.iter_query.assert_called_once_with("SELECT Id, Status, FileId FROM Export WHERE Id='a' OR Id='b'")
+
+
+@patch('zuora_python_toolkit.export.time.sleep')
+class ZuoraExportCacheTestCase(ZuoraExportBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraExportCacheTestCase, self).setUp()
+        self.client.cache = RecordCache()
+        self.statuses = ['Processing', 'Processing', 'Completed']
+
+        def call(f, *args):
+            if f.method.name == 'query':
+                status = self.statuses.pop(0)
+                return query_result([export_record('e1', status, 'f1' if status == 'Completed' else None)])
+            return save_result('e1')
+        self.client.call = Mock(side_effect=call)
+
+    def test_export_status_is_not_cached(self, sleep_mock):
+        self.assertEqual(self.client.export('Account', ['Id'], max_tries=5), 'f1')
+        self.assertEqual(self.statuses, [])
+
+    def test_export_many_polls_are_not_cached(self, sleep_mock):
+        self.client.download = Mock(side_effect=lambda file_id, filename, droppath: droppath + filename)
+        with patch('zuora_python_toolkit.export.gevent.sleep'):
+            downloaded = self.client.export_many([{'z_object': 'Account', 'fields': ['Id']}], max_tries=5)
+        self.assertEqual(downloaded, {'Account': 'Account'})
+        self.assertEqual(self.statuses, [])
+
+
+def download_response(chunks, status_code=200):
+    response = Mock()
+    response.status_code = status_code
+    response.iter_content = Mock(return_value=iter(chunks))
+    return response
+
+
+class IterLinesTestCase(unittest.TestCase):
+
+    def test_iter_lines_rejoins_chunks(self):
+        chunks = ['Id,Na', 'me\r\n1,"a\nb"\r\n2,', 'c']
+        self.assertEqual(list(iter_lines(chunks)), ['Id,Name\r\n', '1,"a\n', 'b"\r\n', '2,c'])
+
+    def test_iter_lines_crlf_split_across_chunks(self):
+        chunks = ['Id,Name\r', '\n1,a\r', '\n2,b\r\n']
+        self.assertEqual(list(iter_lines(chunks)), ['Id,Name\r\n', '1,a\r\n', '2,b\r\n'])
+        self.assertEqual(list(iter_csv_rows(iter_lines(chunks))), [('1', 'a'), ('2', 'b')])
+
+
+@patch('zuora_python_toolkit.transport.requests.Session.get')
+class ZuoraDownloadTestCase(ZuoraExportBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraDownloadTestCase, self).setUp()
+        self.client.set_endpoint('https://apisandbox.zuora.com/apps/services/a/63.0')
+        self.client.set_session_id('session')
+        self.droppath = tempfile.mkdtemp() + os.sep
+
+    def tearDown(self):
+        shutil.rmtree(self.droppath)
+
+    def test_download_rows(self, get_mock):
+        get_mock.return_value = download_response(['Account.Id,Acc', 'ount.Name\n1,"a\nb"\n', '2,c\n'])
+        rows = list(self.client.download('file-id'))
+        self.assertEqual(rows, [{'Account.Id': '1', 'Account.Name': 'a\nb'},
+                                {'Account.Id': '2', 'Account.Name': 'c'}])
+        url = get_mock.call_args[0][0]
+        self.assertEqual(url, 'https://apisandbox.zuora.com/apps/api/file/file-id')
+        self.assertEqual(get_mock.call_args[1]['headers']['Authorization'], 'ZSession session')
+
+    def test_download_compact_rows(self, get_mock):
+        get_mock.return_value = download_response(['Account.Id,Account.Name\n1,a\n', '2\n'])
+        rows = list(self.client.download('file-id', compact=True))
+        self.assertEqual([tuple(row) for row in rows], [('1', 'a'), ('2', None)])
+        self.assertEqual(rows[0].Account_Name, 'a')
+        self.assertEqual(rows[1].get('Account.Id'), '2')
+        self.assertIs(type(rows[0]), type(rows[1]))
+
+    def test_download_to_file_with_backup(self, get_mock):
+        get_mock.return_value = download_response(['Id\n', '1\n'])
+        src = self.client.download('file-id', 'accounts', self.droppath)
+        self.assertEqual(src, self.droppath + 'accounts.csv')
+        self.assertEqual(open(src).read(), 'Id\n1\n')
+        files = sorted(os.listdir(self.droppath))
+        self.assertEqual(len(files), 2)
+        backup = os.path.join(self.droppath, files[1] if files[0] == 'accounts.csv' else files[0])
+        self.assertTrue(os.path.samefile(src, backup))
+
+    def test_download_to_file_without_backup(self, get_mock):
+        get_mock.return_value = download_response(['Id\n', '1\n'])
+        self.client.download('file-id', 'accounts', self.droppath, gzip=False, backup=False)
+        self.assertEqual(os.listdir(self.droppath), ['accounts.csv'])
+        self.assertEqual(get_mock.call_args[1]['headers']['Accept-Encoding'], 'identity')
+
+    def test_download_failure(self, get_mock):
+        get_mock.return_value = download_response([], status_code=404)
+        self.assertRaises(Exception, self.client.download, 'file-id')
             
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
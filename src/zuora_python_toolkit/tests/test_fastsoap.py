@@ -0,0 +1,231 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from os import path
+from StringIO import StringIO
+from xml.etree import cElementTree as ElementTree
+import cPickle
+import unittest
+import logging
+from mock import patch
+
+from suds import WebFault
+from suds.transport import Reply, TransportError
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.fastsoap import Record, SoapCodec, XSI_TYPE
+from zuora_python_toolkit.transport import PooledTransport
+from zuora_python_toolkit.util import fault_code, query_records, result_errors, result_succeeded
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+CONF_DIR = path.abspath(path.join(path.dirname(__file__), '..', '..', '..', 'conf'))
+WSDLS = [path.join(CONF_DIR, 'zuora.a.63.0.wsdl'), path.join(CONF_DIR, 'apisandbox.zuora.a.63.0.wsdl')]
+
+QUERY_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body><ns1:queryResponse xmlns:ns1="http://api.zuora.com/"><ns1:result>
+<ns1:done>false</ns1:done>
+<ns1:queryLocator>2c92c0f8-2</ns1:queryLocator>
+<ns1:records xsi:type="ns2:Account" xmlns:ns2="http://object.api.zuora.com/"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<ns2:Id>2c92c0f84b</ns2:Id>
+<ns2:AutoPay>false</ns2:AutoPay>
+<ns2:Balance>10.50</ns2:Balance>
+<ns2:BillCycleDay>15</ns2:BillCycleDay>
+<ns2:CreatedDate>2015-01-02T03:04:05.000-08:00</ns2:CreatedDate>
+<ns2:Name>Acme &amp; Co \xc3\xa9</ns2:Name>
+</ns1:records>
+<ns1:records xsi:type="ns2:Account" xmlns:ns2="http://object.api.zuora.com/"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+<ns2:Id>2c92c0f84c</ns2:Id>
+<ns2:AutoPay>true</ns2:AutoPay>
+</ns1:records>
+<ns1:size>2</ns1:size>
+</ns1:result></ns1:queryResponse></soapenv:Body></soapenv:Envelope>"""
+
+CREATE_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body><ns1:createResponse xmlns:ns1="http://api.zuora.com/">
+<ns1:result><ns1:Id>2c92c0f84d</ns1:Id><ns1:Success>true</ns1:Success></ns1:result>
+<ns1:result><ns1:Errors><ns1:Code>INVALID_VALUE</ns1:Code><ns1:Message>Bad Name</ns1:Message></ns1:Errors>
+<ns1:Success>false</ns1:Success></ns1:result>
+</ns1:createResponse></soapenv:Body></soapenv:Envelope>"""
+
+DELETE_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body><ns1:deleteResponse xmlns:ns1="http://api.zuora.com/">
+<ns1:result><ns1:id>2c92c0f84b</ns1:id><ns1:success>true</ns1:success></ns1:result>
+<ns1:result><ns1:id>2c92c0f84c</ns1:id><ns1:success>true</ns1:success></ns1:result>
+</ns1:deleteResponse></soapenv:Body></soapenv:Envelope>"""
+
+FAULT_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/">
+<soapenv:Body><soapenv:Fault>
+<faultcode>fns:INVALID_SESSION</faultcode><faultstring>invalid session</faultstring>
+<detail><ns1:fault xmlns:ns1="http://fault.api.zuora.com/">
+<ns1:FaultCode>INVALID_SESSION</ns1:FaultCode><ns1:FaultMessage>invalid session</ns1:FaultMessage>
+</ns1:fault></detail>
+</soapenv:Fault></soapenv:Body></soapenv:Envelope>"""
+
+
+class RecordingTransport(PooledTransport):
+    """
+    Records the messages sent and answers with canned responses
+    """
+
+    def __init__(self, *args, **kwargs):
+        PooledTransport.__init__(self, *args, **kwargs)
+        self.sent = []
+        self.responses = []
+
+    def send(self, request):
+        self.sent.append(request)
+        status, content = self.responses.pop(0)
+        if status != 200:
+            raise TransportError('error', status, StringIO(content))
+        return Reply(200, {}, content)
+
+    def __deepcopy__(self, memo={}):
+        return self
+
+
+def canonical(message):
+    """
+    The SOAP body as nested (tag, xsi:type, text, children) tuples, ignoring prefixes
+    """
+    def walk(element):
+        xsi_type = element.get(XSI_TYPE)
+        return (element.tag, xsi_type.split(':')[-1] if xsi_type else None, (element.text or '').strip(),
+                [walk(child) for child in element])
+    return walk(ElementTree.fromstring(message).find('{http://schemas.xmlsoap.org/soap/envelope/}Body'))
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class SoapCodecTestCase(unittest.TestCase):
+    """
+    The fast path must send and read the same messages as suds for every bundled WSDL
+    """
+
+    def clients(self, wsdl):
+        suds_transport, fast_transport = RecordingTransport(), RecordingTransport()
+        suds_client = Zuora(wsdl=wsdl, transport=suds_transport, schema_cache=False)
+        fast_client = Zuora(wsdl=wsdl, transport=fast_transport, schema_cache=False, fast_soap=True)
+        for client in (suds_client, fast_client):
+            header = client.generate_header('SessionHeader')
+            header.session = 'SESSION'
+            client.set_session_header(header)
+            client.set_session_id('SESSION')
+        return suds_client, fast_client
+
+    def account(self, client):
+        account = client.generate_object('Account')
+        account.Name = u'Acme & Co \xe9'
+        account.AutoPay = False
+        account.Balance = '1.50'
+        account.BillCycleDay = 15
+        account.CreatedDate = datetime(2015, 1, 2, 3, 4, 5)
+        account.fieldsToNull = ['Notes', 'Batch']
+        return account
+
+    def test_envelopes_match_suds(self):
+        for wsdl in WSDLS:
+            suds_client, fast_client = self.clients(wsdl)
+            calls = [
+                ('query', ('SELECT Id FROM Account',), QUERY_RESPONSE),
+                ('query_more', ('2c92c0f8-2',), QUERY_RESPONSE),
+                ('create', 'accounts', CREATE_RESPONSE),
+                ('update', 'accounts', CREATE_RESPONSE),
+                ('delete', ('Account', ['2c92c0f84b', '2c92c0f84c']), DELETE_RESPONSE),
+            ]
+            for name, args, response in calls:
+                sent = []
+                for client in (suds_client, fast_client):
+                    if args == 'accounts':
+                        client_args = ([self.account(client), self.account(client)],)
+                    else:
+                        client_args = args
+                    client.transport.responses.append((200, response))
+                    with patch.object(client, 'login_required', return_value=False):
+                        getattr(client, name)(*client_args)
+                    sent.append(client.transport.sent[-1])
+                self.assertEqual(canonical(sent[0].message), canonical(sent[1].message), (wsdl, name))
+                self.assertEqual(sent[0].url, sent[1].url)
+
+    def test_query_response_matches_suds(self):
+        for wsdl in WSDLS:
+            suds_client, fast_client = self.clients(wsdl)
+            results = []
+            for client in (suds_client, fast_client):
+                client.transport.responses.append((200, QUERY_RESPONSE))
+                with patch.object(client, 'login_required', return_value=False):
+                    results.append(client.query('SELECT Id FROM Account'))
+            suds_result, fast_result = results
+            self.assertEqual(fast_result.type, 'QueryResult')
+            self.assertEqual(fast_result.done, suds_result.done)
+            self.assertEqual(fast_result.queryLocator, suds_result.queryLocator)
+            self.assertEqual(fast_result.size, suds_result.size)
+            suds_records, fast_records = query_records(suds_result), query_records(fast_result)
+            self.assertEqual(len(fast_records), len(suds_records))
+            for suds_record, fast_record in zip(suds_records, fast_records):
+                self.assertEqual(fast_record.type, suds_record.__class__.__name__)
+                self.assertEqual(set(fast_record), set(name for name, value in suds_record if value is not None))
+                for name, value in fast_record.items():
+                    self.assertEqual(value, getattr(suds_record, name), name)
+                    if not isinstance(value, basestring):
+                        self.assertEqual(type(value), type(getattr(suds_record, name)), name)
+
+    def test_create_response_matches_suds(self):
+        for wsdl in WSDLS:
+            suds_client, fast_client = self.clients(wsdl)
+            results = []
+            for client in (suds_client, fast_client):
+                client.transport.responses.append((200, CREATE_RESPONSE))
+                with patch.object(client, 'login_required', return_value=False):
+                    results.append(client.create([self.account(client), self.account(client)]))
+            for suds_result, fast_result in zip(*results):
+                self.assertEqual(result_succeeded(fast_result), result_succeeded(suds_result))
+                self.assertEqual(getattr(fast_result, 'Id', None), getattr(suds_result, 'Id', None))
+                self.assertEqual([(e.Code, e.Message) for e in result_errors(fast_result)],
+                                 [(e.Code, e.Message) for e in as_list(getattr(suds_result, 'Errors', None))])
+
+    def test_fault(self):
+        suds_client, fast_client = self.clients(WSDLS[0])
+        fast_client.transport.responses.append((500, FAULT_RESPONSE))
+        with patch.object(fast_client, 'login_required', return_value=False):
+            try:
+                fast_client.operation('query')('SELECT Id FROM Account')
+                self.fail("WebFault not raised")
+            except WebFault as e:
+                self.assertEqual(fault_code(e), 'INVALID_SESSION')
+
+    def test_http_error(self):
+        suds_client, fast_client = self.clients(WSDLS[0])
+        fast_client.transport.responses.append((503, ''))
+        try:
+            fast_client.operation('query')('SELECT Id FROM Account')
+            self.fail("Exception not raised")
+        except Exception as e:
+            self.assertEqual(e.args[0][0], 503)
+
+    def test_unknown_field(self):
+        codec = SoapCodec(open(WSDLS[0]).read())
+        self.assertRaises(ValueError, codec.envelope, 'create', ([Record('Account', Nmae='Acme')],))
+
+    def test_record(self):
+        record = Record('Account', Name='Acme')
+        record.Id = '2c92'
+        self.assertEqual(record, {'Name': 'Acme', 'Id': '2c92'})
+        self.assertEqual(record.type, 'Account')
+        self.assertRaises(AttributeError, getattr, record, 'Balance')
+        copy = cPickle.loads(cPickle.dumps(record, 2))
+        self.assertEqual(copy, record)
+        self.assertEqual(copy.type, 'Account')
+
+if __name__ == "__main__":
+    unittest.main()
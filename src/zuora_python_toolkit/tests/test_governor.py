@@ -0,0 +1,139 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import time
+import unittest
+import logging
+from mock import Mock, patch
+
+import gevent
+from suds import WebFault
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.governor import Governor, TokenBucket, is_throttle_fault
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def throttle_fault(code='REQUEST_EXCEEDED_LIMIT'):
+    fault = Object()
+    fault.faultstring = 'limit exceeded'
+    fault.detail = Object()
+    fault.detail.fault = Object()
+    fault.detail.fault.FaultCode = code
+    return WebFault(fault, None)
+
+
+class GovernorTestCase(unittest.TestCase):
+
+    def test_is_throttle_fault(self):
+        self.assertTrue(is_throttle_fault(throttle_fault()))
+        self.assertTrue(is_throttle_fault(Exception((429, 'Too Many Requests'))))
+        self.assertFalse(is_throttle_fault(throttle_fault('INVALID_VALUE')))
+        self.assertFalse(is_throttle_fault(IOError("connection reset")))
+
+    def test_concurrency_cap(self):
+        governor = Governor(max_concurrency=3)
+        state = {'in_flight': 0, 'peak': 0}
+
+        def f():
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+            gevent.sleep(0.01)
+            state['in_flight'] -= 1
+
+        gevent.joinall([gevent.spawn(governor.call, f) for i in range(10)])
+        self.assertEqual(state['peak'], 3)
+        self.assertEqual(governor.in_flight, 0)
+
+    def test_killed_waiter_does_not_block_others(self):
+        governor = Governor(max_concurrency=1)
+        governor.acquire()
+        killed = gevent.spawn(governor.acquire)
+        waiting = gevent.spawn(governor.acquire)
+        gevent.sleep(0)
+        killed.kill()
+        governor.release()
+        waiting.join(timeout=1)
+        self.assertTrue(waiting.successful())
+        self.assertEqual(governor.in_flight, 1)
+
+    def test_killed_during_rate_limit_releases_slot(self):
+        governor = Governor(max_concurrency=1, rate=1, burst=1)
+        governor.call(lambda: None)
+        greenlet = gevent.spawn(governor.call, lambda: None)
+        gevent.sleep(0.01)
+        greenlet.kill()
+        self.assertEqual(governor.in_flight, 0)
+
+    def test_aimd(self):
+        governor = Governor(max_concurrency=8)
+        governor.on_throttle()
+        self.assertEqual(governor.concurrency, 4)
+        governor.on_throttle()
+        governor.on_throttle()
+        governor.on_throttle()
+        self.assertEqual(governor.concurrency, 1)
+        for i in range(3):
+            governor.on_success()
+        self.assertEqual(governor.concurrency, 2)
+        for i in range(100):
+            governor.on_success()
+        self.assertEqual(governor.concurrency, 8)
+
+    @patch('zuora_python_toolkit.governor.gevent.sleep')
+    def test_throttled_calls_are_retried(self, sleep_mock):
+        governor = Governor(max_concurrency=4, throttle_sleep_seconds=1)
+        f = Mock(side_effect=[throttle_fault(), throttle_fault(), 'ok'])
+        self.assertEqual(governor.call(f), 'ok')
+        self.assertEqual(governor.throttled, 2)
+        self.assertEqual(governor.concurrency, 2)
+        self.assertEqual([c[0][0] for c in sleep_mock.call_args_list], [1, 2])
+
+    @patch('zuora_python_toolkit.governor.gevent.sleep')
+    def test_throttle_retries_run_out(self, sleep_mock):
+        governor = Governor(throttle_retries=1)
+        f = Mock(side_effect=throttle_fault())
+        self.assertRaises(WebFault, governor.call, f)
+        self.assertEqual(f.call_count, 2)
+
+    def test_other_faults_are_not_retried(self):
+        governor = Governor()
+        f = Mock(side_effect=IOError("connection reset"))
+        self.assertRaises(IOError, governor.call, f)
+        self.assertEqual(f.call_count, 1)
+        self.assertEqual(governor.in_flight, 0)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        start = time.time()
+        for i in range(6):
+            bucket.take()
+        self.assertTrue(time.time() - start >= 0.04)
+
+
+class ZuoraGovernorTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        Governor.clear()
+        super(ZuoraGovernorTestCase, self).setUp()
+
+    def tearDown(self):
+        Governor.clear()
+
+    def test_clients_share_governor(self):
+        other = Zuora(wsdl='tests/apisandbox.zuora.a.63.0.wsdl', username='api@c.co', password='Asdf1234!',
+                      max_concurrency=2)
+        self.assertIs(self.client.governor, other.governor)
+
+    @patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+    @patch('zuora_python_toolkit.governor.gevent.sleep')
+    def test_call_is_governed(self, sleep_mock, login_required_mock):
+        f = Mock(side_effect=[throttle_fault(), ['ok']])
+        f.method.name = 'query'
+        self.assertEqual(self.client.call(f, 'SELECT Id FROM Account'), 'ok')
+        self.assertEqual(self.client.governor.throttled, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import logging
+from mock import Mock, patch
+
+from suds import WebFault
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.batch import BatchExecutor
+from zuora_python_toolkit.export import export_key
+from zuora_python_toolkit.journal import Journal
+from zuora_python_toolkit.retry import RetryPolicy
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase, query_result
+from zuora_python_toolkit.tests.test_batch import save_result
+from zuora_python_toolkit.tests.test_export import ZuoraExportBaseTestCase, export_record
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def error(code):
+    e = Object()
+    e.Code = code
+    e.Message = code
+    return e
+
+
+class JournalBaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'journal.db')
+        self.journal = Journal(self.filename)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+
+    def reopen(self):
+        self.journal.close()
+        self.journal = Journal(self.filename)
+
+
+class JournalTestCase(JournalBaseTestCase):
+
+    def test_entries_survive_reopening(self):
+        section = self.journal.section('exports')
+        section.put('export/Account', 'e1')
+        section.record_results({3: save_result(id='a3')})
+        self.reopen()
+        section = self.journal.section('exports')
+        self.assertEqual(section.get('export/Account'), 'e1')
+        self.assertEqual(section.results()[3].Id, 'a3')
+        self.assertIsNone(self.journal.section('other').get('export/Account'))
+
+    def test_remove_and_clear(self):
+        section = self.journal.section('exports')
+        section.put_many([('export/Account', 'e1'), ('export/Invoice', 'e2'), ('download/Account', 'path')])
+        self.assertEqual(sorted(section.items('export/')), ['export/Account', 'export/Invoice'])
+        section.remove('export/Account')
+        self.assertIsNone(section.get('export/Account'))
+        section.clear()
+        self.assertEqual(section.items(), {})
+
+
+class JournaledBatchTestCase(JournalBaseTestCase):
+
+    def test_resume_skips_recorded_results(self):
+        calls = []
+        down = [True]
+
+        def create(records):
+            calls.append(list(records))
+            if 6 in records and down[0]:
+                raise IOError("connection reset")
+            return [save_result(id=record) for record in records]
+        section = self.journal.section('create')
+        results = BatchExecutor(batch_size=3, concurrency=1, journal=section).run(create, range(8))
+        self.assertEqual([failure.index for failure in results.failures], [6, 7])
+        self.assertEqual(sorted(section.results()), range(6))
+
+        self.reopen()
+        del calls[:]
+        down[0] = False
+        section = self.journal.section('create')
+        results = BatchExecutor(batch_size=3, concurrency=1, journal=section).run(create, range(8))
+        self.assertEqual(calls, [[6, 7]])
+        self.assertTrue(results.success)
+        self.assertEqual([r.Id for r in results], range(8))
+
+    def test_replayable_failures_are_not_recorded(self):
+        def create(records):
+            results = []
+            for record in records:
+                if record == 1:
+                    results.append(save_result(False, errors=[error('LOCK_COMPETITION')]))
+                elif record == 2:
+                    results.append(save_result(False, errors=[error('INVALID_VALUE')]))
+                else:
+                    results.append(save_result(id=record))
+            return results
+        section = self.journal.section('create')
+        executor = BatchExecutor(batch_size=10, retry=RetryPolicy(max_attempts=1), journal=section)
+        results = executor.run(create, range(4))
+        self.assertEqual([failure.index for failure in results.failures], [1, 2])
+        self.assertEqual(sorted(section.results()), [0, 2, 3])
+
+        sent = []
+        results = executor.run(lambda records: sent.extend(records) or create(records), range(4))
+        self.assertEqual(sent, [1])
+        self.assertEqual([failure.index for failure in results.failures], [1, 2])
+        self.assertEqual(results[3].Id, 3)
+
+
+@patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+class ZuoraJournaledCallTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraJournaledCallTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.journal = Journal(os.path.join(self.directory, 'journal.db'))
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+
+    def test_batch_call_resumes(self, login_required_mock):
+        section = self.journal.section('update')
+        section.record_results({0: save_result(id='a0')})
+        update = Mock(side_effect=lambda records: [save_result(id=record.Id) for record in records])
+        update.method.name = 'update'
+        accounts = []
+        for i in range(3):
+            account = self.client.generate_object('Account')
+            account.Id = 'a%s' % i
+            accounts.append(account)
+        with patch.object(self.client, 'operation', return_value=update):
+            results = self.client.batch_call('update', accounts, journal=section)
+        self.assertEqual([r.Id for r in results], ['a0', 'a1', 'a2'])
+        self.assertEqual([record.Id for record in update.call_args[0][0]], ['a1', 'a2'])
+        self.assertEqual(sorted(section.results()), [0, 1, 2])
+
+    def test_iter_query_resumes_from_locator(self, login_required_mock):
+        pages = {
+            'page-2': query_result([3, 4], 'page-3'),
+            'page-3': query_result([5]),
+        }
+        self.client.query = Mock(return_value=query_result([1, 2], 'page-2'))
+        self.client.query_more = Mock(side_effect=lambda locator: pages[locator])
+        section = self.journal.section('accounts')
+        query = "SELECT Id FROM Account"
+
+        records = self.client.iter_query(query, prefetch=False, journal=section)
+        self.assertEqual([next(records), next(records), next(records)], [1, 2, 3])
+        self.assertEqual(section.get('locator'), (query, 'page-2'))
+        records.close()
+
+        self.client.query.reset_mock()
+        self.assertEqual(list(self.client.iter_query(query, journal=section)), [3, 4, 5])
+        self.assertFalse(self.client.query.called)
+        self.assertEqual(section.get('locator'), (query, None))
+        self.assertEqual(list(self.client.iter_query(query, journal=section)), [])
+
+    def test_iter_query_restarts_expired_locator(self, login_required_mock):
+        section = self.journal.section('accounts')
+        query = "SELECT Id FROM Account"
+        section.put('locator', (query, 'expired'))
+        self.client.query = Mock(return_value=query_result([1, 2]))
+        self.client.query_more = Mock(side_effect=WebFault(Object(), None))
+        self.assertEqual(list(self.client.iter_query(query, journal=section)), [1, 2])
+        self.client.query_more.assert_called_once_with('expired')
+
+
+@patch('zuora_python_toolkit.export.gevent.sleep')
+class ZuoraJournaledExportTestCase(ZuoraExportBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraJournaledExportTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.journal = Journal(os.path.join(self.directory, 'journal.db'))
+        self.droppath = self.directory + os.sep
+
+        def download(file_id, filename, droppath):
+            path = droppath + filename
+            open(path, 'w').close()
+            return path
+        self.client.download = Mock(side_effect=download)
+        self.exports = [
+            {'z_object': 'Account', 'fields': ['Id']},
+            {'z_object': 'Invoice', 'fields': ['Id']},
+            {'z_object': 'Payment', 'fields': ['Id']},
+        ]
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.directory)
+
+    def test_export_many_reattaches(self, sleep_mock):
+        section = self.journal.section('exports')
+        section.put(export_key('Invoice', ['Id']), 'e2')
+        section.put('download/Payment', self.droppath + 'Payment')
+        open(self.droppath + 'Payment', 'w').close()
+        self.client.create = Mock(return_value=save_result(id='e1'))
+        self.client.export_status = Mock(return_value={'e1': export_record('e1', 'Completed', 'f1'),
+                                                       'e2': export_record('e2', 'Completed', 'f2')})
+
+        downloaded = self.client.export_many(self.exports, droppath=self.droppath, journal=section)
+        self.assertEqual(downloaded, dict((filename, self.droppath + filename)
+                                          for filename in ('Account', 'Invoice', 'Payment')))
+        self.assertEqual([z_export.Query for z_export in self.client.create.call_args[0][0]],
+                         ['SELECT Id FROM Account'])
+        self.assertEqual(sorted(c[0][0] for c in self.client.download.call_args_list), ['f1', 'f2'])
+        self.assertEqual(section.get(export_key('Account', ['Id'])), 'e1')
+        self.assertEqual(section.get('download/Invoice'), self.droppath + 'Invoice')
+
+    def test_failed_exports_are_forgotten(self, sleep_mock):
+        section = self.journal.section('exports')
+        self.client.create = Mock(return_value=[save_result(id='e1'), save_result(id='e2'),
+                                                save_result(False, errors=['bad'])])
+        self.client.export_status = Mock(return_value={'e1': export_record('e1', 'Completed', 'f1'),
+                                                       'e2': export_record('e2', 'Failed')})
+        downloaded = self.client.export_many(self.exports, droppath=self.droppath, journal=section)
+        self.assertEqual(downloaded['Invoice'], None)
+        self.assertIsNone(section.get(export_key('Invoice', ['Id'])))
+        self.assertEqual(section.get(export_key('Account', ['Id'])), 'e1')
+
+    def test_export_reattaches(self, sleep_mock):
+        section = self.journal.section('export')
+        section.put(export_key('Account', ['Id']), 'e1')
+        self.client.create = Mock()
+        result = query_result([export_record('e1', 'Completed', 'f1')])
+        self.client.query = Mock(return_value=result)
+        self.assertEqual(self.client.export('Account', ['Id'], journal=section), 'f1')
+        self.assertFalse(self.client.create.called)
+        self.assertIn("'e1'", self.client.query.call_args[0][0])
+
+    def test_failed_export_raises_and_is_forgotten(self, sleep_mock):
+        section = self.journal.section('export')
+        section.put(export_key('Account', ['Id']), 'e1')
+        self.client.query = Mock(side_effect=[query_result([export_record('e1', 'Processing')]),
+                                              query_result([export_record('e1', 'Canceled')])])
+        with patch('zuora_python_toolkit.export.time.sleep'):
+            self.assertRaises(ZuoraError, self.client.export, 'Account', ['Id'], journal=section)
+        self.assertEqual(self.client.query.call_count, 2)
+        self.assertIsNone(section.get(export_key('Account', ['Id'])))
+
+    def test_export_and_export_many_share_exports(self, sleep_mock):
+        section = self.journal.section('exports')
+        self.client.create = Mock(return_value=save_result(id='e1'))
+        self.client.query = Mock(return_value=query_result([export_record('e1', 'Processing')]))
+        with patch('zuora_python_toolkit.export.time.sleep'):
+            self.assertIsNone(self.client.export('Account', ['Id'], max_tries=1, journal=section))
+
+        self.client.create = Mock()
+        self.client.export_status = Mock(return_value={'e1': export_record('e1', 'Completed', 'f1')})
+        downloaded = self.client.export_many(self.exports[:1], droppath=self.droppath, journal=section)
+        self.assertEqual(downloaded, {'Account': self.droppath + 'Account'})
+        self.assertFalse(self.client.create.called)
+        self.assertEqual(self.client.export_status.call_args[0][0], ['e1'])
+
+if __name__ == "__main__":
+    unittest.main()
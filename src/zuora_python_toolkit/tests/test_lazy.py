@@ -0,0 +1,73 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+import unittest
+import logging
+from mock import Mock, patch
+
+from zuora_python_toolkit.fastsoap import Record
+from zuora_python_toolkit.lazy import LazyModule, lazy_import
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+class LazyImportTestCase(unittest.TestCase):
+
+    def test_module_is_imported_on_first_attribute(self):
+        sys.modules.pop('colorsys', None)
+        colorsys = lazy_import('colorsys')
+        self.assertIsInstance(colorsys, LazyModule)
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertEqual(colorsys.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertIn('colorsys', sys.modules)
+        self.assertIs(colorsys.rgb_to_hsv, sys.modules['colorsys'].rgb_to_hsv)
+
+    def test_imported_module_is_returned(self):
+        self.assertIs(lazy_import('logging'), logging)
+
+    def test_missing_module(self):
+        self.assertRaises(ImportError, getattr, lazy_import('zuora_python_toolkit_missing'), 'name')
+
+    def test_importing_does_not_load_suds(self):
+        for module in ('sync', 'records', 'cache', 'batch', 'util'):
+            loaded = subprocess.check_output([sys.executable, '-c', 'import sys, zuora_python_toolkit.%s; '
+                                              'print "suds" in sys.modules' % module])
+            self.assertEqual(loaded.strip(), 'False', module)
+
+
+class ZuoraDeferredClientTestCase(ZuoraBaseTestCase):
+
+    def test_client_is_built_on_first_use(self):
+        with patch.object(self.client, 'build_client', wraps=self.client.build_client) as build_mock:
+            self.client.set_endpoint('https://apisandbox.zuora.com/apps/services/a/63.0')
+            self.assertFalse(build_mock.called)
+            client = self.client.client
+            self.assertIs(self.client.client, client)
+        self.assertEqual(build_mock.call_count, 1)
+        self.assertEqual(client.options.location, 'https://apisandbox.zuora.com/apps/services/a/63.0')
+        self.assertEqual(client.options.username, 'api@c.co')
+
+    def test_fast_soap_objects_do_not_build_the_client(self):
+        self.client.fast_soap = True
+        with patch.object(self.client, 'build_client') as build_mock:
+            self.assertIsInstance(self.client.generate_object('Account'), Record)
+            self.assertEqual(self.client.query_result([]).size, 0)
+        self.assertFalse(build_mock.called)
+
+    def test_warm_up(self):
+        self.client.login = Mock()
+        self.assertIs(self.client.warm_up(), self.client)
+        self.assertIsNotNone(self.client.client.wsdl)
+        self.assertFalse(self.client.login.called)
+        self.client.warm_up(login=True)
+        self.assertTrue(self.client.login.called)
+
+    def test_transport_is_fixed_once_built(self):
+        self.client.warm_up()
+        self.assertRaises(ZuoraError, self.client.use_transport, Mock())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import unittest
+import logging
+from mock import Mock, patch
+
+from suds import WebFault
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.fastsoap import Record
+from zuora_python_toolkit.metrics import NULL, NULL_TIMER, Instruments, MetricsRegistry, SpanHook
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase, query_result
+from zuora_python_toolkit.tests.test_batch import fake_create
+from zuora_python_toolkit.tests.test_governor import throttle_fault
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+
+    def test_null_instrumentation(self):
+        self.assertFalse(NULL.enabled)
+        self.assertIs(NULL.timer('call', operation='query'), NULL_TIMER)
+
+    @patch('zuora_python_toolkit.metrics.time.time', side_effect=[10.0, 10.2, 20.0, 23.0])
+    def test_timer(self, time_mock):
+        registry = MetricsRegistry()
+        with registry.timer('call', operation='query', z_object='Account'):
+            pass
+        with self.assertRaises(IOError):
+            with registry.timer('call', operation='query', z_object='Account'):
+                raise IOError()
+        histogram = registry.histogram('call', z_object='Account', operation='query')
+        self.assertEqual(histogram.count, 2)
+        self.assertAlmostEqual(histogram.sum, 3.2)
+        self.assertEqual(registry.counter('errors', phase='call', operation='query', z_object='Account'), 1)
+
+    def test_exposition(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.increment('records', 5, operation='query', z_object=None)
+        registry.observe('login', 0, 0.5)
+        self.assertEqual(registry.exposition(), '\n'.join([
+            '# TYPE zuora_records_total counter',
+            'zuora_records_total{operation="query"} 5',
+            '# TYPE zuora_login_seconds histogram',
+            'zuora_login_seconds_bucket{le="0.1"} 0',
+            'zuora_login_seconds_bucket{le="1"} 1',
+            'zuora_login_seconds_bucket{le="+Inf"} 1',
+            'zuora_login_seconds_sum 0.5',
+            'zuora_login_seconds_count 1',
+        ]) + '\n')
+
+    def test_span_hook(self):
+        spans = []
+        registry = MetricsRegistry()
+        instruments = Instruments(NULL, registry, SpanHook(spans.append))
+        with instruments.timer('parse', operation='query'):
+            pass
+        self.assertEqual([(span.name, span.labels) for span in spans], [('parse', {'operation': 'query'})])
+        self.assertEqual(registry.histogram('parse', operation='query').count, 1)
+        self.assertFalse(Instruments(NULL).enabled)
+
+
+@patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+class ZuoraMetricsTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraMetricsTestCase, self).setUp()
+        self.registry = MetricsRegistry()
+        self.client.instrumentation = self.registry
+
+    def test_call_metrics(self, login_required_mock):
+        f = Mock(return_value=[query_result([1, 2, 3])])
+        f.method.name = 'query'
+        self.client.call(f, "SELECT Id FROM Account")
+        self.assertEqual(self.registry.histogram('call', operation='query', z_object='Account').count, 1)
+        self.assertEqual(self.registry.counter('records', operation='query', z_object='Account'), 3)
+
+    def test_fault_metrics(self, login_required_mock):
+        f = Mock(side_effect=throttle_fault('INVALID_VALUE'))
+        f.method.name = 'delete'
+        self.assertRaises(WebFault, self.client.call, f, 'Invoice', ['a'])
+        self.assertEqual(self.registry.counter('faults', operation='delete', z_object='Invoice',
+                                               code='INVALID_VALUE'), 1)
+
+    def test_batch_metrics(self, login_required_mock):
+        f = Mock(side_effect=fake_create)
+        f.method.name = 'create'
+        self.client.call(f, [Record('Account', Name=str(i)) for i in range(120)])
+        self.assertEqual(self.registry.counter('batches', operation='create', z_object='Account'), 3)
+        self.assertEqual(self.registry.counter('batch_records', operation='create', z_object='Account'), 120)
+        self.assertEqual(self.registry.counter('records', operation='create', z_object='Account'), 120)
+
+    def test_instrumentation_reaches_transport(self, login_required_mock):
+        client = Zuora(wsdl='tests/apisandbox.zuora.a.63.0.wsdl', instrumentation=self.registry)
+        self.assertIs(client.transport.instrumentation, self.registry)
+
+if __name__ == "__main__":
+    unittest.main()
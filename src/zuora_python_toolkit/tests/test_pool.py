@@ -0,0 +1,99 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import unittest
+import logging
+from mock import Mock, patch
+
+from zuora_python_toolkit.export import ZuoraExport
+from zuora_python_toolkit.pool import ClientPool
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+WSDL = 'tests/apisandbox.zuora.a.63.0.wsdl'
+
+
+class ClientPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ClientPool(wsdl=WSDL)
+        self.pool.register('acme', username='api@acme.com', password='a')
+        self.pool.register('initech', username='api@initech.com', password='b', fast_soap=True)
+
+    def test_clients_share_the_wsdl(self):
+        acme, initech = self.pool['acme'], self.pool['initech']
+        self.assertIs(self.pool['acme'], acme)
+        self.assertIsNot(acme.client, initech.client)
+        self.assertIs(acme.client.wsdl, initech.client.wsdl)
+        self.assertIs(acme.client.wsdl, self.pool.prototype.wsdl)
+        self.assertIsNot(acme.transport.session, initech.transport.session)
+        # Tenants share the connection pool but not the cookies
+        self.assertIsNot(acme.transport.session.cookies, initech.transport.session.cookies)
+        self.assertIs(acme.transport.session.get_adapter('https://'),
+                      initech.transport.session.get_adapter('https://'))
+        self.assertEqual(acme.client.options.username, 'api@acme.com')
+        self.assertEqual(initech.client.options.username, 'api@initech.com')
+
+    def test_session_state_is_per_tenant(self):
+        acme, initech = self.pool['acme'], self.pool['initech']
+        acme.set_endpoint('https://acme.zuora.com/apps/services/a/63.0')
+        acme.set_session_id('acme-session')
+        self.assertIsNone(initech.get_endpoint())
+        self.assertIsNone(initech.get_session_id())
+        self.assertEqual(initech.client.options.location, None)
+        self.assertEqual(acme.client.options.location, 'https://acme.zuora.com/apps/services/a/63.0')
+
+    def test_tenant_options(self):
+        self.assertFalse(self.pool['acme'].fast_soap)
+        self.assertTrue(self.pool['initech'].fast_soap)
+        self.pool.register('acme', username='api@acme.com', password='c', fast_soap=True)
+        self.assertTrue(self.pool['acme'].fast_soap)
+        self.assertRaises(ZuoraError, self.pool.client, 'unknown')
+        self.pool.remove('initech')
+        self.assertEqual(self.pool.tenants, ['acme'])
+
+    def test_client_class(self):
+        pool = ClientPool(client_class=ZuoraExport, wsdl=WSDL)
+        pool.register('acme', username='api@acme.com', password='a')
+        self.assertIsInstance(pool['acme'], ZuoraExport)
+
+    def test_transport_cannot_be_shared(self):
+        self.assertRaises(ValueError, ClientPool, wsdl=WSDL, transport=Mock())
+
+    def test_run(self):
+        def f(client):
+            if client.username == 'api@initech.com':
+                raise ZuoraError('no')
+            return client.username
+        results = self.pool.run(f)
+        self.assertEqual(results['acme'], 'api@acme.com')
+        self.assertIsInstance(results['initech'], ZuoraError)
+        self.assertEqual(self.pool.run(f, ['acme']), {'acme': 'api@acme.com'})
+
+
+@patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+class ZuoraRequestHeadersTestCase(ZuoraBaseTestCase):
+
+    def test_headers_are_set_for_each_request(self, login_required_mock):
+        sent = []
+
+        def query(query_string):
+            sent.append(sorted(self.client.client.options.soapheaders))
+            return [query_string]
+        f = Mock(side_effect=query)
+        f.method.name = 'query'
+
+        def governed(call):
+            # Another greenlet's call sets its headers while this one waits for the Governor
+            def waited(*args, **kwargs):
+                self.client.set_headers('create')
+                return call(*args, **kwargs)
+            waited.method = call.method
+            return waited
+        with patch('zuora_python_toolkit.base.Governor.governed', side_effect=governed):
+            self.client.call(f, "SELECT Id FROM Account")
+        self.assertEqual(sent, [['QueryOptions', 'SessionHeader']])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import cPickle
+import unittest
+import logging
+
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.fastsoap import Record
+from zuora_python_toolkit.records import Page, RowFactory, iter_csv_rows, row_class, select_fields
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+class RowTestCase(unittest.TestCase):
+
+    def test_row_class(self):
+        Account = row_class('Account', ('Id', 'Name'))
+        self.assertIs(Account, row_class('Account', ['Id', 'Name']))
+        row = Account(('1', 'Acme'))
+        self.assertEqual(row, ('1', 'Acme'))
+        self.assertEqual((row.Id, row.Name, row.type), ('1', 'Acme', 'Account'))
+        self.assertEqual(row.get('Name'), 'Acme')
+        self.assertIsNone(row.get('Balance'))
+        self.assertEqual(row._asdict(), {'Id': '1', 'Name': 'Acme'})
+        self.assertFalse(hasattr(row, '__dict__'))
+
+    def test_pickle(self):
+        row = row_class('Account', ('Id', 'Name'))(('1', 'Acme'))
+        copy = cPickle.loads(cPickle.dumps(row, 2))
+        self.assertEqual(copy, row)
+        self.assertEqual(copy.Name, 'Acme')
+
+    def test_select_fields(self):
+        self.assertEqual(select_fields("SELECT Id, Name,Balance FROM Account WHERE Name = 'x'"),
+                         ['Id', 'Name', 'Balance'])
+        self.assertEqual(select_fields("select Id\nfrom Account"), ['Id'])
+        self.assertEqual(select_fields(None), [])
+
+
+class RowFactoryTestCase(unittest.TestCase):
+
+    def test_page(self):
+        suds_record = Object()
+        suds_record.Id = '1'
+        suds_record.Name = 'Acme'
+        records = [suds_record, Record('Account', Id='2'), Record('Account', Id='3', Balance=1.5)]
+        page = RowFactory(['Id', 'Name']).page(records)
+        self.assertEqual(page.fields, ('Id', 'Name', 'Balance'))
+        self.assertEqual(len(page), 3)
+        self.assertEqual(list(page.column('Id')), ['1', '2', '3'])
+        # Rows made before Balance was seen are shorter
+        self.assertEqual(list(page.column('Balance')), [None, None, 1.5])
+        self.assertEqual(page.column('Name')[0:2], ['Acme', None])
+        self.assertEqual(page.columns().keys(), ['Id', 'Name', 'Balance'])
+
+    def test_columns_are_views(self):
+        Account = row_class('Account', ('Id',))
+        page = Page(['Id'], [Account(('1',))])
+        column = page.column('Id')
+        page.records.append(Account(('2',)))
+        self.assertEqual(list(column), ['1', '2'])
+
+
+class IterCsvRowsTestCase(unittest.TestCase):
+
+    def test_iter_csv_rows(self):
+        rows = list(iter_csv_rows(['Id,Account.Name\n', '1,a\n', '2\n']))
+        self.assertEqual(rows, [('1', 'a'), ('2', None)])
+        self.assertEqual(rows[0].Account_Name, 'a')
+        self.assertEqual(list(iter_csv_rows([])), [])
+
+    def test_iter_csv_rows_skips_empty_lines(self):
+        rows = list(iter_csv_rows(['Id,Name\r\n', '1,a\r', '\n', '2,b\r\n']))
+        self.assertEqual(rows, [('1', 'a'), ('2', 'b')])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from decimal import Decimal
+import unittest
+import logging
+from mock import Mock, patch
+
+from zuora_python_toolkit.fastsoap import Record
+from zuora_python_toolkit.replica import SqliteStore, column_name
+from zuora_python_toolkit.sync import IncrementalSync
+from zuora_python_toolkit.tests.test_export import ZuoraExportBaseTestCase, download_response
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+class SqliteStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SqliteStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_upsert(self):
+        records = [Record('Account', Id='a1', Name='Acme', Balance=Decimal('1.50'), AutoPay=True,
+                          UpdatedDate=datetime(2020, 1, 2)),
+                   {'Id': 'a2', 'Name': 'Initech'}]
+        self.assertEqual(self.store.upsert('Account', records), 2)
+        self.assertEqual(self.store.upsert('Account', records), 0)
+        self.assertEqual(self.store.get('Account', 'a1'), {'Id': 'a1', 'Name': 'Acme', 'Balance': '1.50',
+                                                          'AutoPay': 1, 'UpdatedDate': '2020-01-02T00:00:00'})
+        self.assertIsNone(self.store.get('Account', 'a3'))
+        self.assertEqual(self.store.count('Account'), 2)
+
+        older = Record('Account', Id='a1', Name='Old', UpdatedDate=datetime(2020, 1, 1))
+        self.assertEqual(self.store.upsert('Account', [older]), 0)
+        newer = Record('Account', Id='a1', Name='New', UpdatedDate=datetime(2020, 1, 3))
+        self.assertEqual(self.store.upsert('Account', [newer]), 1)
+        self.assertEqual(self.store.get('Account', 'a1')['Name'], 'New')
+
+    def test_find_and_join(self):
+        self.store.upsert('Account', [{'Id': 'a1', 'Name': 'Acme'}, {'Id': 'a2', 'Name': 'Initech'}])
+        self.store.upsert('Subscription', [{'Id': 's1', 'AccountId': 'a1', 'Name': 'S-1'},
+                                           {'Id': 's2', 'AccountId': 'a1', 'Name': 'S-2'},
+                                           {'Id': 's3', 'AccountId': 'a2', 'Name': 'S-3'}])
+        self.assertEqual(sorted(s['Id'] for s in self.store.find('Subscription', AccountId='a1')), ['s1', 's2'])
+        self.assertEqual(self.store.find('Subscription', Status='Active'), [])
+        indexes = [row['name'] for row in self.store.sql("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        self.assertIn('Subscription_AccountId', indexes)
+        rows = self.store.sql('SELECT a.Name AS Account, COUNT(*) AS Subscriptions FROM Account a '
+                              'JOIN Subscription s ON s.AccountId = a.Id GROUP BY a.Name ORDER BY a.Name')
+        self.assertEqual(rows, [{'Account': 'Acme', 'Subscriptions': 2}, {'Account': 'Initech', 'Subscriptions': 1}])
+
+    def test_load(self):
+        rows = ({'Subscription.Id': 's%s' % i, 'Subscription.Name': 'S-%s' % i, 'Account.Id': 'a1',
+                 'Account.Name': 'Acme', 'Subscription.Notes': ''} for i in range(25))
+        self.assertEqual(self.store.load('Subscription', rows, batch_size=10), 25)
+        self.assertEqual(self.store.get('Subscription', 's3'),
+                         {'Id': 's3', 'Name': 'S-3', 'AccountId': 'a1', 'Account.Name': 'Acme'})
+
+    def test_load_skips_rows_without_id(self):
+        rows = [{'Account.Id': 'a1', 'Account.Name': 'Acme'}, {'Account.Id': None, 'Account.Name': None},
+                {'Account.Id': 'a2', 'Account.Name': 'Initech'}]
+        self.assertEqual(self.store.load('Account', rows), 2)
+        self.assertEqual(self.store.count('Account'), 2)
+        self.assertRaises(ZuoraError, self.store.upsert, 'Account', [{'Name': 'Acme'}])
+
+    def test_column_name(self):
+        self.assertEqual(column_name('Account.Name', 'Account'), 'Name')
+        self.assertEqual(column_name('Account.Id', 'Subscription'), 'AccountId')
+        self.assertEqual(column_name('Id', 'Subscription'), 'Id')
+
+    def test_incremental_sync_store(self):
+        zuora = Mock()
+        zuora.iter_query.return_value = iter([Record('Account', Id='a1', Name='Acme',
+                                                     UpdatedDate=datetime(2020, 1, 2))])
+        state = Mock()
+        state.watermark.return_value = None
+        result = IncrementalSync(zuora, state, self.store).sync('Account', ['Name'])
+        self.assertEqual(result.changed, 1)
+        self.assertEqual(self.store.get('Account', 'a1')['Name'], 'Acme')
+
+
+@patch('zuora_python_toolkit.transport.requests.Session.get')
+class ZuoraDownloadToStoreTestCase(ZuoraExportBaseTestCase):
+
+    def setUp(self):
+        super(ZuoraDownloadToStoreTestCase, self).setUp()
+        self.client.set_endpoint('https://apisandbox.zuora.com/apps/services/a/63.0')
+        self.client.set_session_id('session')
+
+    def test_download_to_store(self, get_mock):
+        get_mock.return_value = download_response(['RatePlan.Id,RatePlan.Name,Subscrip', 'tion.Id\n',
+                                                   'r1,Gold,s1\n', 'r2,Silver,s1\n'])
+        with SqliteStore(':memory:') as store:
+            self.assertEqual(self.client.download_to_store('file-id', store, 'RatePlan'), 2)
+            self.assertEqual([r['Name'] for r in store.find('RatePlan', SubscriptionId='s1')], ['Gold', 'Silver'])
+
+if __name__ == "__main__":
+    unittest.main()
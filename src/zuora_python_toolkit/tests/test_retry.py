@@ -0,0 +1,153 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import errno
+import socket
+import unittest
+import logging
+from mock import Mock, patch
+
+from requests.exceptions import ConnectionError, Timeout
+from suds.sudsobject import Object
+from suds.transport import TransportError
+
+from zuora_python_toolkit.batch import BatchExecutor
+from zuora_python_toolkit.retry import AMBIGUOUS, FATAL, RETRYABLE, RetryPolicy, classify
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from zuora_python_toolkit.tests.test_batch import save_result
+from zuora_python_toolkit.tests.test_governor import throttle_fault
+from zuora_python_toolkit.util import fault_code
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def error(code):
+    e = Object()
+    e.Code = code
+    e.Message = code.lower()
+    return e
+
+
+class ClassifyTestCase(unittest.TestCase):
+
+    def test_classify(self):
+        self.assertEqual(classify(throttle_fault('LOCK_COMPETITION')), RETRYABLE)
+        self.assertEqual(classify(throttle_fault('TRANSACTION_TIMEOUT')), AMBIGUOUS)
+        self.assertEqual(classify(throttle_fault('UNKNOWN_ERROR')), AMBIGUOUS)
+        self.assertEqual(classify(throttle_fault('INVALID_VALUE')), FATAL)
+        self.assertEqual(classify(TransportError('unavailable', 503, None)), RETRYABLE)
+        self.assertEqual(classify(TransportError('gateway timeout', 504, None)), AMBIGUOUS)
+        self.assertEqual(classify(TransportError('not found', 404, None)), FATAL)
+        self.assertEqual(classify(Timeout('read timed out')), AMBIGUOUS)
+        self.assertEqual(classify(ConnectionError(socket.error(errno.ECONNREFUSED, 'Connection refused'))),
+                         RETRYABLE)
+        self.assertEqual(classify(ConnectionError(socket.error(errno.ECONNRESET, 'Connection reset'))), AMBIGUOUS)
+        self.assertEqual(classify(socket.timeout('timed out')), AMBIGUOUS)
+        self.assertEqual(classify(ValueError('bad')), FATAL)
+
+    def test_codes_are_only_read_from_the_fault_detail(self):
+        self.assertEqual(classify(Exception("Server raised fault: 'LOCK_COMPETITION'")), FATAL)
+        self.assertEqual(classify(ValueError('ACCOUNT_ID is not a LOCK_COMPETITION')), FATAL)
+        self.assertEqual(fault_code(RuntimeError('REQUEST_EXCEEDED_LIMIT')), None)
+        self.assertEqual(fault_code(throttle_fault('REQUEST_EXCEEDED_LIMIT')), 'REQUEST_EXCEEDED_LIMIT')
+
+
+@patch('zuora_python_toolkit.retry.gevent.sleep')
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def test_retries_retryable_faults(self, sleep_mock):
+        f = Mock(side_effect=[throttle_fault('LOCK_COMPETITION'), throttle_fault('SERVER_UNAVAILABLE'), 'ok'])
+        self.assertEqual(RetryPolicy(base_seconds=1, jitter=0).call(f, ('a',)), 'ok')
+        self.assertEqual(f.call_count, 3)
+        self.assertEqual([c[0][0] for c in sleep_mock.call_args_list], [1, 2])
+
+    def test_gives_up(self, sleep_mock):
+        f = Mock(side_effect=throttle_fault('LOCK_COMPETITION'))
+        self.assertRaises(Exception, RetryPolicy(max_attempts=3).call, f)
+        self.assertEqual(f.call_count, 3)
+
+    def test_ambiguous_failures_are_only_retried_when_idempotent(self, sleep_mock):
+        f = Mock(side_effect=[Timeout('read timed out'), 'ok'])
+        self.assertRaises(Timeout, RetryPolicy().call, f)
+        self.assertEqual(f.call_count, 1)
+        self.assertEqual(RetryPolicy().call(f, idempotent=True), 'ok')
+
+    def test_delay(self, sleep_mock):
+        policy = RetryPolicy(base_seconds=1, max_seconds=5, jitter=0.5)
+        for attempt, longest in [(1, 1), (2, 2), (3, 4), (4, 5), (10, 5)]:
+            delay = policy.delay(attempt)
+            self.assertTrue(longest / 2.0 <= delay <= longest)
+
+
+@patch('zuora_python_toolkit.retry.gevent.sleep')
+@patch('zuora_python_toolkit.batch.gevent.sleep')
+class BatchRetryTestCase(unittest.TestCase):
+
+    def test_failed_chunk_is_retried(self, batch_sleep_mock, retry_sleep_mock):
+        calls = []
+
+        def create(records):
+            calls.append(list(records))
+            if len(calls) == 1:
+                raise throttle_fault('TRANSACTION_TERMINATED')
+            return [save_result(id=record) for record in records]
+        executor = BatchExecutor(batch_size=3, concurrency=1, retry=RetryPolicy())
+        results = executor.run(create, range(5))
+        self.assertTrue(results.success)
+        self.assertEqual([r.Id for r in results], range(5))
+        self.assertEqual(calls, [[0, 1, 2], [0, 1, 2], [3, 4]])
+
+    def test_only_failed_records_are_replayed(self, batch_sleep_mock, retry_sleep_mock):
+        calls = []
+
+        def create(records):
+            calls.append(list(records))
+            results = []
+            for record in records:
+                if record in (1, 3) and len(calls) == 1:
+                    results.append(save_result(False, errors=[error('LOCK_COMPETITION')]))
+                elif record == 4:
+                    results.append(save_result(False, errors=[error('INVALID_VALUE')]))
+                else:
+                    results.append(save_result(id=record))
+            return results
+        executor = BatchExecutor(batch_size=10, retry=RetryPolicy())
+        results = executor.run(create, range(5))
+        self.assertEqual(calls, [[0, 1, 2, 3, 4], [1, 3]])
+        self.assertEqual([r.Id for r in results[:4]], [0, 1, 2, 3])
+        self.assertEqual([(f.index, f.item) for f in results.failures], [(4, 4)])
+
+    def test_create_is_not_resent_after_timeout(self, batch_sleep_mock, retry_sleep_mock):
+        f = Mock(side_effect=Timeout('read timed out'))
+        results = BatchExecutor(batch_size=2, retry=RetryPolicy()).run(f, range(4))
+        self.assertEqual(f.call_count, 2)
+        self.assertEqual(len(results.failures), 4)
+
+        f = Mock(side_effect=[Timeout('read timed out'), [save_result(), save_result()]])
+        results = BatchExecutor(batch_size=2, retry=RetryPolicy(), idempotent=True).run(f, range(2))
+        self.assertTrue(results.success)
+
+
+@patch('zuora_python_toolkit.retry.gevent.sleep')
+@patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+class ZuoraRetryTestCase(ZuoraBaseTestCase):
+
+    def test_small_calls_are_retried(self, login_required_mock, sleep_mock):
+        f = Mock(side_effect=[throttle_fault('UNKNOWN_ERROR'), [save_result(id='a')]])
+        f.method.name = 'update'
+        self.assertEqual(self.client.call(f, [Object()]).Id, 'a')
+
+    def test_create_is_not_resent_after_unknown_error(self, login_required_mock, sleep_mock):
+        f = Mock(side_effect=[throttle_fault('UNKNOWN_ERROR'), [save_result(id='a')]])
+        f.method.name = 'create'
+        self.assertRaises(Exception, self.client.call, f, [Object()])
+        self.assertEqual(f.call_count, 1)
+
+    def test_retry_can_be_turned_off(self, login_required_mock, sleep_mock):
+        self.client.retry = None
+        f = Mock(side_effect=throttle_fault('UNKNOWN_ERROR'))
+        f.method.name = 'update'
+        self.assertRaises(Exception, self.client.call, f, [Object()])
+        self.assertEqual(f.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from os import path
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import logging
+from mock import patch
+
+from zuora_python_toolkit.base import Zuora
+from zuora_python_toolkit.schema import SchemaCache, _SchemaId, compile_schema, main, wsdl_url
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+CONF_DIR = path.abspath(path.join(path.dirname(__file__), '..', '..', '..', 'conf'))
+WSDL = path.join(CONF_DIR, 'zuora.a.63.0.wsdl')
+SANDBOX_WSDL = path.join(CONF_DIR, 'apisandbox.zuora.a.63.0.wsdl')
+
+
+class SchemaCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.cache = SchemaCache(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_compile_schema(self):
+        fn = compile_schema(WSDL, self.location)
+        self.assertTrue(path.isfile(fn))
+        self.assertTrue(path.basename(fn).startswith('zuora.a.63.0-'))
+        self.assertIsNotNone(self.cache.get(_SchemaId(wsdl_url(WSDL))))
+
+    def test_each_wsdl_has_its_own_key(self):
+        self.assertNotEqual(self.cache.key(wsdl_url(WSDL)), self.cache.key(wsdl_url(SANDBOX_WSDL)))
+
+    def test_key_depends_on_contents_not_location(self):
+        copy = path.join(self.location, 'zuora.a.63.0.wsdl')
+        shutil.copyfile(WSDL, copy)
+        self.assertEqual(self.cache.key(wsdl_url(WSDL)), self.cache.key(wsdl_url(copy)))
+
+    def test_expired_schema_is_ignored(self):
+        compile_schema(WSDL, self.location)
+        cache = SchemaCache(self.location, duration=60)
+        fn = cache.filename(wsdl_url(WSDL))
+        os.utime(fn, (time.time() - 120, time.time() - 120))
+        self.assertIsNone(cache.get(_SchemaId(wsdl_url(WSDL))))
+
+    def test_schema_writable_by_others_is_ignored(self):
+        compile_schema(WSDL, self.location)
+        fn = self.cache.filename(wsdl_url(WSDL))
+        os.chmod(fn, 0666)
+        self.assertIsNone(self.cache.get(_SchemaId(wsdl_url(WSDL))))
+        os.chmod(fn, 0644)
+        os.chmod(self.location, 0777)
+        self.assertIsNone(self.cache.get(_SchemaId(wsdl_url(WSDL))))
+        os.chmod(self.location, 0700)
+        self.assertIsNotNone(self.cache.get(_SchemaId(wsdl_url(WSDL))))
+
+    def test_schema_of_another_user_is_ignored(self):
+        compile_schema(WSDL, self.location)
+        with patch('zuora_python_toolkit.schema.os.getuid', return_value=os.getuid() + 1):
+            self.assertIsNone(self.cache.get(_SchemaId(wsdl_url(WSDL))))
+
+    def test_new_location_is_private(self):
+        location = path.join(self.location, 'cache')
+        fn = compile_schema(WSDL, location)
+        self.assertEqual(os.stat(location).st_mode & 0777, 0700)
+        self.assertEqual(os.stat(fn).st_mode & 0777, 0600)
+
+    def test_client_loads_compiled_schema(self):
+        compile_schema(SANDBOX_WSDL, self.location)
+        with patch('suds.client.Definitions') as definitions_mock:
+            client = Zuora(wsdl=SANDBOX_WSDL, schema_cache=self.location)
+        self.assertFalse(definitions_mock.called)
+        self.assertIsNotNone(client.generate_object('Account'))
+
+    def test_main(self):
+        self.assertEqual(main(['--location', self.location, WSDL, SANDBOX_WSDL]), 0)
+        self.assertEqual(len(os.listdir(self.location)), 2)
+
+if __name__ == "__main__":
+    unittest.main()
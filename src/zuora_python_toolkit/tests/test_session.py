@@ -0,0 +1,181 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import gc
+import itertools
+import unittest
+import logging
+import weakref
+from mock import Mock, patch
+
+import gevent
+from suds import WebFault
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.session import SessionManager
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from zuora_python_toolkit.tests.test_batch import save_result
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def login_results():
+    for i in itertools.count(1):
+        gevent.sleep(0)
+        yield {'Session': 'session-%s' % i, 'ServerUrl': 'https://apisandbox.zuora.com/apps/services/a/63.0'}
+
+
+def invalid_session_fault():
+    fault = Object()
+    fault.faultstring = 'invalid session'
+    fault.detail = Object()
+    fault.detail.fault = Object()
+    fault.detail.fault.FaultCode = 'INVALID_SESSION'
+    return WebFault(fault, None)
+
+
+class SessionManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        results = login_results()
+        self.login = Mock(side_effect=lambda: next(results))
+        self.manager = SessionManager(self.login, refresh=False)
+
+    def test_concurrent_logins_are_deduplicated(self):
+        greenlets = [gevent.spawn(self.manager.login) for i in range(10)]
+        gevent.joinall(greenlets)
+        self.assertEqual(self.login.call_count, 1)
+        self.assertEqual(set(g.value.session_id for g in greenlets), set(['session-1']))
+
+    def test_stale_session_is_replaced_once(self):
+        session = self.manager.login()
+        greenlets = [gevent.spawn(self.manager.login, session.session_id) for i in range(5)]
+        gevent.joinall(greenlets)
+        self.assertEqual(self.login.call_count, 2)
+        self.assertEqual(self.manager.current().session_id, 'session-2')
+
+    def test_expired_session(self):
+        session = self.manager.login()
+        session.expires = datetime.now() - timedelta(seconds=1)
+        self.assertIsNone(self.manager.current())
+        self.assertEqual(self.manager.login().session_id, 'session-2')
+
+    def test_invalidate(self):
+        session = self.manager.login()
+        self.manager.invalidate('another-session')
+        self.assertEqual(self.manager.current(), session)
+        self.manager.invalidate(session.session_id)
+        self.assertIsNone(self.manager.current())
+
+    def test_background_refresh(self):
+        manager = SessionManager(self.login, session_length_millis=100, refresh_margin_millis=50)
+        manager.login()
+        gevent.sleep(0.08)
+        self.assertEqual(manager.current().session_id, 'session-2')
+        manager.stop()
+
+
+class Client(object):
+
+    def __init__(self, results):
+        self.results = results
+        self.logins = 0
+
+    def login(self):
+        self.logins += 1
+        return next(self.results)
+
+
+class SessionManagerLifetimeTestCase(unittest.TestCase):
+
+    def test_manager_does_not_keep_client_alive(self):
+        client = Client(login_results())
+        manager = SessionManager(client.login, session_length_millis=1000, refresh_margin_millis=950)
+        manager.login()
+        client_ref = weakref.ref(client)
+        del client
+        gc.collect()
+        self.assertIsNone(client_ref())
+        # The refresh finds the client gone and stops
+        gevent.sleep(0.1)
+        self.assertEqual(manager.session.session_id, 'session-1')
+        self.assertIsNone(manager._SessionManager__refresher)
+
+    def test_close_stops_refresh(self):
+        client = Client(login_results())
+        manager = SessionManager.for_credentials('wsdl', 'api@c.co', 'secret', client.login,
+                                                 session_length_millis=1000, refresh_margin_millis=950)
+        manager.login()
+        manager.close()
+        gevent.sleep(0.1)
+        self.assertEqual(client.logins, 1)
+        self.assertIsNone(manager.current())
+        self.assertIsNot(SessionManager.for_credentials('wsdl', 'api@c.co', 'secret', client.login), manager)
+        SessionManager.clear()
+
+    def test_login_uses_the_callers_login(self):
+        first, second = Client(login_results()), Client(login_results())
+        manager = SessionManager(first.login, refresh=False)
+        session = manager.login()
+        manager.login(stale_session_id=session.session_id, login=second.login)
+        self.assertEqual((first.logins, second.logins), (1, 1))
+
+
+class ZuoraSessionTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        SessionManager.clear()
+        super(ZuoraSessionTestCase, self).setUp()
+        results = login_results()
+        self.login_mock = patch('zuora_python_toolkit.base.Zuora.login_to_zuora',
+                                side_effect=lambda: next(results)).start()
+
+    def tearDown(self):
+        patch.stopall()
+        SessionManager.clear()
+
+    def test_clients_share_session(self):
+        other = self.client.__class__(wsdl='tests/apisandbox.zuora.a.63.0.wsdl', username='api@c.co',
+                                      password='Asdf1234!')
+        self.client.login()
+        self.assertFalse(other.login_required())
+        self.assertEqual(other.get_session_id(), 'session-1')
+        self.assertEqual(self.login_mock.call_count, 1)
+
+    def test_retry_on_invalid_session(self):
+        f = Mock(side_effect=[invalid_session_fault(), ['ok']])
+        f.method.name = 'query'
+        self.assertEqual(self.client.call(f, 'SELECT Id FROM Account'), 'ok')
+        self.assertEqual(f.call_count, 2)
+        self.assertEqual(self.login_mock.call_count, 2)
+        self.assertEqual(self.client.get_session_id(), 'session-2')
+
+    def test_batch_chunks_renew_invalid_session(self):
+        self.client.login()
+        self.client.set_batch_size(10)
+
+        def create(records):
+            session_id = self.client.get_session_id()
+            gevent.sleep(0)
+            if session_id == 'session-1':
+                raise invalid_session_fault()
+            return [save_result(id=record) for record in records]
+        f = Mock(side_effect=create)
+        f.method.name = 'create'
+        results = self.client.call(f, range(30))
+        self.assertTrue(results.success)
+        self.assertEqual(len(results), 30)
+        self.assertEqual(f.call_count, 6)
+        self.assertEqual(self.login_mock.call_count, 2)
+        self.assertEqual(self.client.get_session_id(), 'session-2')
+
+    def test_other_faults_are_raised(self):
+        fault = invalid_session_fault()
+        fault.fault.detail.fault.FaultCode = 'INVALID_VALUE'
+        f = Mock(side_effect=fault)
+        f.method.name = 'query'
+        self.assertRaises(WebFault, self.client.call, f, 'SELECT Id FROM Account')
+        self.assertEqual(f.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import unittest
+import logging
+from mock import Mock, patch
+
+from suds.sudsobject import Object
+
+from zuora_python_toolkit.subscribe import BulkSubscribe, subscribe_request
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+from zuora_python_toolkit.util import ZuoraError
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def row(name):
+    return {
+        'Account': {'Name': name, 'Currency': 'USD'},
+        'BillToContact': {'FirstName': 'Ann', 'LastName': name},
+        'SubscriptionData': {
+            'Subscription': {'ContractEffectiveDate': '2020-01-01'},
+            'RatePlanData': [{'RatePlan': {'ProductRatePlanId': 'plan-a'}},
+                             {'RatePlan': {'ProductRatePlanId': 'plan-b'}}],
+        },
+    }
+
+
+def subscribe_result(request):
+    result = Object()
+    name = request.Account.Name
+    result.Success = not name.startswith('bad')
+    if result.Success:
+        result.AccountId = 'account-%s' % name
+        result.SubscriptionId = 'subscription-%s' % name
+        result.InvoiceId = 'invoice-%s' % name
+    else:
+        error = Object()
+        error.Code = 'INVALID_VALUE'
+        error.Message = 'bad account'
+        result.Errors = [error]
+    return result
+
+
+class SubscribeRequestTestCase(ZuoraBaseTestCase):
+
+    def test_subscribe_request(self):
+        request = subscribe_request(self.client, row('acme'))
+        self.assertEqual(request.__class__.__name__, 'SubscribeRequest')
+        self.assertEqual(request.Account.Name, 'acme')
+        self.assertEqual(request.BillToContact.LastName, 'acme')
+        self.assertEqual([data.RatePlan.ProductRatePlanId for data in request.SubscriptionData.RatePlanData],
+                         ['plan-a', 'plan-b'])
+        self.assertEqual(request.SubscriptionData.RatePlanData[0].__class__.__name__, 'RatePlanData')
+
+    def test_subscribe_requests_are_suds_objects_with_fast_soap(self):
+        self.client.fast_soap = True
+        request = subscribe_request(self.client, row('acme'))
+        self.assertEqual(request.__class__.__name__, 'SubscribeRequest')
+
+
+@patch('zuora_python_toolkit.base.Zuora.login_required', return_value=False)
+class BulkSubscribeTestCase(ZuoraBaseTestCase):
+
+    def setUp(self):
+        super(BulkSubscribeTestCase, self).setUp()
+        self.subscribe = Mock(side_effect=lambda requests: [subscribe_result(request) for request in requests])
+        self.subscribe.method.name = 'subscribe'
+        self.client.operation = Mock(return_value=self.subscribe)
+        self.client.set_batch_size(10)
+
+    def test_rows_are_batched_and_mapped_to_results(self, login_required_mock):
+        rows = [row('a%s' % i) for i in range(45)]
+        rows[7] = row('bad7')
+        outcomes = list(BulkSubscribe(self.client, window_size=30).run(iter(rows)))
+        self.assertEqual([o.index for o in outcomes], range(45))
+        self.assertEqual([len(c[0][0]) for c in self.subscribe.call_args_list], [10, 10, 10, 10, 5])
+        self.assertEqual(outcomes[44].row, rows[44])
+        self.assertEqual((outcomes[44].account_id, outcomes[44].subscription_id, outcomes[44].invoice_id),
+                         ('account-a44', 'subscription-a44', 'invoice-a44'))
+        self.assertEqual([o.index for o in outcomes if not o.success], [7])
+        self.assertEqual(outcomes[7].errors[0].Code, 'INVALID_VALUE')
+
+    def test_rows_that_cannot_be_built_fail_alone(self, login_required_mock):
+        def build(zuora, row):
+            if row == 'broken':
+                raise ValueError('no account')
+            return subscribe_request(zuora, row)
+        outcomes = list(BulkSubscribe(self.client, build=build).run([row('a'), 'broken', row('b')]))
+        self.assertEqual([o.success for o in outcomes], [True, False, True])
+        self.assertIsInstance(outcomes[1].errors[0], ValueError)
+        self.assertEqual(self.subscribe.call_count, 1)
+
+    def test_failed_call(self, login_required_mock):
+        self.client.retry = None
+        self.subscribe.side_effect = ZuoraError('unavailable')
+        outcomes = list(BulkSubscribe(self.client).run([row('a'), row('b')]))
+        self.assertEqual([o.success for o in outcomes], [False, False])
+        self.assertIsInstance(outcomes[0].errors[0], ZuoraError)
+
+        outcomes = list(BulkSubscribe(self.client).run([row('a%s' % i) for i in range(15)]))
+        self.assertEqual([o.success for o in outcomes], [False] * 15)
+        self.assertIsInstance(outcomes[14].errors[0], ZuoraError)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from os import path
+import shutil
+import tempfile
+import unittest
+import logging
+from mock import Mock
+
+from zuora_python_toolkit.records import row_class
+from zuora_python_toolkit.sync import IncrementalSync, ShelfStore, SyncState
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+Account = row_class('Account', ('Id', 'Name', 'UpdatedDate'))
+
+
+class SyncStateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = path.join(self.directory, 'state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_watermarks_are_saved(self):
+        state = SyncState(self.filename)
+        self.assertIsNone(state.watermark('Account'))
+        state.set_watermark('Account', datetime(2015, 1, 2, 3, 4, 5))
+        self.assertEqual(SyncState(self.filename).watermark('Account'), datetime(2015, 1, 2, 3, 4, 5))
+        state.reset('Account')
+        self.assertIsNone(SyncState(self.filename).watermark('Account'))
+
+
+class IncrementalSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = SyncState(path.join(self.directory, 'state.json'))
+        self.store = ShelfStore(path.join(self.directory, 'store'))
+        self.zuora = Mock()
+        self.sync = IncrementalSync(self.zuora, self.state, self.store, overlap_seconds=60, batch_size=2)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_first_sync_fetches_everything(self):
+        self.zuora.iter_query.return_value = iter([
+            Account(('1', 'Acme', datetime(2015, 1, 1))),
+            Account(('2', 'Initech', datetime(2015, 1, 3))),
+            Account(('3', 'Globex', datetime(2015, 1, 2))),
+        ])
+        result = self.sync.sync('Account', ['Name'])
+        query = self.zuora.iter_query.call_args[0][0]
+        self.assertNotIn('WHERE', query)
+        self.assertIn('UpdatedDate', query)
+        self.assertEqual((result.fetched, result.changed), (3, 3))
+        self.assertEqual(result.watermark, datetime(2015, 1, 3))
+        self.assertEqual(self.state.watermark('Account'), datetime(2015, 1, 3))
+        self.assertEqual(self.store.get('Account', '2')['Name'], 'Initech')
+
+    def test_next_sync_overlaps_and_dedupes(self):
+        self.state.set_watermark('Account', datetime(2015, 1, 3))
+        self.store.upsert('Account', [Account(('2', 'Initech', datetime(2015, 1, 3)))])
+        self.zuora.iter_query.return_value = iter([
+            Account(('2', 'Initech', datetime(2015, 1, 3))),
+            Account(('1', 'Acme Corp', datetime(2015, 1, 4))),
+        ])
+        result = self.sync.sync('Account', ['Name'], filters="Status = 'Active'")
+        query = self.zuora.iter_query.call_args[0][0]
+        self.assertIn("WHERE UpdatedDate >= '2015-01-02T23:59:00", query)
+        self.assertIn("AND Status = 'Active'", query)
+        self.assertEqual((result.fetched, result.changed), (2, 1))
+        self.assertEqual(self.store.count('Account'), 2)
+        self.assertEqual(self.state.watermark('Account'), datetime(2015, 1, 4))
+
+    def test_older_records_do_not_replace_newer(self):
+        self.store.upsert('Account', [Account(('1', 'New', datetime(2015, 1, 4)))])
+        self.assertEqual(self.store.upsert('Account', [Account(('1', 'Old', datetime(2015, 1, 3)))]), 0)
+        self.assertEqual(self.store.get('Account', '1')['Name'], 'New')
+
+    def test_failed_sync_keeps_watermark(self):
+        self.state.set_watermark('Account', datetime(2015, 1, 3))
+
+        def records():
+            yield Account(('1', 'Acme', datetime(2015, 1, 4)))
+            raise IOError("connection reset")
+        self.zuora.iter_query.return_value = records()
+        results = self.sync.sync_many({'Account': ['Name']})
+        self.assertIsInstance(results['Account'], IOError)
+        self.assertEqual(self.state.watermark('Account'), datetime(2015, 1, 3))
+
+if __name__ == "__main__":
+    unittest.main()
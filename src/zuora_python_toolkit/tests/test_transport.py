@@ -0,0 +1,113 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+import copy
+import time
+import unittest
+import logging
+from mock import Mock
+
+import gevent
+import gevent.monkey
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from suds.transport import Request, TransportError
+
+from zuora_python_toolkit.transport import CooperativeHTTPAdapter, PooledTransport, pooled_adapter, pooled_session
+from zuora_python_toolkit.tests.test_base import ZuoraBaseTestCase
+
+logger = logging.getLogger("zuora_python_toolkit")
+
+
+def http_response(status_code=200, content='<soapenv:Envelope/>'):
+    response = Mock()
+    response.status_code = status_code
+    response.reason = 'reason'
+    response.headers = {'content-type': 'text/xml'}
+    response.content = content
+    return response
+
+
+class PooledTransportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.session = Mock()
+        self.transport = PooledTransport(session=self.session)
+
+    def test_pooled_sessions_share_connections_not_cookies(self):
+        first, second = pooled_session(4), pooled_session(4)
+        self.assertIsNot(first, second)
+        self.assertIs(first.get_adapter('https://'), second.get_adapter('https://'))
+        self.assertIs(first.get_adapter('https://'), pooled_adapter(4))
+        self.assertIsNot(pooled_adapter(4), pooled_adapter(8))
+        first.cookies.set('ZSession', 'abc')
+        self.assertEqual(len(second.cookies), 0)
+        self.assertEqual(first.headers['Accept-Encoding'], 'gzip, deflate')
+
+    def test_clone_has_its_own_cookies(self):
+        transport = PooledTransport(pool_size=4)
+        clone = copy.deepcopy(transport)
+        self.assertIsNot(clone.session, transport.session)
+        self.assertIs(clone.session.get_adapter('https://'), pooled_adapter(4))
+
+    def test_send(self):
+        self.session.post.return_value = http_response()
+        reply = self.transport.send(Request('https://apisandbox.zuora.com/apps/services/a/63.0', '<xml/>'))
+        self.assertEqual(reply.code, 200)
+        self.assertEqual(reply.message, '<soapenv:Envelope/>')
+        args, kwargs = self.session.post.call_args
+        self.assertEqual(args[0], 'https://apisandbox.zuora.com/apps/services/a/63.0')
+        self.assertEqual(kwargs['data'], '<xml/>')
+        self.assertEqual(kwargs['timeout'], 90)
+
+    def test_send_fault(self):
+        self.session.post.return_value = http_response(500, '<soapenv:Fault/>')
+        try:
+            self.transport.send(Request('https://apisandbox.zuora.com', '<xml/>'))
+            self.fail("TransportError not raised")
+        except TransportError as e:
+            self.assertEqual(e.httpcode, 500)
+            self.assertEqual(e.fp.read(), '<soapenv:Fault/>')
+
+    def test_send_proxy(self):
+        self.session.post.return_value = http_response()
+        self.transport.options.proxy = {'https': 'proxy.example.com:3128'}
+        self.transport.send(Request('https://apisandbox.zuora.com', '<xml/>'))
+        self.assertEqual(self.session.post.call_args[1]['proxies'], {'https': 'http://proxy.example.com:3128'})
+
+
+class PooledTransportConcurrencyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = WSGIServer(('127.0.0.1', 0), self.application, log=None)
+        self.server.start()
+        self.url = 'http://127.0.0.1:%s/apps/services/a/63.0' % self.server.server_port
+        self.transport = PooledTransport(pool_size=4)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def application(self, environ, start_response):
+        body = environ['wsgi.input'].read()
+        gevent.sleep(0.2)
+        start_response('200 OK', [('Content-Type', 'text/xml'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    def test_calls_from_greenlets_overlap(self):
+        self.assertFalse(gevent.monkey.is_module_patched('socket'))
+        self.assertIsInstance(pooled_adapter(4), CooperativeHTTPAdapter)
+        started = time.time()
+        replies = Pool(4).map(lambda i: self.transport.send(Request(self.url, '<call%s/>' % i)), range(4))
+        self.assertLess(time.time() - started, 0.6)
+        self.assertEqual([reply.message for reply in replies], ['<call0/>', '<call1/>', '<call2/>', '<call3/>'])
+
+
+class ZuoraTransportTestCase(ZuoraBaseTestCase):
+
+    def test_default_transport_is_pooled(self):
+        self.assertIsInstance(self.client.client.options.transport, PooledTransport)
+        self.assertIs(self.client.http_session, self.client.transport.session)
+        self.assertIs(self.client.http_session.get_adapter('https://'), pooled_adapter())
+        self.assertEqual(self.client.client.options.headers['Accept-Encoding'], 'gzip, deflate')
+
+if __name__ == "__main__":
+    unittest.main()
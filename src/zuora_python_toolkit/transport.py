@@ -0,0 +1,345 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+from StringIO import StringIO
+from urlparse import urlparse
+import errno
+import httplib
+import logging
+import zlib
+
+import gevent.socket
+import gevent.ssl
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool, VerifiedHTTPSConnection
+from requests.packages.urllib3.packages.ssl_match_hostname import match_hostname
+from requests.packages.urllib3.poolmanager import SSL_KEYWORDS, PoolManager
+from requests.packages.urllib3.util import assert_fingerprint, resolve_cert_reqs, resolve_ssl_version
+
+from suds.properties import Unskin
+from suds.transport import Reply, TransportError
+from suds.transport.http import HttpAuthenticated
+
+from zuora_python_toolkit.metrics import NULL
+
+logger = logging.getLogger(__package__)
+
+DEFAULT_POOL_SIZE = 10
+
+# Errors writing to a keep-alive connection the server has already closed
+STALE_CONNECTION_ERRNOS = (errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED)
+
+# requests adapters (connection pools) shared by every client in the process, keyed on pool size
+_adapters = {}
+
+
+def pooled_adapter(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Return the process-wide CooperativeHTTPAdapter for pool_size, which keeps a pool of up to
+    pool_size keep-alive connections per host.
+    """
+    adapter = _adapters.get(pool_size)
+    if adapter is None:
+        adapter = _adapters[pool_size] = CooperativeHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    return adapter
+
+
+def pooled_session(pool_size=DEFAULT_POOL_SIZE, adapter=None):
+    """
+    Return a new requests Session sending through the process-wide connection pool.
+
+    Every client talking to the same Zuora endpoint reuses the same TCP/TLS connections, but
+    each Session has its own cookies, so clients (e.g. the tenants of a ClientPool) never see
+    each other's.
+
+    :param adapter: HTTPAdapter to send through, defaults to pooled_adapter(pool_size)
+    """
+    if adapter is None:
+        adapter = pooled_adapter(pool_size)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+
+class PooledTransport(HttpAuthenticated):
+    """
+    A suds transport that sends SOAP requests through a pooled, keep-alive requests Session.
+
+    The pooled_session connects on gevent sockets (see CooperativeHTTPAdapter), so calls made
+    from several greenlets - batches, prefetched pages, export downloads - overlap without the
+    socket module being monkey patched.  A Session on a plain HTTPAdapter blocks the whole
+    process on each call unless gevent.monkey.patch_all() was called first.
+
+    gzip and deflate responses are decoded by requests.  Documents (the WSDL and its imports)
+    are still opened with urllib2 so that file:// locations work.
+    """
+
+    # metrics.Instrumentation timing the network phase, set by the client
+    instrumentation = NULL
+
+    def __init__(self, session=None, pool_size=DEFAULT_POOL_SIZE, **kwargs):
+        """
+        :param session: requests Session to send through (defaults to a pooled_session)
+        :param pool_size: Connections kept per host when using a pooled_session
+        """
+        HttpAuthenticated.__init__(self, **kwargs)
+        if session is None:
+            session = pooled_session(pool_size)
+        self.session = session
+
+    def send(self, request):
+        self.addcredentials(request)
+        proxies = dict((protocol, host if '://' in host else 'http://%s' % host)
+                       for protocol, host in self.options.proxy.items())
+        logger.debug('sending:\n%s', request)
+        with self.instrumentation.timer('network'):
+            r = self.session.post(request.url, data=request.message, headers=request.headers,
+                                  timeout=self.options.timeout, proxies=proxies or None)
+        if r.status_code in (202, 204):
+            return None
+        if r.status_code >= 300:
+            raise TransportError(r.reason, r.status_code, StringIO(r.content))
+        result = Reply(200, r.headers, r.content)
+        logger.debug('received:\n%s', result)
+        return result
+
+    def __deepcopy__(self, memo={}):
+        # Clones share the connection pool but not the cookies
+        clone = self.__class__(session=pooled_session(adapter=self.session.get_adapter('https://')))
+        Unskin(clone.options).update(Unskin(self.options))
+        clone.instrumentation = self.instrumentation
+        return clone
+
+
+class CooperativeHTTPConnection(httplib.HTTPConnection):
+    """
+    An httplib connection on a gevent socket, so it yields to other greenlets without monkey patching.
+    """
+
+    def connect(self):
+        self.sock = gevent.socket.create_connection((self.host, self.port), self.timeout)
+
+
+class CooperativeHTTPSConnection(httplib.HTTPSConnection):
+
+    def connect(self):
+        sock = gevent.socket.create_connection((self.host, self.port), self.timeout)
+        self.sock = gevent.ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+
+
+class CooperativeVerifiedHTTPSConnection(VerifiedHTTPSConnection):
+    """
+    urllib3's certificate-verifying HTTPS connection on a gevent socket
+    """
+
+    def connect(self):
+        sock = gevent.socket.create_connection((self.host, self.port), self.timeout)
+        cert_reqs = resolve_cert_reqs(self.cert_reqs)
+        context = gevent.ssl.SSLContext(resolve_ssl_version(self.ssl_version))
+        context.verify_mode = cert_reqs
+        if self.ca_certs:
+            context.load_verify_locations(self.ca_certs)
+        if self.cert_file:
+            context.load_cert_chain(self.cert_file, self.key_file)
+        self.sock = context.wrap_socket(sock, server_hostname=self.host)
+        if cert_reqs != gevent.ssl.CERT_NONE:
+            if self.assert_fingerprint:
+                assert_fingerprint(self.sock.getpeercert(binary_form=True), self.assert_fingerprint)
+            else:
+                match_hostname(self.sock.getpeercert(), self.assert_hostname or self.host)
+
+
+class CooperativeHTTPConnectionPool(HTTPConnectionPool):
+
+    def _new_conn(self):
+        self.num_connections += 1
+        logger.debug("Starting new HTTP connection (%d): %s", self.num_connections, self.host)
+        return CooperativeHTTPConnection(host=self.host, port=self.port, strict=self.strict)
+
+
+class CooperativeHTTPSConnectionPool(HTTPSConnectionPool):
+
+    def _new_conn(self):
+        self.num_connections += 1
+        logger.debug("Starting new HTTPS connection (%d): %s", self.num_connections, self.host)
+        connection = CooperativeVerifiedHTTPSConnection(host=self.host, port=self.port, strict=self.strict)
+        connection.set_cert(key_file=self.key_file, cert_file=self.cert_file, cert_reqs=self.cert_reqs,
+                            ca_certs=self.ca_certs, assert_hostname=self.assert_hostname,
+                            assert_fingerprint=self.assert_fingerprint)
+        connection.ssl_version = self.ssl_version
+        return connection
+
+
+class CooperativePoolManager(PoolManager):
+
+    pool_classes = {
+        'http': CooperativeHTTPConnectionPool,
+        'https': CooperativeHTTPSConnectionPool,
+    }
+
+    def _new_pool(self, scheme, host, port):
+        kwargs = self.connection_pool_kw
+        if scheme == 'http':
+            kwargs = dict((k, v) for k, v in kwargs.items() if k not in SSL_KEYWORDS)
+        return self.pool_classes[scheme](host, port, **kwargs)
+
+
+class CooperativeHTTPAdapter(HTTPAdapter):
+    """
+    A requests HTTPAdapter whose connections (direct or to a proxy) are on gevent sockets, so
+    a request only blocks the greenlet that made it, whether or not the socket module is
+    monkey patched.
+    """
+
+    def init_poolmanager(self, connections, maxsize, block=False):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = CooperativePoolManager(num_pools=connections, maxsize=maxsize, block=block)
+
+
+class CooperativeTransport(HttpAuthenticated):
+    """
+    A suds transport on gevent sockets with its own keep-alive connection pool.
+
+    Like PooledTransport it does not need the socket module to be monkey patched for calls to
+    run concurrently, but it does not go through requests at all.  Proxies are not supported.
+    """
+
+    # metrics.Instrumentation timing the network phase, set by the client
+    instrumentation = NULL
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, **kwargs):
+        """
+        :param pool_size: Idle connections kept per host
+        """
+        HttpAuthenticated.__init__(self, **kwargs)
+        self.pool_size = pool_size
+        self.__idle = {}
+
+    def connection(self, scheme, netloc):
+        """
+        Return an idle connection to netloc if there is one, else a new one, and whether it was reused
+        """
+        idle = self.__idle.get((scheme, netloc))
+        if idle:
+            return idle.pop(), True
+        return self.new_connection(scheme, netloc), False
+
+    def new_connection(self, scheme, netloc):
+        if scheme == 'https':
+            return CooperativeHTTPSConnection(netloc, timeout=self.options.timeout)
+        return CooperativeHTTPConnection(netloc, timeout=self.options.timeout)
+
+    def release(self, scheme, netloc, connection):
+        idle = self.__idle.setdefault((scheme, netloc), [])
+        if len(idle) < self.pool_size:
+            idle.append(connection)
+        else:
+            connection.close()
+
+    def send(self, request):
+        self.addcredentials(request)
+        url = urlparse(request.url)
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        headers = dict(request.headers)
+        headers.setdefault('Accept-Encoding', 'gzip, deflate')
+
+        logger.debug('sending:\n%s', request)
+        with self.instrumentation.timer('network'):
+            connection, response = self.post(url, path, request.message, headers)
+            try:
+                content = decode_content(response.read(), response.getheader('content-encoding', ''))
+            except Exception:
+                connection.close()
+                raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.release(url.scheme, url.netloc, connection)
+
+        if response.status in (202, 204):
+            return None
+        if response.status >= 300:
+            raise TransportError(response.reason, response.status, StringIO(content))
+        result = Reply(200, dict(response.getheaders()), content)
+        logger.debug('received:\n%s', result)
+        return result
+
+    def post(self, url, path, message, headers):
+        """
+        POST on an idle connection (or a new one).  If the server had already closed the idle
+        connection, so the request never reached it, the POST is sent once more on a new
+        connection.  Nothing is sent again after a timeout or once any of a response was read,
+        as the request may have been applied.
+        """
+        connection, reused = self.connection(url.scheme, url.netloc)
+        try:
+            connection.request('POST', path, message, headers)
+        except (httplib.HTTPException, gevent.socket.error) as e:
+            connection.close()
+            if not (reused and closed_before_request(e)):
+                raise
+        else:
+            try:
+                return connection, connection.getresponse()
+            except httplib.BadStatusLine as e:
+                connection.close()
+                if not (reused and closed_before_request(e)):
+                    raise
+            except Exception:
+                connection.close()
+                raise
+        # The server closed an idle keep-alive connection, try once on a new one
+        self.instrumentation.increment('retries', reason='stale_connection')
+        connection = self.new_connection(url.scheme, url.netloc)
+        connection.request('POST', path, message, headers)
+        return connection, connection.getresponse()
+
+    def close(self):
+        """
+        Close every idle connection
+        """
+        for idle in self.__idle.values():
+            for connection in idle:
+                connection.close()
+        self.__idle.clear()
+
+    def __deepcopy__(self, memo={}):
+        clone = self.__class__(pool_size=self.pool_size)
+        Unskin(clone.options).update(Unskin(self.options))
+        clone.instrumentation = self.instrumentation
+        return clone
+
+
+def closed_before_request(exception):
+    """
+    Did sending on a keep-alive connection fail because the server had closed it, so the
+    request was never received?  A connection reset or broken pipe while writing the request,
+    or a response with nothing in it, is; a timeout or a malformed response is not.
+    """
+    if isinstance(exception, httplib.BadStatusLine):
+        line = exception.line or ''
+        return line in ("''", '') or line.startswith('No status line received')
+    if isinstance(exception, gevent.socket.timeout):
+        return False
+    return isinstance(exception, gevent.socket.error) and exception.errno in STALE_CONNECTION_ERRNOS
+
+
+def decode_content(content, encoding):
+    """
+    Decode a gzip or deflate response body
+    """
+    encoding = encoding.lower()
+    if encoding == 'gzip':
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
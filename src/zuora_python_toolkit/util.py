@@ -1,18 +1,31 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
 from os import path
+import re
 from datetime import datetime, timedelta
 import logging
 
-from suds.client import Client
-from suds.cache import FileCache
-from suds.xsd.doctor import Import, ImportDoctor
+from zuora_python_toolkit.lazy import lazy_import
+
+sax_date = lazy_import('suds.sax.date')
+
+# A query's select list and object, and its conditions if it has any
+QUERY_PATTERN = re.compile(r'^\s*(SELECT\s+.+?\s+FROM\s+\w+)(?:\s+WHERE\s+(.+?))?\s*$', re.I | re.S)
 
 
 class ZuoraError(Exception):
     pass
 
 
+def wsdl_url(wsdl):
+    """
+    Suds can only accept WSDL locations with a protocol prepended
+    """
+    if '://' in wsdl:
+        return wsdl
+    return 'file:///%s' % path.abspath(wsdl)
+
+
 def generate_select_list(field_list=[]):
     """
     Generate the select list based on the fields provided.  Automatically inserts Id.
@@ -41,15 +54,170 @@ def generate_search_conditions(field_name='Id', field_is_string=True, operator='
 
     Ex ZOQL: SELECT {select_list} FROM {z_object_type} WHERE {search_conditions}
     """
-    search_condition = ""
     where = "{column_name}="
     if field_is_string:
         where += '\'{value}\''
     else:
         where += "{value}"
 
+    separator = " {operator} ".format(operator=operator)
+    return separator.join([where.format(column_name=field_name, value=value) for value in values])
+
+
+def shard_values(values, max_count=200, max_length=None, field_name='Id', field_is_string=True, operator='OR'):
+    """
+    Split values into shards whose search conditions (see generate_search_conditions) have at most
+    max_count values and, if given, at most max_length characters.
+
+    :return: generator of lists of values
+    """
+    quotes = 2 if field_is_string else 0
+    separator_length = len(operator) + 2
+    shard = []
+    length = 0
     for value in values:
-        if search_condition != "":
-            search_condition += " {operator} ".format(operator=operator)
-        search_condition += where.format(column_name=field_name, value=value)
-    return search_condition
\ No newline at end of file
+        condition_length = len(field_name) + 1 + len(str(value)) + quotes
+        added_length = condition_length + (separator_length if shard else 0)
+        if shard and (len(shard) >= max_count or (max_length is not None and length + added_length > max_length)):
+            yield shard
+            shard = []
+            length = 0
+            added_length = condition_length
+        shard.append(value)
+        length += added_length
+    if shard:
+        yield shard
+
+
+def zoql_datetime(value):
+    """
+    A datetime as a ZOQL literal, with the local UTC offset (suds returns local datetimes)
+    """
+    return "'%s'" % sax_date.DateTime(value)
+
+
+def time_windows(start, end, count, bounded=False):
+    """
+    Split the time from start to end into count windows of (about) the same length, on whole seconds.
+
+    Unless bounded, the first window has no lower bound and the last no upper bound (None), so
+    together the windows cover all time without overlapping.
+
+    :return: list of (lower, upper) datetimes, lower inclusive and upper exclusive
+    """
+    start = start.replace(microsecond=0)
+    seconds = max(int((end - start).total_seconds()), 0)
+    count = max(min(count, seconds), 1)
+    bounds = unique([start + timedelta(seconds=seconds * i // count) for i in range(1, count)])
+    first, last = (start, start + timedelta(seconds=seconds)) if bounded else (None, None)
+    return zip([first] + bounds, bounds + [last])
+
+
+def split_window(lower, upper):
+    """
+    Split a bounded window in two halves on whole seconds, or return it alone if it is too short
+    """
+    if lower is None or upper is None or (upper - lower).total_seconds() < 2:
+        return [(lower, upper)]
+    middle = lower + timedelta(seconds=int((upper - lower).total_seconds()) // 2)
+    return [(lower, middle), (middle, upper)]
+
+
+def window_query(query_string, field, lower=None, upper=None):
+    """
+    Limit a query to records whose field is in the window from lower (inclusive) to upper (exclusive).
+
+    ZOQL has no parentheses, so queries whose conditions use OR cannot be limited.
+    """
+    match = QUERY_PATTERN.match(query_string)
+    if match is None:
+        raise ZuoraError("Not a ZOQL query: %s" % query_string)
+    select, conditions = match.groups()
+    conditions = [conditions] if conditions else []
+    if conditions and re.search(r'\bOR\b', conditions[0], re.I):
+        raise ZuoraError("Queries with OR conditions cannot be partitioned: %s" % query_string)
+    if lower is not None:
+        conditions.append("%s >= %s" % (field, zoql_datetime(lower)))
+    if upper is not None:
+        conditions.append("%s < %s" % (field, zoql_datetime(upper)))
+    if not conditions:
+        return select
+    return "%s WHERE %s" % (select, " AND ".join(conditions))
+
+
+def unique(values):
+    """
+    Return values without duplicates, keeping the first occurrence of each.
+    """
+    seen = set()
+    return [value for value in values if not (value in seen or seen.add(value))]
+
+
+def result_succeeded(result):
+    """
+    Check a SaveResult, DeleteResult or AmendResult for success.  DeleteResult uses lower case field names.
+
+    :param result: A result object returned by create, update, delete or amend
+    :return: True if Zuora reported success
+    """
+    if result is None:
+        return False
+    success = getattr(result, 'Success', None)
+    if success is None:
+        success = getattr(result, 'success', False)
+    return bool(success)
+
+
+def result_errors(result):
+    """
+    Return the Errors reported on a SaveResult, DeleteResult or AmendResult as a list.
+
+    :param result: A result object returned by create, update, delete or amend
+    :return: list of Error objects
+    """
+    errors = getattr(result, 'Errors', None)
+    if errors is None:
+        errors = getattr(result, 'errors', None)
+    if errors is None:
+        return []
+    if not isinstance(errors, (list, tuple)):
+        return [errors]
+    return list(errors)
+
+
+def query_records(result):
+    """
+    Return the records of a QueryResult as a list.  Suds returns a single record unwrapped
+    and leaves the attribute off entirely when the page is empty.
+
+    :param result: QueryResult returned by query or queryMore
+    :return: list of records
+    """
+    records = getattr(result, 'records', None)
+    if records is None:
+        return []
+    if not isinstance(records, (list, tuple)):
+        return [records]
+    return records
+
+
+def fault_code(exception):
+    """
+    Find the Zuora FaultCode (e.g. INVALID_SESSION) in the detail of a suds WebFault (or an
+    exception built like one, such as SoapCodec's faults).  The message is never searched for
+    a code: an exception without a structured fault has no code.
+
+    :param exception: The exception raised by a SOAP call
+    :return: The fault code, or None if there is not one
+    """
+    fault = getattr(exception, 'fault', None)
+    detail = getattr(fault, 'detail', None)
+    if detail is not None:
+        try:
+            for name, value in detail:
+                code = getattr(value, 'FaultCode', None)
+                if code:
+                    return str(code)
+        except TypeError:
+            pass
+    return None